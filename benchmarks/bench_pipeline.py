@@ -0,0 +1,167 @@
+import sys
+import json
+import time
+import pathlib
+import argparse
+import resource
+import tempfile
+import tracemalloc
+import urllib.request
+import multiprocessing
+
+# run from a source checkout without installing
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+
+from benchmarks import mock_dashboard
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+offline throughput benchmark for async_orgsnmp, async_getorgnetworks, async_networksnmp and the pipeline
+
+each estate size runs against its own local mock dashboard server (see mock_dashboard.py) in a fresh process so
+peak memory is measured per size.  reports wall time, networks/sec, peak RSS and (with --tracemalloc) the peak
+python heap, plus the number of requests, 429s and unsupported-network 400s the server handled
+
+USE:
+python benchmarks/bench_pipeline.py --networks 100 1000 10000 100000
+python benchmarks/bench_pipeline.py --stage networksnmp --networks 10000 --latency 0.1 --org-rate 10
+python benchmarks/bench_pipeline.py --networks 10000 --collapse-templates --overridden-every 20
+'''
+
+STAGES = ['pipeline', 'orgsnmp', 'orgnetworks', 'networksnmp']
+
+# the SDK validates the key format, the mock server ignores it
+BENCH_API_KEY = '0' * 40
+
+
+def _server_stats(base_url):
+    with urllib.request.urlopen(base_url.rsplit('/api/v1', 1)[0] + '/_stats') as response:
+        return json.loads(response.read())
+
+
+def _run_stage(stage, base_url, organizations, output_dir, collapse_templates=False):
+    ''' runs one stage against the mock server, returns the number of networks it covered '''
+    from merakisnmp import templates
+    from merakisnmp import writers
+    from merakisnmp.async_code import async_orgsnmp
+    from merakisnmp.async_code import async_getorgnetworks
+    from merakisnmp.async_code import async_networksnmp
+    from merakisnmp.async_code import async_pipeline
+
+    if stage == 'orgsnmp':
+        return len(async_orgsnmp.async_get_snmp(BENCH_API_KEY, organizations, base_url=base_url))
+
+    if stage == 'orgnetworks':
+        return len(async_getorgnetworks.asyncget_networks(BENCH_API_KEY, organizations, base_url=base_url))
+
+    if stage == 'networksnmp':
+        # networks are listed first (not timed) so only getNetworkSnmp is measured
+        networks = async_getorgnetworks.asyncget_networks(BENCH_API_KEY, organizations, base_url=base_url)
+        start = time.perf_counter()
+        async_networksnmp.async_get_snmp(BENCH_API_KEY, networks, base_url=base_url)
+        return len(networks), time.perf_counter() - start
+
+    with writers.ResultWriter(output_dir, 'bench', 'json') as org_writer, \
+            writers.ResultWriter(output_dir + '/networks', 'bench', 'json') as network_writer:
+        async_pipeline.async_get_snmp(
+            BENCH_API_KEY, organizations, get_networks=True, base_url=base_url,
+            write_org=org_writer.write, write_network=network_writer.write,
+            templates=templates.TemplateCollapse() if collapse_templates else None)
+        return network_writer.count
+
+
+def _bench_process(stage, base_url, use_tracemalloc, collapse_templates, results):
+    ''' child process for one benchmark run so ru_maxrss is not shared between sizes '''
+    with urllib.request.urlopen(base_url + '/organizations') as response:
+        organizations = json.loads(response.read())
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if use_tracemalloc:
+        tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        covered = _run_stage(stage, base_url, organizations, output_dir, collapse_templates)
+        wall = time.perf_counter() - start
+
+    if isinstance(covered, tuple):
+        covered, wall = covered
+
+    results.put({
+        'networks': covered,
+        'wall_seconds': wall,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rss_growth_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        'peak_heap_mb': tracemalloc.get_traced_memory()[1] / 2 ** 20 if use_tracemalloc else None,
+    })
+
+
+def bench(stage, networks, args):
+    context = multiprocessing.get_context('spawn')
+    ready = context.Queue()
+    estate = mock_dashboard.Estate(
+        orgs=args.orgs, networks=networks, largest_share=args.largest_share, unsupported_every=args.unsupported_every,
+        bound_every=args.bound_every, overridden_every=args.overridden_every)
+    server = context.Process(
+        target=mock_dashboard.serve, args=(estate,), daemon=True,
+        kwargs={'ready': ready, 'latency': args.latency, 'jitter': args.jitter,
+                'org_rate': args.org_rate, 'org_burst': args.org_burst, 'retry_after': args.retry_after})
+    server.start()
+
+    try:
+        base_url = ready.get(timeout=60)
+        results = context.Queue()
+        client = context.Process(target=_bench_process, args=(stage, base_url, args.tracemalloc, args.collapse_templates, results))
+        client.start()
+        result = results.get()
+        client.join()
+        result.update(_server_stats(base_url))
+    finally:
+        server.terminate()
+        server.join()
+
+    result['networks_per_sec'] = result['networks'] / result['wall_seconds'] if result['wall_seconds'] else 0
+    return {'stage': stage, 'estate_networks': networks, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='offline merakisnmp throughput benchmark against a mock dashboard API')
+    parser.add_argument('--stage', choices=STAGES, default='pipeline')
+    parser.add_argument('--networks', type=int, nargs='+', default=[100, 1000, 10000], help='estate sizes to run')
+    parser.add_argument('--orgs', type=int, default=20)
+    parser.add_argument('--largest-share', type=float, default=0.5, help='share of networks in the largest org')
+    parser.add_argument('--unsupported-every', type=int, default=10, help='every Nth network returns the "does not support SNMP" 400')
+    parser.add_argument('--bound-every', type=int, default=2, help='every Nth network is bound to a config template (0 binds none)')
+    parser.add_argument('--overridden-every', type=int, default=0, help='every Nth bound network overrides its template\'s snmp settings')
+    parser.add_argument('--collapse-templates', action='store_true', help='run the pipeline stage with --collapse-templates')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--org-rate', type=float, default=0, help='per org requests/sec before 429s are returned (0 disables throttling)')
+    parser.add_argument('--org-burst', type=float, default=10)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the peak python heap (slower)')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to a JSON file')
+    args = parser.parse_args()
+
+    results = []
+    print(f'{"stage":<12} {"networks":>9} {"wall s":>9} {"net/s":>9} {"peak MB":>9} {"requests":>9} {"429s":>7} {"400s":>7}')
+    for networks in args.networks:
+        result = bench(args.stage, networks, args)
+        results.append(result)
+        print(
+            f'{result["stage"]:<12} {result["estate_networks"]:>9} {result["wall_seconds"]:>9.2f} '
+            f'{result["networks_per_sec"]:>9.1f} {result["peak_rss_mb"]:>9.1f} {result["requests"]:>9} '
+            f'{result["throttled"]:>7} {result["unsupported"]:>7}'
+        )
+
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            outfile.write(json.dumps(results, indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import sys
+import json
+import time
+import pathlib
+import argparse
+import statistics
+import subprocess
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+cold start benchmark for the merakisnmp entry point
+
+times `import merakisnmp.cli` and `merakisnmp --help` in fresh interpreters and checks that the SDK (and the other
+modules the CLI defers until a subcommand calls the API) were not imported.  exits non zero if a deferred module is
+imported at startup or, with --max-ms, if the median --help time is over budget, so it can run in CI
+
+USE:
+python benchmarks/bench_startup.py
+python benchmarks/bench_startup.py --runs 20 --max-ms 250
+'''
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# modules that must not be imported until a subcommand needs them
+DEFERRED_MODULES = ['meraki', 'meraki.aio', 'tqdm', 'merakisnmp.async_code.async_pipeline', 'merakisnmp.sharding', 'merakisnmp.watch']
+
+IMPORT_CHECK = (
+    'import sys, json, merakisnmp.cli; '
+    f'print(json.dumps([name for name in {DEFERRED_MODULES!r} if name in sys.modules]))'
+)
+
+CASES = {
+    'import': [sys.executable, '-c', 'import merakisnmp.cli'],
+    '--help': [sys.executable, '-m', 'merakisnmp.cli', '--help'],
+}
+
+
+def _time(command, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='merakisnmp CLI cold start benchmark')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, help='fail if the median --help time is above this many milliseconds')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to a JSON file')
+    args = parser.parse_args()
+
+    # a warm up run so the timings do not include writing bytecode
+    subprocess.run(CASES['--help'], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+
+    results = {}
+    print(f'{"case":<8} {"min ms":>9} {"median ms":>10} {"max ms":>9}')
+    for case, command in CASES.items():
+        timings = _time(command, args.runs)
+        results[case] = {'min_ms': min(timings), 'median_ms': statistics.median(timings), 'max_ms': max(timings)}
+        print(f'{case:<8} {min(timings):>9.1f} {statistics.median(timings):>10.1f} {max(timings):>9.1f}')
+
+    imported = json.loads(subprocess.run(
+        [sys.executable, '-c', IMPORT_CHECK], cwd=ROOT, check=True, capture_output=True, text=True).stdout)
+    results['deferred_modules_imported'] = imported
+
+    if args.json:
+        with open(args.json, 'w') as outfile:
+            outfile.write(json.dumps(results, indent=4))
+
+    failed = False
+    if imported:
+        print(f'FAIL: imported at startup: {", ".join(imported)}')
+        failed = True
+    if args.max_ms and results['--help']['median_ms'] > args.max_ms:
+        print(f'FAIL: median --help {results["--help"]["median_ms"]:.1f}ms is over the {args.max_ms:g}ms budget')
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import json
+import time
+import random
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+local stand-in for the dashboard API endpoints merakisnmp calls, used by the offline benchmarks
+
+serves a synthetic estate of orgs and networks under /api/v1:
+    GET /organizations
+    GET /organizations/{organizationId}/snmp
+    GET /organizations/{organizationId}/networks     (cursor pagination with perPage/startingAfter and a Link header)
+    GET /networks/{networkId}/snmp                   (400 "does not support SNMP" for a share of networks)
+    GET /_stats                                      (request, 429 and 400 counters for the benchmark report)
+
+every response is delayed by the configured latency (+/- jitter) and each org has a token bucket, requests over
+the org's rate get a 429 with a Retry-After header like the real dashboard.  networks bound to a config template
+answer with their template's community string unless they override it, so --collapse-templates can be exercised
+'''
+
+UNSUPPORTED_ERROR = {'errors': ['This network does not support SNMP configuration']}
+
+PRODUCT_TYPES = [
+    ['appliance', 'switch', 'wireless'],
+    ['appliance'],
+    ['switch'],
+    ['wireless'],
+    ['cellularGateway'],
+]
+
+
+class Estate:
+    '''
+    synthetic orgs and networks
+
+    networks are spread over the orgs with org 0 taking `largest_share` of them (the long tail of a real MSP estate),
+    every `unsupported_every`th network does not support snmp.  every `bound_every`th network is bound to one of its
+    org's `templates` config templates (and has the template's productTypes), every `overridden_every`th bound
+    network has its own snmp settings instead of its template's
+    '''
+
+    def __init__(self, orgs=10, networks=1000, largest_share=0.5, unsupported_every=10, bound_every=2, templates=2,
+                 overridden_every=0):
+        self.orgs = [
+            {'id': str(100000 + org), 'name': f'Bench Org {org}', 'url': f'https://example.invalid/o/{org}'}
+            for org in range(orgs)
+        ]
+
+        largest = int(networks * largest_share) if orgs > 1 else networks
+        rest = networks - largest
+        counts = [largest] + [rest // (orgs - 1) + (1 if org < rest % (orgs - 1) else 0) for org in range(orgs - 1)]
+
+        self.networks = {}
+        self.unsupported = set()
+        # community string by networkId for networks bound to a config template (or overriding it)
+        self.communities = {}
+        self.overridden = set()
+        for org, count in zip(self.orgs, counts):
+            org_networks = []
+            bound = 0
+            for index in range(count):
+                network_id = f'L_{org["id"]}_{index}'
+                network = {
+                    'id': network_id,
+                    'organizationId': org['id'],
+                    'name': f'Bench Network {index}',
+                    'productTypes': PRODUCT_TYPES[index % len(PRODUCT_TYPES)],
+                    'timeZone': 'America/Los_Angeles',
+                    'tags': [],
+                    'enrollmentString': None,
+                    'url': f'https://example.invalid/n/{network_id}',
+                    'notes': '',
+                    'isBoundToConfigTemplate': False,
+                }
+                if unsupported_every and index % unsupported_every == 0:
+                    self.unsupported.add(network_id)
+                # offset by one so the default unsupported networks (every 10th from 0) are not bound
+                elif bound_every and templates and index % bound_every == bound_every - 1:
+                    template = (index // bound_every) % templates
+                    network.update(
+                        isBoundToConfigTemplate=True,
+                        configTemplateId=f'L_{org["id"]}_template_{template}',
+                        productTypes=PRODUCT_TYPES[template % len(PRODUCT_TYPES)],
+                        )
+                    bound += 1
+                    if overridden_every and bound % overridden_every == 0:
+                        self.overridden.add(network_id)
+                        self.communities[network_id] = f'bench {network_id}'
+                    else:
+                        self.communities[network_id] = f'bench {network["configTemplateId"]}'
+                org_networks.append(network)
+            self.networks[org['id']] = org_networks
+
+        self.network_org = {
+            network['id']: org_id for org_id, org_networks in self.networks.items() for network in org_networks
+        }
+
+    def total_networks(self):
+        return len(self.network_org)
+
+
+class OrgBuckets:
+    ''' per org token buckets, thread safe since the server handles each request on its own thread '''
+
+    def __init__(self, rate, burst, retry_after):
+        self.rate = rate
+        self.burst = burst
+        self.retry_after = retry_after
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, org_id):
+        if not self.rate:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(org_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[org_id] = (tokens, now)
+                return False
+            self._buckets[org_id] = (tokens - 1, now)
+            return True
+
+
+class MockDashboardServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, estate, latency=0.05, jitter=0.02, org_rate=10, org_burst=10, retry_after=1):
+        super().__init__(address, MockDashboardHandler)
+        self.estate = estate
+        self.latency = latency
+        self.jitter = jitter
+        self.buckets = OrgBuckets(org_rate, org_burst, retry_after)
+        self.stats = {'requests': 0, 'throttled': 0, 'unsupported': 0}
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/v1'
+
+    def count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+
+class MockDashboardHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _throttled(self, org_id):
+        if self.server.buckets.allow(org_id):
+            return False
+        self.server.count('throttled')
+        self._send(429, {'errors': ['API rate limit exceeded for organization']},
+                   {'Retry-After': str(self.server.buckets.retry_after)})
+        return True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        estate = self.server.estate
+
+        if parts == ['_stats']:
+            return self._send(200, self.server.stats)
+
+        self.server.count('requests')
+        server = self.server
+        time.sleep(max(0, server.latency + random.uniform(-server.jitter, server.jitter)))
+
+        if parts[:2] != ['api', 'v1']:
+            return self._send(404, {'errors': ['Not found']})
+        parts = parts[2:]
+
+        if parts == ['organizations']:
+            return self._send(200, estate.orgs)
+
+        if len(parts) == 3 and parts[0] == 'organizations' and parts[2] == 'snmp':
+            if self._throttled(parts[1]):
+                return
+            return self._send(200, {
+                'v2cEnabled': False, 'v3Enabled': False, 'v3AuthMode': None, 'v3PrivMode': None,
+                'peerIps': None, 'hostname': 'snmp.meraki.com', 'port': 16100,
+            })
+
+        if len(parts) == 3 and parts[0] == 'organizations' and parts[2] == 'networks':
+            org_id = parts[1]
+            if self._throttled(org_id):
+                return
+            return self._networks_page(org_id, query)
+
+        if len(parts) == 3 and parts[0] == 'networks' and parts[2] == 'snmp':
+            network_id = parts[1]
+            org_id = estate.network_org.get(network_id)
+            if org_id is None:
+                return self._send(404, {'errors': ['Network not found']})
+            if self._throttled(org_id):
+                return
+            if network_id in estate.unsupported:
+                self.server.count('unsupported')
+                return self._send(400, UNSUPPORTED_ERROR)
+            return self._send(200, {
+                'access': 'community', 'communityString': estate.communities.get(network_id, 'bench'), 'users': []})
+
+        return self._send(404, {'errors': ['Not found']})
+
+    def _networks_page(self, org_id, query):
+        networks = self.server.estate.networks.get(org_id)
+        if networks is None:
+            return self._send(404, {'errors': ['Organization not found']})
+
+        product_types = set(query.get('productTypes[]', []) + query.get('productTypes', []))
+        if product_types:
+            networks = [network for network in networks if product_types.intersection(network['productTypes'])]
+
+        per_page = int(query.get('perPage', ['1000'])[0])
+        start = 0
+        if 'startingAfter' in query:
+            starting_after = query['startingAfter'][0]
+            start = next((index + 1 for index, network in enumerate(networks) if network['id'] == starting_after), len(networks))
+
+        page = networks[start:start + per_page]
+        headers = {}
+        if start + per_page < len(networks):
+            next_query = dict(query)
+            next_query['perPage'] = [str(per_page)]
+            next_query['startingAfter'] = [page[-1]['id']]
+            next_url = (
+                f'{self.server.base_url}/organizations/{org_id}/networks?'
+                + urllib.parse.urlencode(next_query, doseq=True)
+            )
+            headers['Link'] = f'<{next_url}>; rel=next'
+
+        return self._send(200, page, headers)
+
+
+def serve(estate, host='127.0.0.1', port=0, ready=None, **options):
+    ''' run a mock server until the process is terminated, puts the base url on the `ready` queue once listening '''
+    server = MockDashboardServer((host, port), estate, **options)
+    if ready is not None:
+        ready.put(server.base_url)
+    server.serve_forever()
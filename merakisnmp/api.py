@@ -0,0 +1,114 @@
+import asyncio
+import logging
+
+from merakisnmp.async_code import async_orgsnmp
+from merakisnmp.async_code import async_getorgnetworks
+from merakisnmp.async_code import async_networksnmp
+from merakisnmp.async_code import async_scheduler
+from merakisnmp.async_code import async_pipeline
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+embeddable async API
+
+async generators that yield records (see records.py) as each call completes, for use inside an existing event
+loop.  the caller owns the dashboard session, nothing is printed and there are no progress bars: failed calls are
+logged to the "merakisnmp" logger (warning level) and the org or network is skipped
+
+Usage:
+    async with api.dashboard_session(api_key) as aiomeraki:
+        async for record in api.iter_snmp(aiomeraki, organizations):
+            if isinstance(record, records.NetworkSnmpRecord):
+                ...
+
+pass the same scheduler to several calls on one session so they share the per org rate limits
+'''
+
+logger = logging.getLogger('merakisnmp')
+logger.addHandler(logging.NullHandler())
+
+
+def dashboard_session(api_key, base_url='https://api.meraki.com/api/v1', **options):
+    '''
+    AsyncDashboardAPI with the rate limit options the scheduler expects and SDK logging off, use with "async with"
+    (any AsyncDashboardAPI session works, this one just avoids the SDK retrying 429s on top of the scheduler)
+    '''
+    return async_scheduler.sdk_session(api_key, base_url=base_url, **{
+        'output_log': False,
+        'print_console': False,
+        'suppress_logging': True,
+        **options,
+    })
+
+
+async def iter_snmp(aiomeraki, organizations, networks=True, scheduler=None, cache=None):
+    '''
+    yields an OrgSnmpRecord per org and, if networks is set, a NetworkRecord per network listed and a
+    NetworkSnmpRecord per network with snmp settings, as they arrive (one pipelined pass, see async_pipeline)
+    '''
+    async for _, data in async_pipeline.stream_snmp(
+            aiomeraki, organizations, get_networks=networks, scheduler=scheduler, cache=cache, on_error=logger.warning):
+        for record in data or []:
+            yield record
+
+
+async def _as_completed(calls):
+    ''' yields each call's records as it finishes, calls still running are cancelled if the caller stops early '''
+    tasks = [asyncio.ensure_future(call) for call in calls]
+    try:
+        for task in asyncio.as_completed(tasks):
+            for record in await task or []:
+                yield record
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def iter_org_snmp(aiomeraki, organizations, scheduler=None, cache=None):
+    ''' yields an OrgSnmpRecord per org '''
+    scheduler = scheduler or async_scheduler.OrgScheduler()
+    async for record in _as_completed(
+            async_orgsnmp._get_snmp(aiomeraki, organization, scheduler, cache, logger.warning)
+            for organization in organizations):
+        yield record
+
+
+async def iter_networks(aiomeraki, organizations, scheduler=None, cache=None):
+    ''' yields a NetworkRecord per network in the orgs '''
+    scheduler = scheduler or async_scheduler.OrgScheduler()
+    async for record in _as_completed(
+            async_getorgnetworks._get_orgnetworks(aiomeraki, organization, scheduler, cache, logger.warning)
+            for organization in organizations):
+        yield record
+
+
+async def iter_network_snmp(aiomeraki, networks, scheduler=None, cache=None,
+                            concurrency=async_scheduler.MAX_CONCURRENCY):
+    '''
+    yields a NetworkSnmpRecord per network (NetworkRecords from iter_networks, or dicts with the same keys) that
+    has snmp settings.  networks can be any iterable, at most `concurrency` calls are started ahead of the caller
+    '''
+    scheduler = scheduler or async_scheduler.OrgScheduler()
+    pending = set()
+    networks = iter(networks)
+    try:
+        while True:
+            for network in networks:
+                pending.add(asyncio.ensure_future(
+                    async_networksnmp._get_snmp(aiomeraki, network, scheduler, cache, logger.warning)))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                return
+
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                for record in task.result() or []:
+                    yield record
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,123 @@
+import json
+import pathlib
+
+import click
+
+_author_ = 'Zach Brewer'
+_email_ = 'zbrewer@cisco.com'
+_version_ = '0.0.1'
+_license_ = 'MIT'
+
+'''
+per organization circuit breaker and failure report
+
+an org that keeps failing (revoked or missing access, dashboard 5xx, timeouts) would otherwise have every one of
+its remaining calls retried and failed in turn.  after `threshold` consecutive failures the org's circuit opens
+and the scheduler fails its remaining calls straight away (CircuitOpenError) for the rest of the run, every other
+org carries on.  a successful call resets the count
+
+errors about a single request (400 "does not support SNMP", 404) say nothing about the org and are not counted,
+429s are retried by the scheduler and only count if the retries run out
+'''
+
+# consecutive org level failures before the circuit opens
+FAILURE_THRESHOLD = 3
+
+# errors kept per org in the report
+MAX_ERRORS = 10
+
+
+class CircuitOpenError(Exception):
+    ''' raised in place of a call to an org whose circuit is open '''
+
+    def __init__(self, org_id):
+        super().__init__(f'circuit open for org {org_id}, call skipped')
+        self.org_id = org_id
+
+
+def _org_level(error):
+    status = getattr(error, 'status', None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in (401, 403, 429)
+    return True
+
+
+class CircuitBreaker:
+    '''
+    Usage:
+        breaker = CircuitBreaker()
+        scheduler = OrgScheduler(breaker=breaker)
+        ...
+        breaker.write(organizations, current_time, output_dir)
+    '''
+
+    def __init__(self, threshold=FAILURE_THRESHOLD, on_open=print):
+        self.threshold = threshold
+        self.on_open = on_open
+        self._consecutive = {}
+        # org ID -> {'failures': n, 'skipped': n, 'open': bool, 'errors': [...]}
+        self.orgs = {}
+
+    def _org(self, org_id):
+        org = self.orgs.get(org_id)
+        if org is None:
+            org = self.orgs[org_id] = {'failures': 0, 'skipped': 0, 'open': False, 'errors': []}
+        return org
+
+    def check(self, org_id):
+        ''' raise CircuitOpenError if the org's circuit is open '''
+        org = self.orgs.get(org_id)
+        if org is not None and org['open']:
+            org['skipped'] += 1
+            raise CircuitOpenError(org_id)
+
+    def success(self, org_id):
+        self._consecutive.pop(org_id, None)
+
+    def failure(self, org_id, endpoint, error):
+        if not _org_level(error):
+            return
+
+        org = self._org(org_id)
+        org['failures'] += 1
+        if len(org['errors']) < MAX_ERRORS:
+            org['errors'].append({'endpoint': endpoint, 'status': getattr(error, 'status', None), 'error': str(error)})
+
+        self._consecutive[org_id] = self._consecutive.get(org_id, 0) + 1
+        if self.threshold and not org['open'] and self._consecutive[org_id] >= self.threshold:
+            org['open'] = True
+            self.on_open(f'circuit open for org {org_id} after {self.threshold} consecutive failures, its remaining calls are skipped')
+
+    def merge(self, other_orgs):
+        ''' add another process's (--workers) per org failures, orgs are only ever in one process '''
+        for org_id, org in (other_orgs or {}).items():
+            self.orgs[org_id] = org
+
+    def report(self, organizations=()):
+        ''' failed orgs (most failures first) with their names where known '''
+        names = {str(organization['id']): organization.get('name') for organization in organizations}
+        return sorted([
+            {
+                'organizationId': org_id,
+                'organizationName': names.get(str(org_id)),
+                'circuit': 'open' if org['open'] else 'closed',
+                'failures': org['failures'],
+                'skippedCalls': org['skipped'],
+                'errors': org['errors'],
+            } for org_id, org in self.orgs.items()
+        ], key=lambda org: -org['failures'])
+
+    def write(self, organizations, current_time, output_dir):
+        if not self.orgs:
+            return
+
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+        report_path = pathlib.Path(output_dir) / f'failures_{current_time}.json'
+        report = self.report(organizations)
+        with open(report_path, 'w') as outfile:
+            outfile.write(json.dumps(report, indent=4))
+
+        opened = sum(org['circuit'] == 'open' for org in report)
+        click.secho(f'{len(report)} organizations had failed calls ({opened} circuits opened), '
+                    f'{sum(org["skippedCalls"] for org in report)} calls skipped', fg='yellow')
+        click.secho(f'failure report written to file: { report_path }', fg='yellow')
@@ -4,6 +4,11 @@ import asyncio
 import tqdm.asyncio
 from pprint import pprint
 
+from merakisnmp import limits
+from merakisnmp import records
+from merakisnmp.async_code import async_breaker
+from merakisnmp.async_code import async_scheduler
+
 __author__ = 'Zach Brewer'
 __email__ = 'zbrewer@cisco.com'
 __version__ = '0.1.0'
@@ -20,40 +25,71 @@ Useful because Dashboard API does not include orgname in getOrgNetworks
 
 Also useful to be able to return all given networks for all organizations (or a subset of organizations) and call them via python dict
 '''
-async def _get_orgnetworks(aiomeraki, organization):
+# note, temporarily filtering out non SNMP relevant networks (cameras, MDM)
+RELEVANT_PRODUCTS = ['appliance', 'cellularGateway', 'switch', 'wireless', 'wirelessController']
+
+
+async def _list_networks(aiomeraki, organization, scheduler):
+    '''
+    every page of getOrganizationNetworks for an org, each page is its own scheduler call so a large org's listing
+    is paced by the org's rate limit and a 429 only retries the page it hit
+    '''
+    networks = []
+    paging = {}
+    while True:
+        page = await scheduler.call(
+            organization['id'], aiomeraki.organizations.getOrganizationNetworks, organizationId=organization['id'],
+            productTypes=RELEVANT_PRODUCTS, perPage=limits.NETWORKS_PER_PAGE, total_pages=1, **paging)
+        networks.extend(page)
+        # networks are paged by ID, a page that is not full is the last one
+        if len(page) < limits.NETWORKS_PER_PAGE:
+            return networks
+        paging = {'startingAfter': page[-1]['id']}
+
+
+async def _get_orgnetworks(aiomeraki, organization, scheduler, cache=None, on_error=print):
     '''
-    Async function that calls getOrganizationNetworks for a given organization
+    Async function that calls getOrganizationNetworks for a given organization (or reads it from the response cache)
+    errors are reported with on_error (print by default)
     '''
 
+    networks = cache.get('getOrganizationNetworks', organization['id']) if cache else None
+
     try:
-        # note, temporarily filtering out non SNMP relevant networks (cameras, MDM)
-        relevant_products = ['appliance','cellularGateway','switch','wireless','wirelessController']
-        networks = await aiomeraki.organizations.getOrganizationNetworks(
-            organizationId=organization['id'], productTypes=relevant_products, total_pages=-1)
+        if networks is None:
+            networks = await _list_networks(aiomeraki, organization, scheduler)
+
+            if cache and networks is not None:
+                cache.set('getOrganizationNetworks', organization['id'], networks)
+                cache.set_org_size(organization['id'], len(networks))
 
-    except meraki.exceptions.AsyncAPIError as e:
-        print(
+    except async_breaker.CircuitOpenError:
+        # the org's circuit is open, reported once when it opened and in the failure report
+        networks = None
+    except async_scheduler.API_ERRORS as e:
+        on_error(
             f'Meraki AIO API Error (OrgID "{ organization["id"] }", OrgName "{ organization["name"] }"): \n { e }'
         )
         networks = None
     except Exception as e:
-        print(f'some other ERROR: {e}')
+        on_error(f'some other ERROR: {e}')
         networks = None
 
     if networks:
-        rekeyed_dicts = []
-        for network in networks:
-            rename_idkey = {'networkId' if k == 'id' else k:v for k,v in network.items()}
-            rename_url = {'networkUrl' if k == 'url' else k:v for k,v in rename_idkey.items()}
-            rename_namekey = {'networkName' if k == 'name' else k:v for k,v in rename_url.items()}
-            rekeyed_dicts.append(rename_namekey)
-
-        org_networks = [{
-            'organizationName': organization['name'],
-            'organizationUrl': organization['url'],
-
-            **network_dict,
-        } for network_dict in rekeyed_dicts]
+        # one record per network with id, name and url renamed and the org's name and url added
+        org_networks = [records.NetworkRecord(
+            organization['name'],
+            organization['url'],
+            network['id'],
+            network.get('organizationId', organization['id']),
+            network['name'],
+            network.get('url'),
+            network.get('productTypes'),
+            network.get('timeZone'),
+            network.get('tags'),
+            network.get('isBoundToConfigTemplate'),
+            network.get('configTemplateId'),
+        ) for network in networks]
 
     else:
         org_networks = None
@@ -61,25 +97,23 @@ async def _get_orgnetworks(aiomeraki, organization):
     return org_networks
 
 
-async def _async_apicall(api_key, organizations, debug_values, cert_path):    
+async def _async_apicall(api_key, organizations, debug_values, cert_path, base_url):    
     # Instantiate a Meraki dashboard API session
     # NOTE: you have to use "async with" so that the session will be closed correctly at the end of the usage
-    async with meraki.aio.AsyncDashboardAPI(
+    async with async_scheduler.sdk_session(
             api_key,
-            base_url='https://api.meraki.com/api/v1',
+            base_url=base_url,
             log_file_prefix=__file__[:-3],
             #log_path='logs/',
-            maximum_concurrent_requests=10,
-            maximum_retries= 100,
-            wait_on_rate_limit=True,
             output_log=debug_values['output_log'],
             print_console=debug_values['output_console'],
             suppress_logging=debug_values['suppress_logging']
         ) as aiomeraki:
 
+        scheduler = async_scheduler.OrgScheduler()
         all_orgnetworks = []
 
-        network_tasks = [_get_orgnetworks(aiomeraki, organization) for organization in organizations]
+        network_tasks = [_get_orgnetworks(aiomeraki, organization, scheduler) for organization in organizations]
         for task in tqdm.tqdm(
                 asyncio.as_completed(network_tasks),
                 total=len(network_tasks),
@@ -92,7 +126,7 @@ async def _async_apicall(api_key, organizations, debug_values, cert_path):
         
         return all_orgnetworks
 
-def asyncget_networks(api_key, organizations, debug_app=False, cert_path=None):
+def asyncget_networks(api_key, organizations, debug_app=False, cert_path=None, base_url='https://api.meraki.com/api/v1'):
     if debug_app:
         debug_values = {'output_log' : True, 'output_console' : True, 'suppress_logging' : False}
     else:
@@ -100,7 +134,7 @@ def asyncget_networks(api_key, organizations, debug_app=False, cert_path=None):
 
     #begin async loop
     loop = asyncio.get_event_loop()
-    return loop.run_until_complete(_async_apicall(api_key, organizations, debug_values, cert_path))
+    return loop.run_until_complete(_async_apicall(api_key, organizations, debug_values, cert_path, base_url))
 
 
 
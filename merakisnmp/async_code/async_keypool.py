@@ -0,0 +1,108 @@
+import time
+import collections
+
+import click
+
+from merakisnmp import keypool
+from merakisnmp.async_code import async_scheduler
+
+_author_ = 'Zach Brewer'
+_email_ = 'zbrewer@cisco.com'
+_version_ = '0.0.1'
+_license_ = 'MIT'
+
+'''
+async side of an API key pool (see keypool.py): one AsyncDashboardAPI session per key and per call key selection
+'''
+
+# key is invalid or revoked, do not use it again this run
+REVOKED_STATUS = 401
+# key has no access to this org (or endpoint), try another key for the call
+FORBIDDEN_STATUS = 403
+
+
+class SessionPool:
+    '''
+    one AsyncDashboardAPI session per key used in place of a single session, e.g.
+        aiomeraki.networks.getNetworkSnmp
+    returns a pooled endpoint that the scheduler binds to the call's org (see OrgScheduler.call)
+    '''
+
+    def __init__(self, key_pool, sessions):
+        self.key_pool = key_pool
+        # API key -> AsyncDashboardAPI session
+        self.sessions = sessions
+        self._paused = {}
+        self._revoked = set()
+        self._active = collections.Counter()
+
+    def __getattr__(self, section):
+        if section.startswith('_'):
+            raise AttributeError(section)
+        return _PooledSection(self, section)
+
+    def _choose(self, org_id, tried):
+        now = time.monotonic()
+        candidates = [
+            key for key in self.key_pool.keys_for(org_id) if key not in self._revoked and key not in tried
+        ]
+        if not candidates:
+            return None
+        # keys that are not paused after a 429 first, then the least busy (ties go to the first listed key)
+        return min(candidates, key=lambda key: (self._paused.get(key, 0) > now, self._active[key]))
+
+    async def call(self, org_id, section, name, *args, **kwargs):
+        tried = set()
+        error = None
+        while True:
+            api_key = self._choose(org_id, tried)
+            if api_key is None:
+                if error is not None:
+                    raise error
+                raise RuntimeError(f'no usable API key for organization {org_id}')
+
+            self._active[api_key] += 1
+            try:
+                return await getattr(getattr(self.sessions[api_key], section), name)(*args, **kwargs)
+
+            except async_scheduler.API_ERRORS as e:
+                status = getattr(e, 'status', None)
+                if status == 429:
+                    # the scheduler retries, meanwhile the org's other keys are preferred
+                    self._paused[api_key] = time.monotonic() + (async_scheduler._retry_after(e) or 1)
+                    raise
+                if status == REVOKED_STATUS:
+                    self._revoked.add(api_key)
+                    click.secho(f'API key {keypool.key_label(api_key)} was rejected (401), it is not used for the rest of the run', fg='yellow')
+                elif status != FORBIDDEN_STATUS:
+                    raise
+                tried.add(api_key)
+                error = e
+
+            finally:
+                self._active[api_key] -= 1
+
+
+class _PooledSection:
+    def __init__(self, pool, section):
+        self.pool = pool
+        self.section = section
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return PooledEndpoint(self.pool, self.section, name)
+
+
+class PooledEndpoint:
+    ''' an SDK endpoint on every key in the pool, for_org() gives the callable the scheduler awaits '''
+
+    def __init__(self, pool, section, name):
+        self.pool = pool
+        self.section = section
+        self.__name__ = name
+
+    def for_org(self, org_id):
+        async def call(*args, **kwargs):
+            return await self.pool.call(org_id, self.section, self.__name__, *args, **kwargs)
+        return call
@@ -3,6 +3,10 @@ import meraki.aio
 import asyncio
 import tqdm.asyncio
 
+from merakisnmp import records
+from merakisnmp.async_code import async_breaker
+from merakisnmp.async_code import async_scheduler
+
 _author_ = 'Zach Brewer'
 _email_ = 'zbrewer@cisco.com'
 _version_ = '0.0.2'
@@ -11,19 +15,48 @@ meraki.aio.AsyncNetworks.getNetworkSnmp
 '''
 simple code that returns snmp settings for networks in one or more orgs
 '''
-async def _get_snmp(aiomeraki, network):
-    '''  Async function that gets network snmp '''
+
+# getNetworkSnmp 400 error for networks that have no snmp settings (e.g. camera or sensor only networks)
+UNSUPPORTED_ERROR = 'does not support SNMP'
+
+
+def _unsupported(error):
+    return getattr(error, 'status', None) == 400 and UNSUPPORTED_ERROR in str(error)
+
+
+async def _get_config(aiomeraki, network, scheduler, cache=None, on_error=print):
+    ''' raw getNetworkSnmp response for a network, {} if the call failed (errors are reported with on_error) '''
+    # None when the call failed for some other reason, so nothing is learned
+    supported = None
     try:
-        snmp_config = await aiomeraki.networks.getNetworkSnmp(networkId=network['networkId'])
+        snmp_config = await scheduler.call(
+            network['organizationId'], aiomeraki.networks.getNetworkSnmp, networkId=network['networkId'])
+        supported = True
 
-    except meraki.exceptions.AsyncAPIError as e:
-        print(f'Meraki AIO API Error (Org: { network["networkName"] }): \n { e }')
+    except async_breaker.CircuitOpenError:
+        # the org's circuit is open, reported once when it opened and in the failure report
         snmp_config = {}
 
+    except async_scheduler.API_ERRORS as e:
+        on_error(f'Meraki AIO API Error (Org: { network["networkName"] }): \n { e }')
+        snmp_config = {}
+        if _unsupported(e):
+            supported = False
+
     except Exception as e:
-        print(f'some other ERROR: {e}') 
+        on_error(f'some other ERROR: {e}')
         snmp_config = {}
+        if _unsupported(e):
+            supported = False
+
+    if cache and supported is not None:
+        cache.set_support(network, supported)
+
+    return snmp_config
 
+
+def _snmp_records(network, snmp_config):
+    ''' redacted network snmp record for a raw getNetworkSnmp response, {} for an empty response '''
     if snmp_config:
         '''
          networks, getNetworkSnmp - 400 Bad Request, {'errors': ['This network does not support SNMP configuration']}
@@ -54,44 +87,82 @@ async def _get_snmp(aiomeraki, network):
         else:
             snmp_access = snmp_config['access']
 
-        snmp_data = [{
-            'networkName': network['networkName'],
-            'networkId': network['networkId'],
-            'networkUrl' : network['networkUrl'], 
-            'organizationName': network['organizationName'], 
-            'organizationId': network['organizationId'],
-            'organizationUrl' : network['organizationUrl'],
-            'snmpVersion': snmp_version,
-            'snmpAccess': snmp_access,
-            'snmpCommunitystring': community_string,
-            'snmpUsers': snmp_users
-            }]
+        snmp_data = [records.NetworkSnmpRecord(
+            network['networkName'],
+            network['networkId'],
+            network['networkUrl'],
+            network['organizationName'],
+            network['organizationId'],
+            network['organizationUrl'],
+            snmp_version,
+            snmp_access,
+            community_string,
+            snmp_users,
+            )]
 
     else:
-        snmp_config = {}
         snmp_data = {}
 
     return snmp_data
 
-async def _async_apicall(api_key, networks, debug_values):
+
+def _inferred_records(network, snmp_config):
+    ''' records for a network given its config template's sampled settings (snmp_config) instead of being queried '''
+    return [
+        records.InferredNetworkSnmpRecord(*record.values(), network['configTemplateId'])
+        for record in _snmp_records(network, snmp_config)
+    ]
+
+
+async def _get_snmp(aiomeraki, network, scheduler, cache=None, on_error=print):
+    '''  Async function that gets network snmp (from the response cache if a fresh entry exists), errors are reported with on_error '''
+    if cache:
+        snmp_data = cache.get('getNetworkSnmp', network['networkId'])
+        if snmp_data is not None:
+            return snmp_data
+
+        # known not to support snmp from an earlier run (or by its productTypes), skip the call
+        if cache.known_unsupported(network):
+            return {}
+
+    snmp_data = _snmp_records(network, await _get_config(aiomeraki, network, scheduler, cache, on_error))
+
+    if cache and snmp_data:
+        cache.set('getNetworkSnmp', network['networkId'], snmp_data)
+
+    return snmp_data
+
+
+async def _get_snmp_sample(aiomeraki, network, scheduler, cache=None, on_error=print):
+    '''
+    (network snmp, raw settings) for a config template sample (templates.py), always queried because cached
+    responses are redacted and cannot be compared
+    '''
+    snmp_config = await _get_config(aiomeraki, network, scheduler, cache, on_error)
+    snmp_data = _snmp_records(network, snmp_config)
+
+    if cache and snmp_data:
+        cache.set('getNetworkSnmp', network['networkId'], snmp_data)
+
+    return snmp_data, snmp_config
+
+async def _async_apicall(api_key, networks, debug_values, base_url):
     # Instantiate a Meraki dashboard API session
     # NOTE: you have to use "async with" so that the session will be closed correctly at the end of the usage
-    async with meraki.aio.AsyncDashboardAPI(
+    async with async_scheduler.sdk_session(
             api_key,
-            base_url='https://api.meraki.com/api/v1',
+            base_url=base_url,
             log_file_prefix=__file__[:-3],
             #log_path='logs/',
-            maximum_concurrent_requests=10,
-            maximum_retries= 100,
-            wait_on_rate_limit=True,
             output_log=debug_values['output_log'],
             print_console=debug_values['output_console'],
             suppress_logging=debug_values['suppress_logging']
         ) as aiomeraki:
         
+        scheduler = async_scheduler.OrgScheduler()
         all_snmp = []
 
-        admin_tasks = [_get_snmp(aiomeraki, network) for network in networks]
+        admin_tasks = [_get_snmp(aiomeraki, network, scheduler) for network in networks]
         for task in tqdm.tqdm(
                 asyncio.as_completed(admin_tasks),
                 total = len(admin_tasks),
@@ -105,7 +176,7 @@ async def _async_apicall(api_key, networks, debug_values):
         return all_snmp
 
 
-def async_get_snmp(api_key, networks, debug_app=False):
+def async_get_snmp(api_key, networks, debug_app=False, base_url='https://api.meraki.com/api/v1'):
     if debug_app:
         debug_values = {'output_log' : True, 'output_console' : True, 'suppress_logging' : False}
     else:
@@ -113,4 +184,4 @@ def async_get_snmp(api_key, networks, debug_app=False):
 
     #begin async loop
     loop = asyncio.get_event_loop()
-    return loop.run_until_complete(_async_apicall(api_key, networks, debug_values))
\ No newline at end of file
+    return loop.run_until_complete(_async_apicall(api_key, networks, debug_values, base_url))
\ No newline at end of file
@@ -3,6 +3,10 @@ import meraki.aio
 import asyncio
 import tqdm.asyncio
 
+from merakisnmp import records
+from merakisnmp.async_code import async_breaker
+from merakisnmp.async_code import async_scheduler
+
 _author_ = 'Zach Brewer'
 _email_ = 'zbrewer@cisco.com'
 _version_ = '0.0.2'
@@ -11,68 +15,87 @@ _license_ = 'MIT'
 '''
 simple code that returns snmp settings for one or more orgs
 '''
-async def _get_snmp(aiomeraki, organization):
-    '''  Async function that gets org snmp '''
+async def _get_snmp(aiomeraki, organization, scheduler, cache=None, on_error=print):
+    '''  Async function that gets org snmp (from the response cache if a fresh entry exists), errors are reported with on_error '''
+
+    if cache:
+        snmp_data = cache.get('getOrganizationSnmp', organization['id'])
+        if snmp_data is not None:
+            return snmp_data
 
     try:
-        snmp_config = await aiomeraki.organizations.getOrganizationSnmp(organizationId=organization['id'])
+        snmp_config = await scheduler.call(
+            organization['id'], aiomeraki.organizations.getOrganizationSnmp, organizationId=organization['id'])
+
+    except async_breaker.CircuitOpenError:
+        # the org's circuit is open, reported once when it opened and in the failure report
+        snmp_config = None
 
-    except meraki.exceptions.AsyncAPIError as e:
-        print(f'Meraki AIO API Error (Org: { organization["name"] }): \n { e }')
+    except async_scheduler.API_ERRORS as e:
+        on_error(f'Meraki AIO API Error (Org: { organization["name"] }): \n { e }')
         snmp_config = None
 
     except Exception as e:
-        print(f'some other ERROR: {e}')
+        on_error(f'some other ERROR: {e}')
         snmp_config = None
 
     if snmp_config:
-        # replace community string value from dict
-        snmp_config['v2CommunityString'] = '*****'            
-        snmp_data = [{
-            'organizationName': organization['name'],
-            'organizationId': organization['id'],
-            'organizationURL' : organization['url'], 
-            **snmp_config}]
+        # community string value is replaced
+        snmp_data = [records.OrgSnmpRecord(
+            organization['name'],
+            organization['id'],
+            organization['url'],
+            snmp_config.get('v2cEnabled'),
+            '*****',
+            snmp_config.get('v3Enabled'),
+            snmp_config.get('v3AuthMode'),
+            snmp_config.get('v3PrivMode'),
+            snmp_config.get('peerIps'),
+            snmp_config.get('hostname'),
+            snmp_config.get('port'),
+            extra=snmp_config,
+            )]
     else:
         snmp_config = None
         snmp_data = None
 
+    if cache and snmp_data:
+        cache.set('getOrganizationSnmp', organization['id'], snmp_data)
 
     return snmp_data
 
-async def _async_apicall(api_key, organizations, debug_values):
+async def _async_apicall(api_key, organizations, debug_values, base_url):
     # Instantiate a Meraki dashboard API session
     # NOTE: you have to use "async with" so that the session will be closed correctly at the end of the usage
-    async with meraki.aio.AsyncDashboardAPI(
+    async with async_scheduler.sdk_session(
             api_key,
-            base_url='https://api.meraki.com/api/v1',
+            base_url=base_url,
             log_file_prefix=__file__[:-3],
             #log_path='logs/',
-            maximum_concurrent_requests=10,
-            maximum_retries= 100,
-            wait_on_rate_limit=True,
             output_log=debug_values['output_log'],
             print_console=debug_values['output_console'],
             suppress_logging=debug_values['suppress_logging']
         ) as aiomeraki:
         
+        scheduler = async_scheduler.OrgScheduler()
         all_snmp = []
 
-        admin_tasks = [_get_snmp(aiomeraki, organization) for organization in organizations]
+        admin_tasks = [_get_snmp(aiomeraki, organization, scheduler) for organization in organizations]
         for task in tqdm.tqdm(
                 asyncio.as_completed(admin_tasks),
                 total = len(admin_tasks),
                 colour='green',
                 ):
 
+            # failed orgs return None
             snmp_json = await task
-            for organization in snmp_json:
+            for organization in snmp_json or []:
                 all_snmp.append(organization)
         
         return all_snmp
 
 
-def async_get_snmp(api_key, organizations, debug_app=False):
+def async_get_snmp(api_key, organizations, debug_app=False, base_url='https://api.meraki.com/api/v1'):
     if debug_app:
         debug_values = {'output_log' : True, 'output_console' : True, 'suppress_logging' : False}
     else:
@@ -80,4 +103,4 @@ def async_get_snmp(api_key, organizations, debug_app=False):
 
     #begin async loop
     loop = asyncio.get_event_loop()
-    return loop.run_until_complete(_async_apicall(api_key, organizations, debug_values))
\ No newline at end of file
+    return loop.run_until_complete(_async_apicall(api_key, organizations, debug_values, base_url))
\ No newline at end of file
@@ -0,0 +1,356 @@
+import meraki
+import meraki.aio
+import asyncio
+import itertools
+import contextlib
+import tqdm.asyncio
+
+from merakisnmp import limits
+from merakisnmp import profiling
+from merakisnmp.async_code import async_keypool
+from merakisnmp.async_code import async_orgsnmp
+from merakisnmp.async_code import async_getorgnetworks
+from merakisnmp.async_code import async_networksnmp
+from merakisnmp.async_code import async_scheduler
+from merakisnmp.async_code import async_transport
+
+_author_ = 'Zach Brewer'
+_email_ = 'zbrewer@cisco.com'
+_version_ = '0.0.1'
+_license_ = 'MIT'
+
+'''
+single session pipeline that runs org snmp, org network listing and network snmp in one event loop
+
+each org's networks are handed to the network snmp workers as soon as that org's pages arrive so
+one slow (or very large) org no longer holds up network snmp calls for every other org
+
+get_networks is True/False, or a set of org IDs whose networks are wanted (org snmp is fetched for every org)
+
+orgs are started in the order given (see budget.largest_first) and queued networks are handed out round robin
+across orgs in that order (the first network of every org, then the second...) so a large org's networks never
+wait behind every network of the orgs that happened to be listed before it
+
+with a templates.TemplateCollapse, networks bound to the same config template are sampled instead of each being
+queried (see templates.py)
+'''
+async def stream_snmp(aiomeraki, organizations, get_networks=False, snmp_workers=async_scheduler.MAX_CONCURRENCY, scheduler=None, cache=None, delta=None, journal=None, on_error=print, budget=None, profiler=None, templates=None):
+    '''
+    Async generator that yields one (kind, data) tuple per completed API call:
+        ('org', [org snmp record] or None)
+        ('orgnetworks', [network, ...] or None)
+        ('network', [network snmp record] or {})
+
+    if a delta run is given, networks with a fresh record from the previous run are not queried again
+    if a run journal is given, every completed call is journaled and calls already in the journal are replayed
+    failed calls are reported with on_error (print by default) and yield None / {}
+    if a budget.RunBudget is given the stream stops at its deadline and the calls not completed are left in the budget
+    if a profiling.StageProfiler is given every call is timed as its stage
+    if a templates.TemplateCollapse is given, large groups of networks bound to one config template are sampled and
+    the sampled settings are given to the rest of the group when every sample matches
+    '''
+    scheduler = scheduler or async_scheduler.OrgScheduler()
+    results = asyncio.Queue()
+    # (position in its org, org rank, tie breaker, network), None networks stop the workers
+    network_queue = asyncio.PriorityQueue()
+    sequence = itertools.count()
+
+    def track(kind, key, organization, network=None):
+        if budget:
+            details = {'organizationId': organization['id'], 'organizationName': organization.get('name')}
+            if network is not None:
+                details.update(networkId=network['networkId'], networkName=network.get('networkName'))
+            budget.pending(kind, key, **details)
+
+    def finished(kind, key):
+        if budget:
+            budget.done(kind, key)
+
+    async def org_snmp(organization):
+        snmp_data = journal.get('org', organization['id']) if journal else None
+        if snmp_data is None:
+            with profiling.stage(profiler, 'org_snmp'):
+                snmp_data = await async_orgsnmp._get_snmp(aiomeraki, organization, scheduler, cache, on_error)
+            if journal:
+                journal.record('org', organization['id'], snmp_data)
+        finished('org', organization['id'])
+        results.put_nowait(('org', snmp_data))
+
+    async def org_networks(organization, rank):
+        networks = journal.get('orgnetworks', organization['id']) if journal else None
+        if networks is None:
+            with profiling.stage(profiler, 'network_listing'):
+                networks = await async_getorgnetworks._get_orgnetworks(aiomeraki, organization, scheduler, cache, on_error)
+            if journal:
+                journal.record('orgnetworks', organization['id'], networks)
+        queued, groups = networks or [], []
+        if templates:
+            queued, groups = templates.split(queued)
+        for network in networks or []:
+            track('network', network['networkId'], organization, network)
+        for position, network in enumerate(queued):
+            network_queue.put_nowait((position, rank, next(sequence), network))
+        finished('orgnetworks', organization['id'])
+        results.put_nowait(('orgnetworks', networks))
+        if delta and networks is not None:
+            delta.listed(organization, networks)
+        if groups:
+            await asyncio.gather(*[template_group(group, rank, len(queued)) for group in groups])
+
+    async def lookup_network(network, sample=False):
+        '''
+        (network snmp, raw settings) from a fresh --delta record, the journal or a query, in that order.  template
+        samples (sample=True) skip --delta (see template_group) and return their raw settings when queried, raw
+        settings are None otherwise
+        '''
+        snmp_data = delta.reuse(network) if delta and not sample else None
+        if snmp_data is not None:
+            return snmp_data, None
+
+        snmp_config = None
+        snmp_data = journal.get('network', network['networkId']) if journal else None
+        if snmp_data is None:
+            with profiling.stage(profiler, 'network_snmp'):
+                if sample:
+                    snmp_data, snmp_config = await async_networksnmp._get_snmp_sample(aiomeraki, network, scheduler, cache, on_error)
+                else:
+                    snmp_data = await async_networksnmp._get_snmp(aiomeraki, network, scheduler, cache, on_error)
+            if journal:
+                journal.record('network', network['networkId'], snmp_data)
+        if delta:
+            delta.fetched(network, snmp_data)
+        return snmp_data, snmp_config
+
+    def network_done(network, snmp_data):
+        finished('network', network['networkId'])
+        results.put_nowait(('network', snmp_data))
+
+    async def network_snmp():
+        while True:
+            *_, network = await network_queue.get()
+            if network is None:
+                return
+
+            snmp_data, _ = await lookup_network(network)
+            network_done(network, snmp_data)
+
+    async def sample_network(network):
+        snmp_data, snmp_config = await lookup_network(network, sample=True)
+        network_done(network, snmp_data)
+        return snmp_config
+
+    async def template_group(group, rank, position):
+        '''
+        query a config template group's samples, then give the rest their settings or queue them as usual.  a group
+        that --delta can reuse whole is queued as usual, otherwise the samples are queried even if they are fresh
+        since a reused record has no raw settings to compare.  a sample replayed from the journal has none either,
+        so its group is not collapsed
+        '''
+        if delta and all(delta.fresh(network) for network in group):
+            for offset, network in enumerate(group):
+                network_queue.put_nowait((position + offset, rank, next(sequence), network))
+            return
+
+        samples, rest = templates.sample(group)
+        configs = await asyncio.gather(*[sample_network(network) for network in samples])
+        if templates.collapse(configs, rest):
+            for network in rest:
+                snmp_data = async_networksnmp._inferred_records(network, configs[0])
+                if journal:
+                    journal.record('network', network['networkId'], snmp_data)
+                if delta:
+                    delta.fetched(network, snmp_data)
+                network_done(network, snmp_data)
+            return
+
+        for offset, network in enumerate(rest):
+            network_queue.put_nowait((position + offset, rank, next(sequence), network))
+
+    async def produce():
+        workers = []
+        org_tasks = []
+        for rank, organization in enumerate(organizations):
+            track('org', organization['id'], organization)
+            org_tasks.append(org_snmp(organization))
+            if limits.wants_networks(get_networks, organization):
+                track('orgnetworks', organization['id'], organization)
+                org_tasks.append(org_networks(organization, rank))
+        if get_networks:
+            workers = [asyncio.ensure_future(network_snmp()) for _ in range(snmp_workers)]
+
+        try:
+            await asyncio.gather(*org_tasks)
+            # every org has been listed, tell the workers to stop once the queue drains
+            for _ in workers:
+                network_queue.put_nowait((float('inf'), 0, next(sequence), None))
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    producer = asyncio.ensure_future(produce())
+    producer.add_done_callback(lambda _: results.put_nowait(None))
+    try:
+        while True:
+            if budget:
+                try:
+                    item = await asyncio.wait_for(results.get(), budget.remaining())
+                except asyncio.TimeoutError:
+                    producer.cancel()
+                    budget.expire()
+                    # hand over the calls that completed before the deadline, then stop
+                    while not results.empty():
+                        item = results.get_nowait()
+                        if item is not None:
+                            yield item
+                    return
+            else:
+                item = await results.get()
+            if item is None:
+                break
+            yield item
+
+        # re-raise anything that stopped the producer early
+        producer.result()
+    finally:
+        producer.cancel()
+
+
+def debug_options(debug_app):
+    if debug_app:
+        return {'output_log' : True, 'output_console' : True, 'suppress_logging' : False}
+    return {'output_log' : False, 'output_console' : False, 'suppress_logging' : True}
+
+
+def _session(api_key, debug_values, base_url, request_timeout=async_scheduler.REQUEST_TIMEOUT):
+    return async_scheduler.sdk_session(
+            api_key,
+            request_timeout,
+            base_url=base_url,
+            log_file_prefix=__file__[:-3],
+            #log_path='logs/',
+            output_log=debug_values['output_log'],
+            print_console=debug_values['output_console'],
+            suppress_logging=debug_values['suppress_logging']
+        )
+
+
+async def _enter_session(stack, api_key, debug_values, base_url, request_timeout, transport):
+    aiomeraki = await stack.enter_async_context(_session(api_key, debug_values, base_url, request_timeout))
+    await (transport or async_transport.default_transport()).attach(aiomeraki)
+    return aiomeraki
+
+
+async def open_session(stack, api_key, debug_values, base_url, key_pool=None, request_timeout=async_scheduler.REQUEST_TIMEOUT, transport=None):
+    '''
+    enter a dashboard session on the contextlib.AsyncExitStack (one session per key with a key pool), the session
+    is closed when the stack is.  every session uses the shared transport (async_transport.default_transport() unless
+    one is given) so connections are reused across sessions
+    '''
+    if key_pool:
+        return async_keypool.SessionPool(key_pool, {
+            key: await _enter_session(stack, key, debug_values, base_url, request_timeout, transport) for key in key_pool.keys
+        })
+    return await _enter_session(stack, api_key, debug_values, base_url, request_timeout, transport)
+
+
+async def _async_getorgs(api_keys, debug_values, base_url, request_timeout):
+    async with contextlib.AsyncExitStack() as sessions:
+        dashboards = [
+            await open_session(sessions, api_key, debug_values, base_url, request_timeout=request_timeout) for api_key in api_keys
+        ]
+        # every key is listed at once, a key that fails does not stop the others
+        return await asyncio.gather(
+            *[aiomeraki.organizations.getOrganizations() for aiomeraki in dashboards], return_exceptions=True)
+
+
+def async_get_orgs(api_keys, debug_app=False, base_url='https://api.meraki.com/api/v1', request_timeout=async_scheduler.REQUEST_TIMEOUT):
+    '''
+    returns {api key: orgs from getOrganizations, or the exception raised listing them}
+
+    the listing runs on the same event loop (and shared transport) as the snmp calls that follow it
+    '''
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(_async_getorgs(api_keys, debug_options(debug_app), base_url, request_timeout))
+    return dict(zip(api_keys, results))
+
+
+async def _async_listnetworks(api_key, organizations, debug_values, cache, base_url, key_pool, request_timeout):
+    async with contextlib.AsyncExitStack() as sessions:
+        aiomeraki = await open_session(sessions, api_key, debug_values, base_url, key_pool, request_timeout)
+        scheduler = async_scheduler.OrgScheduler()
+        org_networks = await asyncio.gather(*[
+            async_getorgnetworks._get_orgnetworks(aiomeraki, organization, scheduler, cache) for organization in organizations
+        ])
+        return {str(organization['id']): networks for organization, networks in zip(organizations, org_networks)}
+
+
+def async_list_networks(api_key, organizations, debug_app=False, cache=None, base_url='https://api.meraki.com/api/v1',
+                        key_pool=None, request_timeout=async_scheduler.REQUEST_TIMEOUT):
+    '''
+    returns {org ID: [network, ...], or None if the org could not be listed} without any snmp calls (used by --plan)
+    orgs with a fresh entry in the response cache are read from it, the others are listed and cached
+    '''
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(
+        _async_listnetworks(api_key, organizations, debug_options(debug_app), cache, base_url, key_pool, request_timeout))
+
+
+async def _async_apicall(api_key, organizations, get_networks, debug_values, cache, delta, journal, write_org, write_network, base_url, metrics, progress_bar, key_pool, request_timeout, budget, breaker, profiler, templates):
+    # Instantiate a Meraki dashboard API session (one per key with a key pool)
+    # NOTE: the sessions are entered with "async with" so they are closed correctly at the end of the usage
+    async with contextlib.AsyncExitStack() as sessions:
+        aiomeraki = await open_session(sessions, api_key, debug_values, base_url, key_pool, request_timeout)
+
+        # one org snmp call (and one network listing if requested) per org, network snmp calls are added as orgs are listed
+        total_calls = len(organizations) + sum(limits.wants_networks(get_networks, organization) for organization in organizations)
+        with tqdm.tqdm(total=total_calls, colour='green', disable=not progress_bar) as progress:
+            async for kind, snmp_json in stream_snmp(
+                    aiomeraki, organizations, get_networks=get_networks,
+                    scheduler=async_scheduler.OrgScheduler(metrics=metrics, breaker=breaker), cache=cache, delta=delta, journal=journal,
+                    budget=budget, profiler=profiler, templates=templates):
+                if kind == 'orgnetworks':
+                    if snmp_json:
+                        progress.total += len(snmp_json)
+                        progress.refresh()
+                elif kind == 'org' and snmp_json:
+                    for record in snmp_json:
+                        write_org(record)
+                elif kind == 'network' and snmp_json:
+                    for record in snmp_json:
+                        write_network(record)
+                progress.update(1)
+
+
+def async_get_snmp(api_key, organizations, get_networks=False, debug_app=False, cache=None, delta=None, journal=None,
+                   write_org=None, write_network=None, base_url='https://api.meraki.com/api/v1', metrics=None,
+                   progress_bar=True, key_pool=None, request_timeout=async_scheduler.REQUEST_TIMEOUT, budget=None,
+                   breaker=None, profiler=None, templates=None):
+    '''
+    returns (org snmp records, network snmp records)
+
+    pass a keypool.KeyPool to spread calls over several API keys (api_key is then not used)
+
+    request_timeout is the most seconds any one HTTP request may take, pass a budget.RunBudget to stop at its
+    deadline (budget.expired is then set and budget.unfinished() lists the calls not made)
+
+    pass an async_breaker.CircuitBreaker to stop calling orgs that keep failing, it holds the failure report afterwards
+    and a profiling.StageProfiler to time each call by stage (profiling itself is switched on by the caller)
+
+    pass a templates.TemplateCollapse to sample networks bound to the same config template instead of querying each
+
+    pass write_org / write_network (e.g. writers.ResultWriter.write) to stream records out as each call completes,
+    records that are streamed are not kept in the returned lists
+    '''
+    all_orgsnmp = []
+    all_networksnmp = []
+    write_org = write_org or all_orgsnmp.append
+    write_network = write_network or all_networksnmp.append
+
+    #begin async loop
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(
+        _async_apicall(api_key, organizations, get_networks, debug_options(debug_app), cache, delta, journal, write_org, write_network, base_url, metrics,
+                       progress_bar, key_pool, request_timeout, budget, breaker, profiler, templates))
+
+    return all_orgsnmp, all_networksnmp
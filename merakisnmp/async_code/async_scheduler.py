@@ -0,0 +1,294 @@
+import time
+import asyncio
+import collections
+
+import meraki
+import meraki.aio
+
+from merakisnmp import limits
+from merakisnmp.async_code import async_breaker
+
+_author_ = 'Zach Brewer'
+_email_ = 'zbrewer@cisco.com'
+_version_ = '0.0.1'
+_license_ = 'MIT'
+
+'''
+per organization rate limit aware request scheduler
+
+dashboard API rate limits are per org (10 requests per second with a small burst) so each org gets its own
+token bucket and waiting requests are dispatched round-robin across orgs.  429s are surfaced by the SDK
+(wait_on_rate_limit=False) and fed back here: the throttled org is paused for Retry-After and its rate is
+halved while overall concurrency is reduced, both creep back up again as calls succeed.
+
+with an async_breaker.CircuitBreaker, calls to an org whose circuit has opened fail fast with CircuitOpenError
+'''
+
+# rate limits and concurrency are set in limits.py (shared with --plan)
+ORG_RATE = limits.ORG_RATE
+ORG_BURST = limits.ORG_BURST
+MIN_CONCURRENCY = limits.MIN_CONCURRENCY
+START_CONCURRENCY = limits.START_CONCURRENCY
+MAX_CONCURRENCY = limits.MAX_CONCURRENCY
+
+# 429s are retried here (honouring Retry-After), the SDK only retries other errors
+MAX_THROTTLE_RETRIES = 10
+SDK_MAXIMUM_RETRIES = 3
+
+# seconds any one HTTP request (each page of a paginated call) may take before the SDK gives up on it
+REQUEST_TIMEOUT = 60
+
+# newer SDK releases raise APIError from the async client as well
+API_ERRORS = (meraki.exceptions.AsyncAPIError, meraki.exceptions.APIError)
+
+
+def sdk_session_options(request_timeout=REQUEST_TIMEOUT):
+    '''
+    AsyncDashboardAPI rate limit and timeout options for sessions driven by this scheduler
+
+    newer SDK releases ship their own per org limiter (smart flow) which would throttle on top of this scheduler
+    and look up unknown network IDs first, it is always turned off (see sdk_session for SDK releases without it)
+    '''
+    return {
+        'maximum_concurrent_requests': MAX_CONCURRENCY,
+        'maximum_retries': SDK_MAXIMUM_RETRIES,
+        'wait_on_rate_limit': False,
+        'single_request_timeout': request_timeout,
+        'smart_flow_enabled': False,
+    }
+
+
+def sdk_session(api_key, request_timeout=REQUEST_TIMEOUT, **options):
+    '''
+    AsyncDashboardAPI with sdk_session_options() and `options`, use with "async with"
+
+    smart flow is always switched off explicitly rather than by looking for the parameter (a wrapped constructor
+    hides its signature), SDK releases that predate smart flow reject the option and get a session without it
+    '''
+    options = {**sdk_session_options(request_timeout), **options}
+    try:
+        return meraki.aio.AsyncDashboardAPI(api_key, **options)
+    except TypeError as e:
+        if 'smart_flow_enabled' not in str(e):
+            raise
+        del options['smart_flow_enabled']
+        return meraki.aio.AsyncDashboardAPI(api_key, **options)
+
+
+def _retry_after(error):
+    ''' Retry-After (seconds) from an API error (async_scheduler.API_ERRORS) if the dashboard sent one '''
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    ''' token bucket refilled at `rate` tokens per second up to `capacity` tokens '''
+
+    def __init__(self, rate, capacity):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now):
+        ''' seconds until a token is available, 0 if one is available now '''
+        if now < self.updated:
+            # paused after a 429
+            return self.updated - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def throttle(self, now, retry_after):
+        ''' empty the bucket, pause it for retry_after seconds and halve the refill rate '''
+        self.tokens = 0
+        self.updated = max(self.updated, now + retry_after)
+        self.rate = max(1, self.rate / 2)
+
+    def recover(self):
+        self.rate = min(self.base_rate, self.rate + 0.5)
+
+
+class OrgScheduler:
+    '''
+    Gates every API call on a per org token bucket and an adaptive overall concurrency limit
+
+    Usage:
+        result = await scheduler.call(org_id, aiomeraki.networks.getNetworkSnmp, networkId=network_id)
+    '''
+
+    def __init__(self, rate=ORG_RATE, burst=ORG_BURST, concurrency=START_CONCURRENCY,
+                 min_concurrency=MIN_CONCURRENCY, max_concurrency=MAX_CONCURRENCY,
+                 max_retries=MAX_THROTTLE_RETRIES, metrics=None, breaker=None):
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        # optional metrics.MetricsCollector, every attempt is recorded
+        self.metrics = metrics
+        # optional async_breaker.CircuitBreaker, failures are counted per org
+        self.breaker = breaker
+
+        self._buckets = {}
+        self._waiters = collections.defaultdict(collections.deque)
+        self._ring = collections.deque()
+        self._active = 0
+        self._successes = 0
+        self._timer = None
+        self._timer_due = None
+
+    def _bucket(self, org_id):
+        bucket = self._buckets.get(org_id)
+        if bucket is None:
+            bucket = self._buckets[org_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _dispatch(self):
+        ''' hand free slots to waiting orgs round-robin, skipping orgs whose bucket is empty or paused '''
+        now = time.monotonic()
+        next_delay = None
+        checked = 0
+
+        while self._ring and self._active < self.concurrency and checked < len(self._ring):
+            org_id = self._ring[0]
+            queue = self._waiters[org_id]
+            # drop waiters that were cancelled while queued
+            while queue and queue[0].done():
+                queue.popleft()
+            if not queue:
+                self._ring.popleft()
+                del self._waiters[org_id]
+                continue
+
+            # move the org to the back of the ring so the next slot goes to the next org
+            self._ring.rotate(-1)
+            bucket = self._bucket(org_id)
+            delay = bucket.delay(now)
+            if delay:
+                checked += 1
+                next_delay = delay if next_delay is None else min(next_delay, delay)
+                continue
+
+            checked = 0
+            bucket.take(now)
+            self._active += 1
+            queue.popleft().set_result(None)
+
+        if next_delay is not None and self._active < self.concurrency:
+            self._wake_in(next_delay)
+
+    def _wake_in(self, delay):
+        loop = asyncio.get_running_loop()
+        due = loop.time() + delay
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        self._timer_due = due
+        self._timer = loop.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    async def acquire(self, org_id):
+        waiter = asyncio.get_running_loop().create_future()
+        queue = self._waiters[org_id]
+        if not queue and org_id not in self._ring:
+            self._ring.append(org_id)
+        queue.append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was granted just as we were cancelled, hand it back
+                self._active -= 1
+                self._dispatch()
+            raise
+
+    def release(self, org_id, throttled=False, retry_after=None):
+        self._active -= 1
+        if throttled:
+            self._bucket(org_id).throttle(time.monotonic(), retry_after or 1)
+            self.concurrency = max(self.min_concurrency, self.concurrency - 1)
+            self._successes = 0
+        else:
+            self._bucket(org_id).recover()
+            self._successes += 1
+            if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                self.concurrency += 1
+                self._successes = 0
+        self._dispatch()
+
+    def _observe(self, endpoint, org_id, start, attempt, **outcome):
+        if self.metrics is not None:
+            self.metrics.observe(endpoint, org_id, time.monotonic() - start, retried=attempt > 0, **outcome)
+
+    async def call(self, org_id, func, *args, **kwargs):
+        ''' await func(*args, **kwargs) once org_id has budget, retrying 429s after Retry-After '''
+        endpoint = getattr(func, '__name__', repr(func))
+        # endpoints from an async_keypool.SessionPool pick one of the org's API keys for each attempt
+        if hasattr(func, 'for_org'):
+            func = func.for_org(org_id)
+        attempt = 0
+        while True:
+            if self.breaker:
+                self.breaker.check(org_id)
+            await self.acquire(org_id)
+            start = time.monotonic()
+            try:
+                if self.breaker:
+                    # the circuit may have opened while this call was waiting for a slot
+                    self.breaker.check(org_id)
+                result = await func(*args, **kwargs)
+
+            except async_breaker.CircuitOpenError:
+                self.release(org_id)
+                raise
+
+            except API_ERRORS as e:
+                throttled = getattr(e, 'status', None) == 429
+                self._observe(endpoint, org_id, start, attempt, throttled=throttled, error=not throttled)
+                self.release(org_id, throttled=throttled, retry_after=_retry_after(e) if throttled else None)
+                if throttled and attempt < self.max_retries:
+                    attempt += 1
+                    continue
+                if self.breaker:
+                    self.breaker.failure(org_id, endpoint, e)
+                raise
+
+            except asyncio.CancelledError:
+                self.release(org_id)
+                raise
+
+            except Exception as e:
+                self._observe(endpoint, org_id, start, attempt, error=True)
+                self.release(org_id)
+                if self.breaker:
+                    self.breaker.failure(org_id, endpoint, e)
+                raise
+
+            self._observe(endpoint, org_id, start, attempt, response=result)
+            self.release(org_id)
+            if self.breaker:
+                self.breaker.success(org_id)
+            return result
@@ -0,0 +1,132 @@
+import asyncio
+
+try:
+    import httpx
+except ImportError:
+    # SDK releases before the httpx based async client (aiohttp) keep their own connection pool
+    httpx = None
+
+from merakisnmp.async_code import async_scheduler
+
+_author_ = 'Zach Brewer'
+_email_ = 'zbrewer@cisco.com'
+_version_ = '0.0.1'
+_license_ = 'MIT'
+
+'''
+one HTTP transport shared by every dashboard session in the process
+
+each AsyncDashboardAPI builds its own HTTP client, so the org listing, every key in a key pool and each watch cycle
+paid for new DNS lookups and TLS handshakes, and the SDK's default pool only keeps 20 idle connections for 5
+seconds.  attach() points a session's client at one httpx.AsyncHTTPTransport with a keep-alive connection pool
+(sized to the scheduler's maximum concurrency), connections are reused across sessions and stages, including the
+connections to the regional shard hosts the dashboard redirects to.  there is no separate DNS cache: httpx has no
+public hook for its resolver, so lookups are saved by keeping connections open and hosts are only looked up again
+when a new connection is opened
+
+a transport belongs to the event loop it was first used on, default_transport() returns the current loop's
+'''
+
+MAX_CONNECTIONS = async_scheduler.MAX_CONCURRENCY
+MAX_KEEPALIVE_CONNECTIONS = async_scheduler.MAX_CONCURRENCY
+# seconds an idle connection is kept open
+KEEPALIVE_EXPIRY = 60
+
+
+if httpx is not None:
+    class _SessionTransport(httpx.AsyncBaseTransport):
+        ''' what each session's client sees, closing a session leaves the shared pool open '''
+
+        def __init__(self, transport):
+            self._transport = transport
+
+        async def handle_async_request(self, request):
+            return await self._transport.handle_async_request(request)
+
+        async def aclose(self):
+            pass
+
+
+class SharedTransport:
+    '''
+    keep-alive connection pool for any number of dashboard sessions
+
+    Usage:
+        transport = SharedTransport()
+        async with meraki.aio.AsyncDashboardAPI(api_key, ...) as aiomeraki:
+            await transport.attach(aiomeraki)
+            ...
+        await transport.aclose()
+    '''
+
+    def __init__(self, max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                 keepalive_expiry=KEEPALIVE_EXPIRY):
+        self.loop = None
+        self._transport = None
+        if httpx is None:
+            return
+
+        self._transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ))
+
+    async def attach(self, aiomeraki):
+        '''
+        move an AsyncDashboardAPI session onto the shared pool, returns False (and leaves the session as it is) for
+        SDK releases without an httpx client or sessions with a proxy or custom certificate
+
+        the session gets a new client with every setting of the SDK's client except its transport, and the SDK's
+        client (and its connection pool) is closed
+        '''
+        session = getattr(aiomeraki, '_session', None)
+        client = getattr(session, '_client', None)
+        if self._transport is None or not isinstance(client, httpx.AsyncClient):
+            return False
+        if getattr(session, '_requests_proxy', None) or getattr(session, '_certificate_path', None):
+            return False
+
+        self.loop = self.loop or asyncio.get_running_loop()
+        session._client = httpx.AsyncClient(
+            transport=_SessionTransport(self._transport),
+            base_url=client.base_url,
+            headers=client.headers,
+            cookies=client.cookies,
+            params=client.params,
+            auth=client.auth,
+            timeout=client.timeout,
+            follow_redirects=client.follow_redirects,
+            max_redirects=client.max_redirects,
+            event_hooks=client.event_hooks,
+            trust_env=client.trust_env,
+        )
+        await client.aclose()
+        return True
+
+    async def aclose(self):
+        if self._transport is not None:
+            await self._transport.aclose()
+
+
+_default = None
+
+
+def default_transport():
+    ''' the shared transport for the running event loop, a new one is made for a new loop '''
+    global _default
+    loop = asyncio.get_running_loop()
+    if _default is None or (_default.loop is not None and _default.loop is not loop):
+        _default = SharedTransport()
+        _default.loop = loop
+    return _default
+
+
+def close_default_transport():
+    ''' close the shared transport (from outside the event loop, e.g. when the CLI exits) '''
+    global _default
+    if _default is None:
+        return
+    transport, _default = _default, None
+    if transport.loop is not None and not transport.loop.is_closed():
+        transport.loop.run_until_complete(transport.aclose())
@@ -0,0 +1,106 @@
+import json
+import time
+import pathlib
+
+import click
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+expected cost ordering and run-time budgets
+
+a run takes at least as long as its largest org (each org is rate limited on its own) so orgs are ordered largest
+first by their network counts from earlier runs (response cache or the previous delta results), the biggest org
+starts listing and querying networks first instead of whenever it happens to come up in getOrganizations order
+
+a RunBudget (--time-budget) stops the pipeline at a deadline: records that completed are written as usual and
+every org snmp call, network listing and network snmp call that had not completed is listed in an unfinished
+work report.  completed calls are in the run journal so --resume finishes the rest
+'''
+
+
+def network_counts(response_cache=None, previous=None):
+    ''' org ID -> network count from the response cache and/or a delta run's previous results '''
+    counts = {}
+    for record in (previous or {}).values():
+        org_id = str(record.get('organizationId'))
+        counts[org_id] = counts.get(org_id, 0) + 1
+    if response_cache:
+        counts.update(response_cache.org_sizes())
+    return counts
+
+
+def largest_first(organizations, counts):
+    '''
+    orgs sorted by expected network count (largest first), orgs with no known count are placed as if they had the
+    median known count.  the order of orgs with the same count is kept
+    '''
+    if not counts:
+        return list(organizations)
+
+    known = sorted(counts.values())
+    unknown = known[len(known) // 2]
+    return sorted(organizations, key=lambda organization: -counts.get(str(organization['id']), unknown))
+
+
+class RunBudget:
+    '''
+    deadline for a run and the work still outstanding when it was reached
+
+    Usage:
+        run_budget = RunBudget(seconds)
+        async_get_snmp(..., budget=run_budget)
+        if run_budget.expired:
+            run_budget.write(current_time, output_dir)
+    '''
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.deadline = time.monotonic() + seconds
+        self.expired = False
+        self._pending = {}
+        self._unfinished = []
+
+    def remaining(self):
+        return max(0, self.deadline - time.monotonic())
+
+    def pending(self, kind, key, **details):
+        ''' a call the run still has to make '''
+        self._pending[(kind, key)] = {'kind': kind, 'id': key, **details}
+
+    def done(self, kind, key):
+        self._pending.pop((kind, key), None)
+
+    def expire(self):
+        ''' the deadline was reached, whatever is still pending is unfinished '''
+        self.expired = True
+        self._unfinished.extend(self._pending.values())
+        self._pending = {}
+
+    def extend(self, unfinished):
+        ''' add unfinished work from another process (--workers) '''
+        if unfinished:
+            self.expired = True
+            self._unfinished.extend(unfinished)
+
+    def unfinished(self):
+        return list(self._unfinished)
+
+    def write(self, current_time, output_dir):
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+        report_path = pathlib.Path(output_dir) / f'unfinished_{current_time}.json'
+
+        with open(report_path, 'w') as outfile:
+            outfile.write(json.dumps(self._unfinished, indent=4))
+
+        kinds = {}
+        for entry in self._unfinished:
+            kinds[entry['kind']] = kinds.get(entry['kind'], 0) + 1
+        click.secho(
+            f'time budget of {self.seconds:g}s reached: {kinds.get("org", 0)} org snmp calls, '
+            f'{kinds.get("orgnetworks", 0)} network listings and {kinds.get("network", 0)} network snmp calls not made', fg='yellow'
+            )
+        click.secho(f'unfinished work written to file: { report_path }', fg='yellow')
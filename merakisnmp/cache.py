@@ -0,0 +1,223 @@
+import json
+import time
+import contextlib
+import hashlib
+import sqlite3
+import pathlib
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+persistent on-disk (sqlite) TTL cache for dashboard API responses
+
+entries are keyed by endpoint and ID (org ID, network ID or a hash of the API key for getOrganizations)
+each endpoint has its own TTL and the table is bounded to max_entries, least recently used entries are evicted first
+
+NOTE: snmp responses are cached AFTER redaction so community strings and user passphrases are never written to disk
+
+networks that answer getNetworkSnmp with "does not support SNMP configuration" are remembered (with the network's
+productTypes) and skipped on later runs until the entry expires or the network's productTypes change.  supported
+networks are remembered as well so product type rules can be learned: a productTypes combination seen on at least
+RULE_MIN_NETWORKS unsupported networks and never on a supported one is skipped for networks not seen before
+
+each org's network count is also kept (without a TTL, it is only an estimate) to order orgs largest first
+'''
+
+# seconds each endpoint's cached responses are considered fresh
+DEFAULT_TTLS = {
+    'getOrganizations': 3600,
+    'getOrganizationSnmp': 3600,
+    'getOrganizationNetworks': 3600,
+    'getNetworkSnmp': 3600,
+}
+
+MAX_ENTRIES = 250000
+
+# commit in batches rather than once per response
+COMMIT_EVERY = 200
+
+# seconds a network's snmp support (supported or not) is remembered, expired entries are probed again
+SUPPORT_TTL = 7 * 24 * 3600
+
+# unsupported networks needed (with no supported ones) before a productTypes combination is skipped outright
+RULE_MIN_NETWORKS = 10
+
+
+def apikey_scope(api_key):
+    ''' cache key for responses that depend on the API key (never store the key itself) '''
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+
+
+def _product_types(network):
+    return ','.join(sorted(network.get('productTypes') or []))
+
+
+class ResponseCache:
+    '''
+    sqlite backed response cache
+
+    get() returns None on a miss (or for every lookup when refresh=True), set() always stores so
+    a refresh run repopulates the cache for the next run
+
+    processes sharing the file (--workers) should use commit_every=1 so no process holds the write lock while
+    it waits on the API
+    '''
+
+    def __init__(self, path, ttls=None, max_entries=MAX_ENTRIES, refresh=False, commit_every=COMMIT_EVERY):
+        self.path = path
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_entries = max_entries
+        self.refresh = refresh
+        self.commit_every = commit_every
+        self._pending = 0
+        self._unsupported_rules = None
+
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = self._connect()
+
+    def _connect(self):
+        # worker processes (--workers) share the file, wait on locks rather than failing
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'endpoint TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'stored REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (endpoint, key))'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS network_support ('
+            'network_id TEXT PRIMARY KEY, product_types TEXT NOT NULL, supported INTEGER NOT NULL, stored REAL NOT NULL)'
+        )
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS org_sizes (org_id TEXT PRIMARY KEY, networks INTEGER NOT NULL, stored REAL NOT NULL)'
+        )
+        db.commit()
+        return db
+
+    def get(self, endpoint, key):
+        if self.refresh:
+            return None
+
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, stored FROM responses WHERE endpoint = ? AND key = ?', (endpoint, str(key))
+        ).fetchone()
+        if row is None:
+            return None
+
+        value, stored = row
+        if now - stored > self.ttls.get(endpoint, 0):
+            return None
+
+        self._db.execute(
+            'UPDATE responses SET accessed = ? WHERE endpoint = ? AND key = ?', (now, endpoint, str(key))
+        )
+        self._changed()
+        return json.loads(value)
+
+    def set(self, endpoint, key, value):
+        now = time.time()
+        self._db.execute(
+            'INSERT OR REPLACE INTO responses (endpoint, key, value, stored, accessed) VALUES (?, ?, ?, ?, ?)',
+            (endpoint, str(key), json.dumps(value, default=dict), now, now)
+        )
+        self._changed()
+
+    def _rules(self):
+        ''' productTypes combinations learned to be unsupported, computed once per run '''
+        if self._unsupported_rules is None:
+            rows = self._db.execute(
+                'SELECT product_types FROM network_support WHERE stored >= ? GROUP BY product_types '
+                'HAVING SUM(supported) = 0 AND COUNT(*) >= ?', (time.time() - SUPPORT_TTL, RULE_MIN_NETWORKS)
+            )
+            self._unsupported_rules = {product_types for product_types, in rows}
+        return self._unsupported_rules
+
+    def known_unsupported(self, network):
+        ''' True if the network (or its productTypes combination) is known not to support snmp '''
+        if self.refresh:
+            return False
+
+        product_types = _product_types(network)
+        row = self._db.execute(
+            'SELECT product_types, supported, stored FROM network_support WHERE network_id = ?', (network['networkId'],)
+        ).fetchone()
+        if row is not None and row[0] == product_types and time.time() - row[2] <= SUPPORT_TTL:
+            return not row[1]
+
+        # not seen before (or its productTypes changed since), fall back to the learned rules
+        return product_types in self._rules()
+
+    def set_support(self, network, supported):
+        self._db.execute(
+            'INSERT OR REPLACE INTO network_support (network_id, product_types, supported, stored) VALUES (?, ?, ?, ?)',
+            (network['networkId'], _product_types(network), int(supported), time.time())
+        )
+        self._changed()
+
+    def support_counts(self):
+        ''' (unsupported, probed) networks whose snmp support is remembered '''
+        unsupported, probed = self._db.execute(
+            'SELECT COUNT(*) - COALESCE(SUM(supported), 0), COUNT(*) FROM network_support WHERE stored >= ?',
+            (time.time() - SUPPORT_TTL,)
+        ).fetchone()
+        return unsupported, probed
+
+    def org_sizes(self):
+        ''' org ID -> network count when the org was last listed (read even with refresh) '''
+        return {org_id: networks for org_id, networks in self._db.execute('SELECT org_id, networks FROM org_sizes')}
+
+    def set_org_size(self, org_id, networks):
+        self._db.execute(
+            'INSERT OR REPLACE INTO org_sizes (org_id, networks, stored) VALUES (?, ?, ?)',
+            (str(org_id), networks, time.time())
+        )
+        self._changed()
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def evict(self):
+        ''' drop expired entries and trim the table to max_entries (least recently used first) '''
+        now = time.time()
+        for endpoint, ttl in self.ttls.items():
+            self._db.execute('DELETE FROM responses WHERE endpoint = ? AND stored < ?', (endpoint, now - ttl))
+        self._db.execute('DELETE FROM network_support WHERE stored < ?', (now - SUPPORT_TTL,))
+
+        count = self._db.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        if count > self.max_entries:
+            self._db.execute(
+                'DELETE FROM responses WHERE rowid IN '
+                '(SELECT rowid FROM responses ORDER BY accessed LIMIT ?)', (count - self.max_entries,)
+            )
+
+    def commit(self):
+        self._db.commit()
+        self._pending = 0
+
+    @contextlib.contextmanager
+    def released(self):
+        '''
+        commit and close the connection for the duration of the block so other processes (--workers) can write to
+        the file without waiting on a write this connection has not committed yet, then reopen it
+        '''
+        self.commit()
+        self._db.close()
+        try:
+            yield self
+        finally:
+            self._db = self._connect()
+            # the other processes may have learned more unsupported productTypes
+            self._unsupported_rules = None
+
+    def close(self):
+        self.evict()
+        self.commit()
+        self._db.close()
@@ -1,15 +1,27 @@
-
-import json
 import csv
+import sys
+import json
+import contextlib
 import datetime
 import pathlib
-from pprint import pprint
 
-import meraki
 import click
-from merakisnmp.async_code import async_orgsnmp
-from merakisnmp.async_code import async_getorgnetworks
-from merakisnmp.async_code import async_networksnmp
+from merakisnmp import budget
+from merakisnmp import cache
+from merakisnmp import delta
+from merakisnmp import jobs
+from merakisnmp import journal
+from merakisnmp import keypool
+from merakisnmp import metrics
+from merakisnmp import orgfilter
+from merakisnmp import plan
+from merakisnmp import profiling
+from merakisnmp import store
+from merakisnmp import templates
+from merakisnmp import writers
+
+# NOTE: meraki (and the async modules that import it and tqdm) are imported inside the functions that call the API
+# so --help, shell completion and argument errors do not pay for loading the SDK
 
 __author__ = 'Zach Brewer'
 __email__ = 'zbrewer@cisco.com'
@@ -24,102 +36,175 @@ For help on a specific command:
 orgsnmp.py [CMD] -h
 '''
 
-# setup our path for results and create dir if it does not exist
+# setup our path for results, dirs are created when results are written
 cwd = pathlib.Path().absolute()
 org_reports_dir = str(cwd) + '/orgsnmp_results'
-pathlib.Path(org_reports_dir).mkdir(parents=True, exist_ok=True)
 
 network_reports_dir = str(cwd) + '/networksnmp_results'
-pathlib.Path(network_reports_dir).mkdir(parents=True, exist_ok=True)
 
-def return_orgs(apikey, debug):
+stats_dir = str(cwd) + '/stats_results'
+
+watch_dir = str(cwd) + '/watch_results'
+
+# run-jobs writes each job's results to its own dir under here unless the job spec names one
+jobs_dir = str(cwd) + '/jobs_results'
+
+# results store written with --store and read by the query command
+store_path = str(cwd) + '/snmp_results.sqlite3'
+
+# default minutes between watch polls
+watch_interval = 60
+
+# default seconds any one API request may take (async_scheduler.REQUEST_TIMEOUT)
+request_timeout = 60
+
+# unfinished work reports written when --time-budget is reached
+unfinished_dir = str(cwd) + '/unfinished_results'
+
+# failure reports for orgs with failed calls
+failures_dir = str(cwd) + '/failure_reports'
+
+# stage profiles written with --profile
+profile_dir = str(cwd) + '/profile_results'
+
+# run plans written with --plan
+plan_dir = str(cwd) + '/plan_results'
+
+# default consecutive failures before an org's calls are skipped (async_breaker.FAILURE_THRESHOLD)
+max_org_failures = 3
+
+# response cache shared by every subcommand (see cache.py for TTLs)
+cache_path = str(cwd) + '/merakisnmp_cache/responses.sqlite3'
+
+# checkpoint journal of completed calls, replayed by --resume
+journal_path = str(cwd) + '/merakisnmp_cache/run_journal.ndjson'
+
+def get_cache(ctx):
+    '''
+    open the response cache on first use (unless --no-cache was passed) and close it when the command finishes
+    '''
+    if ctx.obj['no_cache']:
+        return None
+
+    if ctx.obj.get('cache') is None:
+        ctx.obj['cache'] = cache.ResponseCache(cache_path, refresh=ctx.obj['refresh_value'])
+        ctx.call_on_close(ctx.obj['cache'].close)
+
+    return ctx.obj['cache']
+
+def get_profiler(ctx):
+    '''
+    start the stage profiler on first use (if --profile was passed), the report is written when the command finishes
+    '''
+    if not ctx.obj['profile_value']:
+        return None
+
+    if ctx.obj.get('profiler') is None:
+        ctx.obj['profiler'] = profiling.StageProfiler()
+        ctx.call_on_close(lambda: ctx.obj['profiler'].write(profile_dir))
+
+    return ctx.obj['profiler']
+
+def fetch_orgs(apikeys, debug, response_cache=None):
     """
-    setup meraki api session and return all orgs (syncronous call because there is no benefit in making getOrganizations() async)
+    all orgs for each API key, returns {api key: orgs, or the exception raised listing them}
+    keys that are not cached are listed at once over the shared async transport the snmp calls reuse afterwards
     """
-    if debug:
-        api_session = meraki.DashboardAPI(
-        api_key=apikey,
-        base_url='https://api.meraki.com/api/v1/',
-        output_log=True,
-        print_console=True,
-        suppress_logging=False,
-        )
-    else:
-        api_session = meraki.DashboardAPI(
-        api_key=apikey,
-        base_url='https://api.meraki.com/api/v1/',
-        output_log=False,
-        print_console=False,
-        suppress_logging=True,
-        )
+    from merakisnmp.async_code import async_pipeline
 
-    try:
-        all_orgs = api_session.organizations.getOrganizations()
-        return all_orgs
+    all_orgs = {}
+    if response_cache:
+        for apikey in apikeys:
+            cached = response_cache.get('getOrganizations', cache.apikey_scope(apikey))
+            if cached is not None:
+                all_orgs[apikey] = cached
 
-    except meraki.exceptions.APIError as e:
-        print(f'Meraki API ERROR: {e}\n')
-        exit(0)
+    missing = [apikey for apikey in apikeys if apikey not in all_orgs]
+    if missing:
+        for apikey, orgs in async_pipeline.async_get_orgs(missing, debug_app=debug).items():
+            all_orgs[apikey] = orgs
+            if response_cache and not isinstance(orgs, BaseException):
+                response_cache.set('getOrganizations', cache.apikey_scope(apikey), orgs)
+
+    return {apikey: all_orgs[apikey] for apikey in apikeys}
 
-    except Exception as e:
-        print(f'Non Meraki-SDK ERROR: {e}')
+def return_orgs(apikey, debug, response_cache=None):
+    """
+    return all orgs for the API key, exits on errors
+    """
+    from merakisnmp.async_code import async_scheduler
+
+    all_orgs = fetch_orgs([apikey], debug, response_cache)[apikey]
+    if isinstance(all_orgs, async_scheduler.API_ERRORS):
+        print(f'Meraki API ERROR: {all_orgs}\n')
         exit(0)
 
-def clean_orgs(all_orgs, org_names=None, org_ids=None):
-    cleaned_orgs = []
+    elif isinstance(all_orgs, BaseException):
+        print(f'Non Meraki-SDK ERROR: {all_orgs}')
+        exit(0)
 
-    if org_ids:
-        cleaned_ids = []
-        for org_id in org_ids:
-            if type(org_id) != 'string':
-                str(org_id)
-            
-            cleaned = org_id.strip()
-            cleaned_ids.append(cleaned)
-        
-        for org in all_orgs:
-            if org['id'] in org_ids:
-                clean_orgs.append(org)
-        return cleaned_orgs
-    
-    elif org_names:
-        user_orgs = [x.strip().lower() for x in org_names]
+    return all_orgs
 
-        cleaned_orgs = []
-        for org in all_orgs:
-            if org['name'].lower() in user_orgs:
-                cleaned_orgs.append(org)
+def close_transport():
+    '''
+    close the shared API transport's connections if this command opened any
+    '''
+    if 'merakisnmp.async_code.async_transport' in sys.modules:
+        sys.modules['merakisnmp.async_code.async_transport'].close_default_transport()
 
-        if cleaned_orgs:
-            return cleaned_orgs
-    else:
-        click.secho(click.style('Must provide either org_names or org_ids.\n \n', fg='red', bold=True))
+def get_orgs(ctx, apikey):
+    '''
+    all orgs the API key can access, or with a key pool (--apikeys-file or MERAKI_API_KEYS) every org any key in the pool can access
+    '''
+    ctx.call_on_close(close_transport)
+    profiler = get_profiler(ctx)
+    if profiler:
+        # load the SDK first so the profile covers the run rather than imports (see benchmarks/bench_startup.py)
+        from merakisnmp.async_code import async_pipeline
 
-def write_csv(csv_data, current_time, output_dir):
-    keys = csv_data[0].keys()
+    with profiling.collecting(profiler), profiling.stage(profiler, 'org_listing'):
+        all_orgs = list_orgs(ctx, apikey)
 
-    f_name = 'snmp_settings_' + str(current_time) + '.csv'
-    write_path = pathlib.Path(output_dir) / f_name
+    if profiler:
+        profiler.snapshot('org_listing')
+    return all_orgs
 
-    with open(write_path, 'w', newline='') as output_file:
-        dict_writer = csv.DictWriter(output_file, keys)
-        dict_writer.writeheader()
-        dict_writer.writerows(csv_data)
+def list_orgs(ctx, apikey):
+    '''
+    get_orgs without the profiling
+    '''
+    pool_keys = keypool.load_keys(ctx.obj['apikeys_file'])
+    if not pool_keys:
+        return return_orgs(apikey=apikey, debug=ctx.obj['debug_value'], response_cache=get_cache(ctx))
+
+    # discover which orgs each key can access, keys that fail are left out of the pool
+    key_pool = keypool.KeyPool()
+    for key, orgs in fetch_orgs(list(dict.fromkeys([apikey, *pool_keys])), ctx.obj['debug_value'], get_cache(ctx)).items():
+        if isinstance(orgs, BaseException):
+            click.secho(click.style(f'API key {keypool.key_label(key)} skipped: {orgs}', fg='yellow', bold=True))
+        else:
+            key_pool.add(key, orgs)
+
+    if not key_pool.keys:
+        click.secho(click.style('\nNone of the API keys could list organizations.\n \n', fg='red', bold=True))
+        exit(0)
 
-    click.secho(
-        f'snmp settings CSV results written to file: { write_path }', fg='green'
-        )
+    click.secho(click.style(f'\n{len(key_pool.keys)} API keys can access {len(key_pool.orgs)} organizations.\n \n', fg='green', bold=True))
+    ctx.obj['key_pool'] = key_pool
+    return key_pool.orgs
 
-def write_json(json_data, current_time, output_dir):
-    f_name = 'snmp_settings_' + str(current_time) + '.json'
-    write_path = pathlib.Path(output_dir) / f_name
+def clean_orgs(all_orgs, org_names=None, org_ids=None, **filters):
+    '''
+    select orgs by ID (takes precedence) or name and apply any other orgfilter.OrgFilter criteria (contains, begins, regex, glob, exclude)
+    '''
+    if not org_ids and not org_names:
+        click.secho(click.style('Must provide either org_names or org_ids.\n \n', fg='red', bold=True))
+        return []
 
-    with open(write_path, 'w') as outfile:
-        outfile.write(json.dumps(json_data, indent=4))
+    if org_ids:
+        return orgfilter.filter_orgs(all_orgs, org_ids=org_ids, **filters)
 
-    click.secho(
-        f'snmp settings JSON results written to file: { write_path }', fg='green'
-        )
+    return orgfilter.filter_orgs(all_orgs, org_names=org_names, **filters)
 
 def read_csv(filename):
     try:
@@ -172,19 +257,304 @@ def read_csv(filename):
         if e.errno == 2:
             click.secho(click.style(f'could not find the file "{filename}" in the directory "{cwd}". Verify the path and file name.\n \n', fg='red', bold=True))
 
+def plan_snmp_settings(ctx, apikey, filtered_orgs, get_networks, delta_run=None, workers=1):
+    '''
+    estimate the requests and run time for the filtered orgs (--plan) instead of getting their snmp settings
+    network lists are read from the response cache or listed now (and cached for the run), no snmp calls are made
+    '''
+    from merakisnmp.async_code import async_pipeline
+
+    response_cache = get_cache(ctx)
+    network_orgs = [organization for organization in filtered_orgs if plan.wants_networks(get_networks, organization)]
+    org_networks = {}
+    if network_orgs:
+        click.secho(click.style(f'\nListing networks for {len(network_orgs)} organizations to plan the run (cached listings are reused).\n \n', fg='green', bold=True))
+        org_networks = async_pipeline.async_list_networks(
+            apikey, network_orgs, debug_app=ctx.obj['debug_value'], cache=response_cache,
+            key_pool=ctx.obj.get('key_pool'), request_timeout=ctx.obj['request_timeout'])
+
+    # orgs that could not be listed are estimated from earlier runs
+    counts = budget.network_counts(response_cache, delta_run.previous if delta_run else None)
+    template_samples = ctx.obj['template_samples'] if ctx.obj['collapse_templates'] else None
+    run_plan = plan.RunPlan(response_cache, delta_run, metrics.load_latencies(stats_dir), template_samples)
+    for organization in filtered_orgs:
+        org_id = str(organization['id'])
+        run_plan.add(organization, get_networks, networks=org_networks.get(org_id), network_count=counts.get(org_id))
+
+    time_budget = ctx.obj['time_budget'] * 60 if ctx.obj['time_budget'] else None
+    run_plan.write(str(datetime.datetime.now()), plan_dir, workers=workers, time_budget=time_budget)
+
+def get_snmp_settings(ctx, apikey, filtered_orgs, router=None):
+    '''
+    get org snmp (and network snmp if the networks flag is set) for the filtered orgs in one async session and write the results
+    with a jobs.JobRouter (run-jobs) the router's orgs are fetched and each job's own files are written instead
+    '''
+    from merakisnmp import sharding
+    from merakisnmp.async_code import async_breaker
+    from merakisnmp.async_code import async_pipeline
+
+    if router:
+        filtered_orgs = router.organizations
+        get_networks = router.network_org_ids
+    else:
+        get_networks = ctx.obj['network_value']
+        if get_networks:
+            click.secho(click.style('\nNetwork flag set, getting org and network snmp settings for organizations.\n \n', fg='green', bold=True))
+
+    delta_run = None
+    previous = None
+    if ctx.obj['delta_value']:
+        if router:
+            click.secho(click.style('\nDelta flag ignored, it does not apply to run-jobs.\n \n', fg='yellow', bold=True))
+        elif get_networks:
+            previous, previous_fetched = delta.load_previous(network_reports_dir)
+            click.secho(click.style(f'\nDelta flag set, {len(previous)} network results loaded from the previous run.\n \n', fg='green', bold=True))
+            delta_run = delta.DeltaRun(previous, previous_fetched, stale_hours=ctx.obj['stale_hours'])
+        else:
+            click.secho(click.style('\nDelta flag ignored, it only applies to network snmp (-n).\n \n', fg='yellow', bold=True))
+
+    workers = ctx.obj['workers']
+    if workers > 1 and (delta_run or ctx.obj['resume_value'] or ctx.obj['profile_value']):
+        click.secho(click.style('\n--workers is not supported with --delta, --resume or --profile, running in a single process.\n \n', fg='yellow', bold=True))
+        workers = 1
+
+    if ctx.obj['plan_value']:
+        click.secho(click.style('\nPlan flag set, estimating the run without getting snmp settings.\n \n', fg='green', bold=True))
+        plan_snmp_settings(ctx, apikey, filtered_orgs, get_networks, delta_run, workers)
+        return
+
+    profiler = get_profiler(ctx)
+
+    run_metrics = metrics.MetricsCollector() if ctx.obj['stats_value'] else None
+
+    # largest orgs (by network counts from earlier runs) first so the biggest org does not start last
+    if get_networks:
+        filtered_orgs = budget.largest_first(filtered_orgs, budget.network_counts(get_cache(ctx), previous))
+
+    # orgs that keep failing are skipped for the rest of the run (--max-org-failures 0 keeps calling them)
+    breaker = async_breaker.CircuitBreaker(ctx.obj['max_org_failures'])
+
+    # bound networks of one config template are sampled rather than each queried (--collapse-templates)
+    collapse = None
+    if ctx.obj['collapse_templates'] and get_networks:
+        collapse = templates.TemplateCollapse(ctx.obj['template_samples'])
+        click.secho(click.style(f'\nCollapse templates flag set, {collapse.samples} networks are queried per config template group.\n \n', fg='green', bold=True))
+
+    # the journal is only resumed by a run of the same orgs with the same network and template options,
+    # worker processes do not journal so a --workers run leaves the journal of an earlier run alone
+    run_journal = None
+    if workers == 1:
+        run_journal = journal.RunJournal(journal_path, resume=ctx.obj['resume_value'], header=journal.run_header(
+            filtered_orgs, get_networks, template_samples=collapse.samples if collapse else None))
+        if run_journal.discarded:
+            click.secho(click.style('\nResume flag ignored, the journal is from a run with different organizations or options, starting over.\n \n', fg='yellow', bold=True))
+        elif ctx.obj['resume_value']:
+            click.secho(click.style(f'\nResume flag set, {run_journal.completed()} completed calls loaded from the journal.\n \n', fg='green', bold=True))
+
+    run_budget = None
+    if ctx.obj['time_budget']:
+        run_budget = budget.RunBudget(ctx.obj['time_budget'] * 60)
+        click.secho(click.style(f'\nTime budget set, the run stops after {ctx.obj["time_budget"]:g} minutes.\n \n', fg='green', bold=True))
+
+    # json (or ndjson) and csv results are written as each call completes
+    ct = str(datetime.datetime.now())
+    output_format = ctx.obj['output_format']
+    writer_options = {'compress': ctx.obj['compress_value'], 'partition': ctx.obj['partition_value']}
+    try:
+        with contextlib.ExitStack() as outputs:
+            if router:
+                outputs.enter_context(router.open(ct, **writer_options))
+                write_org = router.write_org
+                write_network = router.write_network
+            else:
+                org_writer = outputs.enter_context(writers.open_writer(org_reports_dir, ct, output_format, **writer_options))
+                write_org = org_writer.write
+                write_network = None
+                if get_networks:
+                    network_writer = outputs.enter_context(writers.open_writer(network_reports_dir, ct, output_format, **writer_options))
+                    write_network = network_writer.write
+
+            if profiler:
+                # with --profile the files are written in line so the output stage is profiled
+                write_org = profiler.wrap('output', write_org)
+                if write_network:
+                    write_network = profiler.wrap('output', write_network)
+            else:
+                # the writer thread is closed (and drained) before the files are
+                background = outputs.enter_context(writers.BackgroundWriter())
+                write_org = background.wrap(write_org)
+                if write_network:
+                    write_network = background.wrap(write_network)
+
+            # with --store every record also goes to the results store
+            if ctx.obj['store_value']:
+                result_store = outputs.enter_context(store.ResultStore(store_path))
+                click.secho(click.style(f'\nStore flag set, results are also stored as run {result_store.start_run(ct)} in {store_path}\n \n', fg='green', bold=True))
+                write_org = writers.tee(write_org, result_store.write_org)
+                if get_networks:
+                    write_network = writers.tee(write_network, result_store.write_network)
+
+            if workers > 1:
+                # orgs are split across worker processes, the parent writes every worker's records (never with --profile)
+                click.secho(click.style(f'\nRunning {len(filtered_orgs)} organizations across {workers} worker processes.\n \n', fg='green', bold=True))
+                # the workers write to the cache file themselves, this process lets go of it until they are done
+                response_cache = get_cache(ctx)
+                with response_cache.released() if response_cache else contextlib.nullcontext():
+                    sharding.sharded_get_snmp(
+                        api_key=apikey, organizations=filtered_orgs, workers=workers, get_networks=get_networks,
+                        debug_app=ctx.obj['debug_value'], cache_path=None if ctx.obj['no_cache'] else cache_path,
+                        refresh=ctx.obj['refresh_value'], metrics=run_metrics, write_org=write_org,
+                        write_network=write_network, key_pool=ctx.obj.get('key_pool'),
+                        request_timeout=ctx.obj['request_timeout'], budget=run_budget, breaker=breaker, templates=collapse)
+            else:
+                with profiling.collecting(profiler):
+                    async_pipeline.async_get_snmp(
+                        api_key=apikey, organizations=filtered_orgs, get_networks=get_networks, debug_app=ctx.obj['debug_value'],
+                        cache=get_cache(ctx), delta=delta_run, journal=run_journal, metrics=run_metrics,
+                        write_org=write_org, write_network=write_network, key_pool=ctx.obj.get('key_pool'),
+                        request_timeout=ctx.obj['request_timeout'], budget=run_budget, breaker=breaker, profiler=profiler,
+                        templates=collapse)
+
+            if profiler:
+                profiler.snapshot('snmp_calls')
+                # closing the result files writes the csv files out, that is timed as output too
+                with profiler.collecting(), profiler.stage('output'):
+                    outputs.close()
+                profiler.snapshot('output')
+
+    except KeyboardInterrupt:
+        # only a journaled run can be picked up with --resume
+        resume_hint = ' Run the same command with --resume to pick up where it stopped.' if run_journal else ''
+        click.secho(click.style(f'\nRun interrupted, partial results were written.{resume_hint}\n', fg='yellow', bold=True))
+        exit(1)
+
+    except sharding.WorkerError as e:
+        # the result files were closed (and the csv written) when the with block exited
+        click.secho(click.style(f'\nWorker process failed, partial results were written: {e}\n', fg='red', bold=True))
+        exit(1)
+
+    finally:
+        if run_journal:
+            run_journal.close()
+        if run_metrics:
+            run_metrics.write(current_time=ct, output_dir=stats_dir)
+        breaker.write(filtered_orgs, current_time=ct, output_dir=failures_dir)
+
+    if collapse:
+        collapse.report()
+
+    if run_budget and run_budget.expired:
+        run_budget.write(current_time=ct, output_dir=unfinished_dir)
+        budget_hint = ' Run the same command with --resume to finish the unfinished work.' if run_journal else ''
+        click.secho(click.style(f'\nTime budget reached, partial results were written.{budget_hint}\n', fg='yellow', bold=True))
+        # a partial run would report every network it did not reach as removed
+        delta_run = None
+
+    if delta_run:
+        delta_run.write(current_time=ct, output_dir=network_reports_dir)
+
 # begin command group snmp_settings
 ignore_option_case = dict(token_normalize_func=lambda x: x.lower())
 @click.group(context_settings=ignore_option_case)
 @click.pass_context
 @click.option('-n', '--networks', is_flag=True, help='Flag to also get network level snmp for given orgs')
 @click.option('-d', '--debug', is_flag=True, help='Flag for debug')
-def snmp_settings(ctx, networks, debug):
+@click.option('-r', '--refresh', is_flag=True, help='Flag to ignore cached API responses and re-fetch everything (the cache is still updated)')
+@click.option('--no-cache', is_flag=True, help='Flag to neither read nor write the local API response cache')
+@click.option('--delta', 'delta_mode', is_flag=True, help='Flag to only re-query networks that are new or stale since the last run and write a change report (requires -n)')
+@click.option(
+            '--stale-hours',
+            type=float,
+            default=delta.DEFAULT_STALE_HOURS,
+            show_default=True,
+            metavar='[HOURS]',
+            help='With --delta, network results older than this are queried again.'
+            )
+@click.option(
+            '--output-format',
+            type=click.Choice(writers.OUTPUT_FORMATS, case_sensitive=False),
+            default='json',
+            show_default=True,
+            help='Format of the results file written alongside the CSV (ndjson writes one record per line).'
+            )
+@click.option('--compress', is_flag=True, help='Flag to gzip the result files (.csv.gz, .json.gz, .ndjson.gz)')
+@click.option('--partition-by-org', 'partition_by_org', is_flag=True, help='Flag to write a directory of result files per run with one file per organization')
+@click.option('--resume', is_flag=True, help='Flag to resume an interrupted run, calls that completed in the previous run are not made again')
+@click.option('--stats', is_flag=True, help='Flag to write per endpoint and per org request, latency, 429, retry and error stats (JSON and Prometheus textfile)')
+@click.option(
+            '--workers',
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            metavar='[N]',
+            help='Split the organizations across N worker processes (not combined with --delta or --resume).'
+            )
+@click.option(
+            '--request-timeout',
+            type=click.FloatRange(min=1),
+            default=request_timeout,
+            show_default=True,
+            metavar='[SECONDS]',
+            help='Seconds any one API request may take before it is abandoned (retried up to the SDK retry limit).'
+            )
+@click.option(
+            '--time-budget',
+            type=click.FloatRange(min=0, min_open=True),
+            metavar='[MINUTES]',
+            help='Stop the run after this many minutes, results so far are written and the calls not made are listed in an unfinished work report.'
+            )
+@click.option(
+            '--max-org-failures',
+            type=click.IntRange(min=0),
+            default=max_org_failures,
+            show_default=True,
+            metavar='[N]',
+            help='Skip the rest of an organization\'s calls after N consecutive auth, server or timeout errors (0 to never skip).'
+            )
+@click.option('--collapse-templates', is_flag=True, help='Flag to query a few networks per config template and give the rest of the template\'s bound networks their settings when the samples match (requires -n)')
+@click.option(
+            '--template-samples',
+            type=click.IntRange(min=1),
+            default=templates.SAMPLES,
+            show_default=True,
+            metavar='[N]',
+            help='With --collapse-templates, networks queried per config template group.'
+            )
+@click.option('--plan', 'plan_run', is_flag=True, help='Flag to estimate request counts, unsupported network skips and run time for the selected organizations without getting snmp settings')
+@click.option('--profile', is_flag=True, help='Flag to time each stage and write a cProfile and tracemalloc report (slows the run down)')
+@click.option('--store', 'store_results', is_flag=True, help='Flag to also write results to the SQLite results store read by the query command')
+@click.option(
+            '--apikeys-file',
+            type=click.Path(exists=True, dir_okay=False),
+            metavar='[FILE]',
+            help=f'File of additional API keys (one per line) to pool with --apikey, keys in the {keypool.ENV_VAR} environment variable are pooled as well.'
+            )
+def snmp_settings(ctx, networks, debug, refresh, no_cache, delta_mode, stale_hours, output_format, compress, partition_by_org, resume, stats, workers, request_timeout, time_budget, max_org_failures, collapse_templates, template_samples, plan_run, profile, store_results, apikeys_file):
     '''
     For detailed help for a subcomand use orgsnmp.py [CMD] --help
     '''
     ctx.ensure_object(dict)
     ctx.obj['debug_value'] = debug
     ctx.obj['network_value'] = networks
+    ctx.obj['refresh_value'] = refresh
+    ctx.obj['no_cache'] = no_cache
+    ctx.obj['delta_value'] = delta_mode
+    ctx.obj['stale_hours'] = stale_hours
+    ctx.obj['output_format'] = output_format.lower()
+    ctx.obj['compress_value'] = compress
+    ctx.obj['partition_value'] = partition_by_org
+    ctx.obj['resume_value'] = resume
+    ctx.obj['stats_value'] = stats
+    ctx.obj['workers'] = workers
+    ctx.obj['request_timeout'] = request_timeout
+    ctx.obj['time_budget'] = time_budget
+    ctx.obj['max_org_failures'] = max_org_failures
+    ctx.obj['collapse_templates'] = collapse_templates
+    ctx.obj['template_samples'] = template_samples
+    ctx.obj['plan_value'] = plan_run
+    ctx.obj['profile_value'] = profile
+    ctx.obj['apikeys_file'] = apikeys_file
+    ctx.obj['store_value'] = store_results
 
 # snmp_settings command group: orgs-cli command
 @snmp_settings.command()
@@ -205,31 +575,17 @@ def orgs_cli(ctx, apikey, orgnames):
     '''
 
     click.secho(click.style('\nGetting all organizations...\n \n', fg='green', bold=True))
-    all_orgs = return_orgs(apikey=apikey, debug=ctx.obj['debug_value'])
+    all_orgs = get_orgs(ctx, apikey)
 
     filtered_orgs = clean_orgs(all_orgs=all_orgs, org_names=orgnames)
     click.secho(click.style('\nGetting snmp settings for the following organizations:\n \n', fg='green', bold=True))
     for org in filtered_orgs:
         click.secho(click.style(f'{org["name"]}', fg='green', bold=True))
     if click.confirm(f'\nIf one or more of the org names are not present, please double check spelling. Organization names with spaces must have quotes around the name on the CLI. Continue?'):
-        org_snmp_settings = async_orgsnmp.async_get_snmp(api_key=apikey, organizations=filtered_orgs, debug_app=ctx.obj['debug_value'])
+        get_snmp_settings(ctx, apikey, filtered_orgs)
 
     else:
         exit(0)
-    
-    # write json and csv results
-    ct = str(datetime.datetime.now())
-    write_json(json_data=org_snmp_settings, current_time=ct, output_dir=org_reports_dir)
-    write_csv(csv_data=org_snmp_settings, current_time=ct, output_dir=org_reports_dir)
-
-    # check for networks flag to get network level snmp settings
-    if ctx.obj['network_value']:
-        click.secho(click.style('\nNetwork flag set, getting networks for organizations.\n \n', fg='green', bold=True))
-        all_orgnetworks = async_getorgnetworks.asyncget_networks(api_key=apikey, organizations=filtered_orgs, debug_app=ctx.obj['debug_value'])
-        network_snmp_settings = async_networksnmp.async_get_snmp(api_key=apikey, networks=all_orgnetworks, debug_app=ctx.obj['debug_value'])
-
-        write_json(json_data=network_snmp_settings, current_time=ct, output_dir=network_reports_dir)
-        write_csv(csv_data=network_snmp_settings, current_time=ct, output_dir=network_reports_dir)
 
 # snmp_settings command group: all-orgs command
 @snmp_settings.command()
@@ -257,66 +613,53 @@ def orgs_cli(ctx, apikey, orgnames):
             required=False,  
             help='A filter to perform on any organization names that BEGIN WITH the given string (case ignored).'
             )
-def all_orgs(ctx, apikey, containsfilter, beginfilter):
+@click.option(
+            '-rf',
+            '--regexfilter',
+            metavar='[REGEX]',
+            required=False,
+            help='A filter on organization names that MATCH the given regular expression (case ignored).'
+            )
+@click.option(
+            '-gf',
+            '--globfilter',
+            metavar='[PATTERN]',
+            required=False,
+            help='A filter on organization names that match the given wildcard pattern e.g. "acme*store?" (case ignored).'
+            )
+@click.option(
+            '-xf',
+            '--excludefilter',
+            metavar='[PATTERN OR ORGID]',
+            multiple=True,
+            required=False,
+            help='Exclude organizations whose name matches the wildcard pattern or whose ID is given (case ignored, may be repeated).'
+            )
+def all_orgs(ctx, apikey, containsfilter, beginfilter, regexfilter, globfilter, excludefilter):
     '''
     Get snmp settings for all organizaitons the API key has access to (run "all-orgs --help" for org filters) 
     '''
 
     click.secho(click.style('\nGetting all organizations...\n \n', fg='green', bold=True))
-    all_orgs = return_orgs(apikey=apikey, debug=ctx.obj['debug_value'])
+    all_orgs = get_orgs(ctx, apikey)
 
     # begin filter option conditionals
     if containsfilter and beginfilter:
         click.secho(click.style('\nYou have provided both contains and begin filters ("-cf" and "-bf").  Note that the contains filter runs FIRST and the begins with filter runs SECOND.\n', fg='yellow', bold=True))
         click.pause()
 
-        contains_filter_orgs = []
-        filtered_orgs = []
-        for org in all_orgs:
-            if containsfilter.lower() in org['name'].lower():
-                contains_filter_orgs.append(org)
-        
-        for org in contains_filter_orgs:
-            if org['name'].lower().startswith(beginfilter.lower()):
-                filtered_orgs.append(org)
-
-    elif containsfilter:
-        filtered_orgs = []
-        for org in all_orgs:
-            if containsfilter.lower() in org['name'].lower():
-                filtered_orgs.append(org)
-
-    elif beginfilter:
-        filtered_orgs = []
-        for org in all_orgs:
-            if org['name'].lower().startswith(beginfilter.lower()):
-                filtered_orgs.append(org)
-    else:
-        filtered_orgs = all_orgs
+    filtered_orgs = orgfilter.filter_orgs(
+        all_orgs, contains=containsfilter, begins=beginfilter, regex=regexfilter, glob=globfilter, exclude=excludefilter)
 
         
     click.secho(click.style('\nGetting snmp settings for the following organizations:\n \n', fg='green', bold=True))
     for org in filtered_orgs:
         click.secho(click.style(f'{org["name"]}', fg='green', bold=True))
     if click.confirm(f'\nIf one or more expected orgs are not present, please verify the contains filter (-cf) and beginsfilter (-bf) options. Continue?'):
-        org_snmp_settings = async_orgsnmp.async_get_snmp(api_key=apikey, organizations=filtered_orgs, debug_app=ctx.obj['debug_value'])
+        get_snmp_settings(ctx, apikey, filtered_orgs)
 
     else:
         exit(0)
-    
-    # write json and csv results
-    ct = str(datetime.datetime.now())
-    write_json(json_data=org_snmp_settings, current_time=ct, output_dir=org_reports_dir)
-    write_csv(csv_data=org_snmp_settings, current_time=ct, output_dir=org_reports_dir)
-
-    # check for networks flag to get network level snmp settings
-    if ctx.obj['network_value']:
-        click.secho(click.style('\nNetwork flag set, getting networks for organizations.\n \n', fg='green', bold=True))
-        all_orgnetworks = async_getorgnetworks.asyncget_networks(api_key=apikey, organizations=filtered_orgs, debug_app=ctx.obj['debug_value'])
-        network_snmp_settings = async_networksnmp.async_get_snmp(api_key=apikey, networks=all_orgnetworks, debug_app=ctx.obj['debug_value'])
-
-        write_json(json_data=network_snmp_settings, current_time=ct, output_dir=network_reports_dir)
-        write_csv(csv_data=network_snmp_settings, current_time=ct, output_dir=network_reports_dir)
 
 # snmp_settings command group: orgs-file command
 @snmp_settings.command()
@@ -351,58 +694,45 @@ def all_orgs(ctx, apikey, containsfilter, beginfilter):
             required=False,  
             help='A filter to perform on any organization names that BEGIN WITH the given string (case ignored).'
             )
-
-def orgs_file(ctx, apikey, orgfile, containsfilter, beginfilter):
+@click.option(
+            '-rf',
+            '--regexfilter',
+            metavar='[REGEX]',
+            required=False,
+            help='A filter on organization names that MATCH the given regular expression (case ignored).'
+            )
+@click.option(
+            '-gf',
+            '--globfilter',
+            metavar='[PATTERN]',
+            required=False,
+            help='A filter on organization names that match the given wildcard pattern e.g. "acme*store?" (case ignored).'
+            )
+@click.option(
+            '-xf',
+            '--excludefilter',
+            metavar='[PATTERN OR ORGID]',
+            multiple=True,
+            required=False,
+            help='Exclude organizations whose name matches the wildcard pattern or whose ID is given (case ignored, may be repeated).'
+            )
+def orgs_file(ctx, apikey, orgfile, containsfilter, beginfilter, regexfilter, globfilter, excludefilter):
     '''
     Get snmp settings for all organizaitons by org ID or org Name in a csv file (run "orgs-file --help" for org filters) 
     '''
     click.secho(click.style('\nGetting all organizations...\n \n', fg='green', bold=True))
-    all_orgs = return_orgs(apikey=apikey, debug=ctx.obj['debug_value'])
+    all_orgs = get_orgs(ctx, apikey)
     orgs_dict = read_csv(filename=orgfile)
 
-    csv_orgs = []
-    if orgs_dict['orgids']:
-        #remove duplicates and strip leading/trailing spaces
-        orgids_stripped = set([x.strip() for x in orgs_dict['orgids']])
-        for org in all_orgs:
-            if org['id'] in orgids_stripped:
-                csv_orgs.append(org)
-
-    elif orgs_dict['orgnames']:
-        #remove duplicates and strip leading/trailing spaces
-        orgnames_stripped = set([x.strip().lower() for x in orgs_dict['orgnames']])
-        for org in all_orgs:
-            if org['name'].lower() in orgnames_stripped:
-                csv_orgs.append(org)
-
     # begin filter option conditionals
     if containsfilter and beginfilter:
         click.secho(click.style('\nYou have provided both contains and begin filters ("-cf" and "-bf").  Note that the contains filter runs FIRST and the begins with filter runs SECOND.\n', fg='yellow', bold=True))
         click.pause()
 
-        contains_filter_orgs = []
-        filtered_orgs = []
-        for org in csv_orgs:
-            if containsfilter.lower() in org['name'].lower():
-                contains_filter_orgs.append(org)
-        
-        for org in contains_filter_orgs:
-            if org['name'].lower().startswith(beginfilter.lower()):
-                filtered_orgs.append(org)
-
-    elif containsfilter:
-        filtered_orgs = []
-        for org in csv_orgs:
-            if containsfilter.lower() in org['name'].lower():
-                filtered_orgs.append(org)
-
-    elif beginfilter:
-        filtered_orgs = []
-        for org in csv_orgs:
-            if org['name'].lower().startswith(beginfilter.lower()):
-                filtered_orgs.append(org)
-    else:
-        filtered_orgs = csv_orgs
+    # org IDs take precedence over org names if the file has both
+    filtered_orgs = clean_orgs(
+        all_orgs, org_names=orgs_dict['orgnames'], org_ids=orgs_dict['orgids'],
+        contains=containsfilter, begins=beginfilter, regex=regexfilter, glob=globfilter, exclude=excludefilter)
 
         
     click.secho(click.style('\nGetting snmp settings for the following organizations:\n \n', fg='green', bold=True))
@@ -410,24 +740,215 @@ def orgs_file(ctx, apikey, orgfile, containsfilter, beginfilter):
         click.secho(click.style(f'{org["name"]}', fg='green', bold=True))
 
     if click.confirm(f'\nIf one or more expected orgs are not present, please verify the contains filter (-cf) and beginsfilter (-bf) options. Continue?'):
-        org_snmp_settings = async_orgsnmp.async_get_snmp(api_key=apikey, organizations=filtered_orgs, debug_app=ctx.obj['debug_value'])
+        get_snmp_settings(ctx, apikey, filtered_orgs)
 
     else:
         exit(0)
-    
-    # write json and csv results
-    ct = str(datetime.datetime.now())
-    write_json(json_data=org_snmp_settings, current_time=ct, output_dir=org_reports_dir)
-    write_csv(csv_data=org_snmp_settings, current_time=ct, output_dir=org_reports_dir)
 
-    # check for networks flag to get network level snmp settings
-    if ctx.obj['network_value']:
-        click.secho(click.style('\nNetwork flag set, getting networks for organizations.\n \n', fg='green', bold=True))
-        all_orgnetworks = async_getorgnetworks.asyncget_networks(api_key=apikey, organizations=filtered_orgs, debug_app=ctx.obj['debug_value'])
-        network_snmp_settings = async_networksnmp.async_get_snmp(api_key=apikey, networks=all_orgnetworks, debug_app=ctx.obj['debug_value'])
+# snmp_settings command group: run-jobs command
+@snmp_settings.command('run-jobs')
+@click.pass_context
+@click.option(
+    '-k',
+    '--apikey',
+    prompt=True,
+    hide_input=True,
+    required=True,
+    metavar='[APIKEY]',
+    help='API key with access to one or more organizations.',
+    )
+@click.option(
+    '-j',
+    '--jobfile',
+    required=True,
+    type=click.Path(exists=True, dir_okay=False),
+    metavar='[JOBFILE]',
+    help='JSON job spec listing the org selections, filters and output directories to run (see README).',
+    )
+def run_jobs(ctx, apikey, jobfile):
+    '''
+    Run every job in a job spec file without prompting, orgs selected by several jobs are fetched only once
+    '''
+    try:
+        job_list = jobs.load_jobs(jobfile, jobs_dir, ctx.obj['output_format'])
+    except jobs.JobSpecError as e:
+        click.secho(click.style(f'\n{e}\n \n', fg='red', bold=True))
+        exit(0)
 
-        write_json(json_data=network_snmp_settings, current_time=ct, output_dir=network_reports_dir)
-        write_csv(csv_data=network_snmp_settings, current_time=ct, output_dir=network_reports_dir)
+    click.secho(click.style('\nGetting all organizations...\n \n', fg='green', bold=True))
+    index = orgfilter.OrgIndex(get_orgs(ctx, apikey))
+
+    selections = {}
+    for job in job_list:
+        if job.orgfile:
+            orgs_dict = read_csv(filename=job.orgfile)
+            if orgs_dict is None:
+                # read_csv already said why the file could not be read
+                click.secho(click.style(f'\njob "{job.name}" orgfile {job.orgfile} could not be read\n \n', fg='red', bold=True))
+                exit(0)
+            job.orgids = orgs_dict['orgids']
+            job.orgnames = orgs_dict['orgnames']
+        selections[job.name] = job.select(index)
+        networks = ' with networks' if job.networks else ''
+        click.secho(click.style(f'{job.name}: {len(selections[job.name])} organizations{networks} -> {job.output_dir}', fg='green', bold=True))
+
+    router = jobs.JobRouter(job_list, selections)
+    click.secho(click.style(
+        f'\n{len(router.organizations)} unique organizations ({len(router.network_org_ids)} with networks) for {len(job_list)} jobs.\n \n',
+        fg='green', bold=True))
+    get_snmp_settings(ctx, apikey, router.organizations, router=router)
+
+# snmp_settings command group: watch command
+@snmp_settings.command('watch')
+@click.pass_context
+@click.option(
+    '-k',
+    '--apikey',
+    prompt=True,
+    hide_input=True,
+    required=True,
+    metavar='[APIKEY]',
+    help='API key with access to one or more organizations.',
+    )
+@click.option(
+            '-i',
+            '--interval',
+            type=click.FloatRange(min=1),
+            default=watch_interval,
+            show_default=True,
+            metavar='[MINUTES]',
+            help='Minutes between the start of each poll, network calls are spread over the interval.'
+            )
+@click.option(
+            '--cycles',
+            type=click.IntRange(min=0),
+            default=0,
+            metavar='[N]',
+            help='Stop after N polls (default: run until interrupted).'
+            )
+@click.option(
+            '-cf',
+            '--containsfilter',
+            metavar='[FILTER STRING]',
+            required=False,
+            help='A filter to perform on any organization names that CONTAIN the given string (Case sensitive).'
+            )
+@click.option(
+            '-bf',
+            '--beginfilter',
+            metavar='[FILTER STRING]',
+            required=False,
+            help='A filter to perform on any organization names that BEGIN WITH the given string (case ignored).'
+            )
+@click.option(
+            '-rf',
+            '--regexfilter',
+            metavar='[REGEX]',
+            required=False,
+            help='A filter on organization names that MATCH the given regular expression (case ignored).'
+            )
+@click.option(
+            '-gf',
+            '--globfilter',
+            metavar='[PATTERN]',
+            required=False,
+            help='A filter on organization names that match the given wildcard pattern e.g. "acme*store?" (case ignored).'
+            )
+@click.option(
+            '-xf',
+            '--excludefilter',
+            metavar='[PATTERN OR ORGID]',
+            multiple=True,
+            required=False,
+            help='Exclude organizations whose name matches the wildcard pattern or whose ID is given (case ignored, may be repeated).'
+            )
+def watch_orgs(ctx, apikey, interval, cycles, containsfilter, beginfilter, regexfilter, globfilter, excludefilter):
+    '''
+    Keep polling snmp settings for all (or filtered) organizations on one session and write only the changes
+    '''
+    from merakisnmp import watch
+
+    click.secho(click.style('\nGetting all organizations...\n \n', fg='green', bold=True))
+    all_orgs = get_orgs(ctx, apikey)
+    filtered_orgs = orgfilter.filter_orgs(
+        all_orgs, contains=containsfilter, begins=beginfilter, regex=regexfilter, glob=globfilter, exclude=excludefilter)
+
+    click.secho(click.style(f'\nWatching snmp settings for {len(filtered_orgs)} organizations every {interval:g} minutes:\n \n', fg='green', bold=True))
+    for org in filtered_orgs:
+        click.secho(click.style(f'{org["name"]}', fg='green', bold=True))
+
+    changes_path = f'{watch_dir}/snmp_changes_{datetime.datetime.now()}.ndjson'
+    click.secho(click.style(f'\nChanges are appended to {changes_path}\n', fg='green', bold=True))
+    watcher = watch.SnmpWatcher(
+        apikey, filtered_orgs, get_networks=ctx.obj['network_value'], interval=interval * 60,
+        debug_app=ctx.obj['debug_value'], key_pool=ctx.obj.get('key_pool'), request_timeout=ctx.obj['request_timeout'],
+        max_org_failures=ctx.obj['max_org_failures'])
+    try:
+        watcher.run(changes_path, cycles=cycles)
+
+    except KeyboardInterrupt:
+        click.secho(click.style('\nWatch stopped.\n', fg='yellow', bold=True))
+
+# snmp_settings command group: query command
+@snmp_settings.command('query')
+@click.option('--orgs', 'org_records', is_flag=True, help='Flag to query org snmp records instead of network snmp records')
+@click.option(
+            '--snmp-version',
+            type=click.Choice(['v1/v2c', 'v3', 'none'], case_sensitive=False),
+            help='Only networks with this snmp version (none is snmp disabled).'
+            )
+@click.option('--network-id', metavar='[NETWORKID]', help='Only this network (every run unless --run is given).')
+@click.option('--org-id', metavar='[ORGID]', help='Only this organization ID.')
+@click.option('--org-name', metavar='[ORGNAME]', help='Only this organization name (case ignored).')
+@click.option('--run', 'run_id', metavar='[RUNID|all]', help='Run to query (default: the latest run).')
+@click.option('--runs', 'list_runs', is_flag=True, help='Flag to list the stored runs')
+@click.option(
+            '--format',
+            'output_format',
+            type=click.Choice(['table', 'json', 'csv'], case_sensitive=False),
+            default='table',
+            show_default=True,
+            )
+def query(org_records, snmp_version, network_id, org_id, org_name, run_id, list_runs, output_format):
+    '''
+    Look up results stored with --store (e.g. every v1/v2c network, or the history of one network) without calling the API
+    '''
+    if not pathlib.Path(store_path).exists():
+        click.secho(click.style(f'\nNo results store found at {store_path}, run a command with --store first.\n \n', fg='red', bold=True))
+        exit(0)
+
+    with store.ResultStore(store_path) as result_store:
+        if list_runs:
+            for run in result_store.runs():
+                click.echo(f'{run[0]:>6}  started {run[1]}  finished {run[2] or "(interrupted)"}')
+            return
+
+        # a single network's history covers every run by default
+        if run_id is None and network_id:
+            run_id = 'all'
+        if run_id not in (None, 'all') and not run_id.isdigit():
+            raise click.BadParameter('must be a run ID or "all"', param_hint='--run')
+
+        found = list(result_store.query(
+            kind='org' if org_records else 'network', run_id=run_id, network_id=network_id, org_id=org_id,
+            org_name=org_name, snmp_version=snmp_version and snmp_version.lower()))
+
+    output_format = output_format.lower()
+    if output_format == 'json':
+        click.echo(json.dumps(found, indent=4))
+    elif output_format == 'csv':
+        if found:
+            dict_writer = csv.DictWriter(sys.stdout, list(dict.fromkeys(key for record in found for key in record)))
+            dict_writer.writeheader()
+            dict_writer.writerows(found)
+    else:
+        columns = ['runId', *(store.ORG_COLUMNS if org_records else store.NETWORK_COLUMNS)]
+        rows = [[str(record.get(column)) for column in columns] for record in found]
+        widths = [max([len(column), *(len(row[index]) for row in rows)]) for index, column in enumerate(columns)]
+        click.echo('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+        for row in rows:
+            click.echo('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+        click.secho(f'\n{len(found)} records', fg='green')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,194 @@
+import gzip
+import json
+import time
+import pathlib
+
+import click
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+incremental (delta) network snmp runs against the previous result set
+
+the newest snmp_settings_*.json in the network results dir is loaded along with its delta_state_*.json
+(networkId -> time the record was fetched).  networks that were seen in that run and were fetched less than
+stale_hours ago reuse their previous record, new and stale networks are queried again.  at the end of the run
+a change report of added, removed and modified network snmp settings is written next to the results
+'''
+
+# fields compared between runs to decide if a network's snmp settings changed
+SNMP_FIELDS = ['snmpVersion', 'snmpAccess', 'snmpCommunitystring', 'snmpUsers']
+
+DEFAULT_STALE_HOURS = 24
+
+# results files a delta run can start from, a --partition-by-org run is a snmp_settings_[current_time] dir of these
+RESULT_SUFFIXES = ['.json', '.ndjson', '.json.gz', '.ndjson.gz']
+
+
+def _current_time(results_path):
+    ''' the run timestamp in a results file or dir name (timestamps contain dots, so not path.stem) '''
+    name = results_path.name[len('snmp_settings_'):]
+    for suffix in RESULT_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def _state_file(results_path):
+    return results_path.with_name(f'delta_state_{_current_time(results_path)}.json')
+
+
+def _result_paths(output_dir):
+    paths = []
+    for path in pathlib.Path(output_dir).glob('snmp_settings_*'):
+        if path.is_dir():
+            if not path.name.endswith('.tmp'):
+                paths.append(path)
+        elif any(path.name.endswith(suffix) for suffix in RESULT_SUFFIXES):
+            paths.append(path)
+    return sorted(paths, key=_current_time)
+
+
+def _read_records(path):
+    if path.is_dir():
+        records = {}
+        for partition in sorted(path.iterdir()):
+            if any(partition.name.endswith(suffix) for suffix in RESULT_SUFFIXES):
+                records.update(_read_records(partition))
+        return records
+
+    with (gzip.open(path, 'rt') if path.name.endswith('.gz') else open(path, 'r')) as infile:
+        if path.name.endswith(('.ndjson', '.ndjson.gz')):
+            return {record['networkId']: record for record in map(json.loads, infile)}
+        return {record['networkId']: record for record in json.load(infile)}
+
+
+def load_previous(output_dir):
+    '''
+    returns (records by networkId, fetched time by networkId) for the newest results file (json or ndjson, gzipped
+    or not) or per org results dir in output_dir
+    records from runs written before delta mode existed are treated as fetched when their file was written
+    '''
+    result_files = _result_paths(output_dir)
+    if not result_files:
+        return {}, {}
+
+    # prefer the newest completed delta run, the results of an interrupted run have no delta_state file
+    completed = [path for path in result_files if _state_file(path).exists()]
+    latest = (completed or result_files)[-1]
+    records = _read_records(latest)
+
+    state_file = _state_file(latest)
+    if state_file.exists():
+        with open(state_file, 'r') as infile:
+            fetched = json.load(infile)
+    else:
+        written = latest.stat().st_mtime
+        fetched = {network_id: written for network_id in records}
+
+    return records, fetched
+
+
+class DeltaRun:
+    '''
+    Tracks which networks can reuse their previous record and what changed during the run
+
+    The pipeline calls reuse() before querying a network and fetched() after querying it.  records given their
+    config template's settings without a query (inferredFromTemplate, see templates.py) are compared but get no
+    fetched time, so the next delta run queries them instead of reusing settings that were never queried
+    '''
+
+    def __init__(self, previous, previous_fetched, stale_hours=DEFAULT_STALE_HOURS):
+        self.previous = previous
+        self.previous_fetched = previous_fetched
+        self.stale_before = time.time() - stale_hours * 3600
+
+        self.fetched_at = {}
+        self.listed_orgs = set()
+        self.seen = set()
+        self.added = []
+        self.modified = []
+        self.reused = 0
+
+    def listed(self, organization, networks):
+        ''' an org was listed successfully, its previous networks that are missing now count as removed '''
+        self.listed_orgs.add(organization['id'])
+        self.seen.update(network['networkId'] for network in networks)
+
+    def fresh(self, network):
+        ''' True if the network has a previous record that is not stale (and was queried, not given its template's settings) '''
+        network_id = network['networkId']
+        return (
+            network_id in self.previous and self.previous_fetched.get(network_id, 0) >= self.stale_before
+            and not self.previous[network_id].get('inferredFromTemplate')
+        )
+
+    def reuse(self, network):
+        ''' previous snmp record for a network that is still fresh, otherwise None '''
+        if not self.fresh(network):
+            return None
+
+        network_id = network['networkId']
+        self.fetched_at[network_id] = self.previous_fetched[network_id]
+        self.reused += 1
+        return [self.previous[network_id]]
+
+    def fetched(self, network, snmp_data):
+        ''' compare a freshly queried (or inferred) network against its previous record '''
+        if not snmp_data:
+            return
+
+        now = time.time()
+        for record in snmp_data:
+            network_id = record['networkId']
+            if not record.get('inferredFromTemplate'):
+                self.fetched_at[network_id] = now
+
+            before = self.previous.get(network_id)
+            if before is None:
+                self.added.append(record)
+                continue
+
+            changes = {
+                field: {'before': before.get(field), 'after': record.get(field)}
+                for field in SNMP_FIELDS if before.get(field) != record.get(field)
+            }
+            if changes:
+                self.modified.append({
+                    'networkName': record['networkName'],
+                    'networkId': network_id,
+                    'organizationName': record['organizationName'],
+                    'organizationId': record['organizationId'],
+                    'changes': changes,
+                })
+
+    def removed(self):
+        return [
+            record for network_id, record in self.previous.items()
+            if record['organizationId'] in self.listed_orgs and network_id not in self.seen
+        ]
+
+    def write(self, current_time, output_dir):
+        ''' write the change report and the fetched times the next delta run will use '''
+        report = {
+            'added': self.added,
+            'removed': self.removed(),
+            'modified': self.modified,
+        }
+
+        report_path = pathlib.Path(output_dir) / f'snmp_changes_{current_time}.json'
+        with open(report_path, 'w') as outfile:
+            outfile.write(json.dumps(report, indent=4, default=dict))
+
+        state_path = pathlib.Path(output_dir) / f'delta_state_{current_time}.json'
+        with open(state_path, 'w') as outfile:
+            outfile.write(json.dumps(self.fetched_at))
+
+        click.secho(
+            f'delta run: {self.reused} networks reused, {len(report["added"])} added, '
+            f'{len(report["removed"])} removed, {len(report["modified"])} modified', fg='green'
+            )
+        click.secho(f'snmp change report written to file: { report_path }', fg='green')
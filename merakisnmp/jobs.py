@@ -0,0 +1,167 @@
+import json
+import pathlib
+
+from merakisnmp import orgfilter
+from merakisnmp import writers
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+batch job specs for the run-jobs command
+
+a job spec is a JSON file with a list of jobs (or {"output_format": ..., "jobs": [...]}), each job selects orgs the
+same way the other commands do and names its own output directory:
+
+    {
+        "jobs": [
+            {"name": "acme", "begins": "acme", "networks": true},
+            {"name": "retail", "orgfile": "retail.csv", "exclude": ["*lab*"], "output_dir": "reports/retail"},
+            {"name": "everything"}
+        ]
+    }
+
+every org selected by any job is fetched once in one session (networks only for orgs where a job asked for them)
+and each record is written to every job that selected its org
+'''
+
+JOB_KEYS = {
+    'name', 'orgids', 'orgnames', 'orgfile', 'contains', 'begins', 'regex', 'glob', 'exclude', 'networks',
+    'output_dir', 'output_format',
+}
+
+
+class JobSpecError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name, orgids=None, orgnames=None, orgfile=None, contains=None, begins=None, regex=None,
+                 glob=None, exclude=None, networks=False, output_dir=None, output_format='json'):
+        self.name = name
+        self.orgids = orgids
+        self.orgnames = orgnames
+        self.orgfile = orgfile
+        self.networks = networks
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.criteria = {'contains': contains, 'begins': begins, 'regex': regex, 'glob': glob, 'exclude': exclude}
+
+    def select(self, index):
+        ''' orgs this job selects from an orgfilter.OrgIndex (org IDs take precedence over names) '''
+        if self.orgids:
+            selection = {'org_ids': self.orgids}
+        elif self.orgnames:
+            selection = {'org_names': self.orgnames}
+        else:
+            selection = {}
+        return index.select(orgfilter.OrgFilter(**selection, **self.criteria))
+
+
+def load_jobs(path, output_root, output_format='json'):
+    ''' jobs from a spec file, output_dir defaults to output_root/<name> and relative paths are under the spec's dir '''
+    try:
+        with open(path, 'r') as infile:
+            spec = json.load(infile)
+    except (OSError, json.JSONDecodeError) as e:
+        raise JobSpecError(f'could not read job spec {path}: {e}')
+
+    if isinstance(spec, dict):
+        output_format = spec.get('output_format', output_format)
+        spec = spec.get('jobs')
+    if not isinstance(spec, list) or not spec:
+        raise JobSpecError(f'job spec {path} must contain a non-empty list of jobs')
+
+    spec_dir = pathlib.Path(path).resolve().parent
+    jobs = []
+    names = set()
+    for number, entry in enumerate(spec, start=1):
+        if not isinstance(entry, dict) or not entry.get('name'):
+            raise JobSpecError(f'job {number} must be an object with a name')
+        unknown = set(entry) - JOB_KEYS
+        if unknown:
+            raise JobSpecError(f'job "{entry["name"]}" has unknown keys: {", ".join(sorted(unknown))}')
+        if entry['name'] in names:
+            raise JobSpecError(f'job name "{entry["name"]}" is used more than once')
+        names.add(entry['name'])
+
+        entry = {'output_format': output_format, **entry}
+        if entry['output_format'] not in writers.OUTPUT_FORMATS:
+            raise JobSpecError(f'job "{entry["name"]}" output_format must be one of {writers.OUTPUT_FORMATS}')
+        entry['output_dir'] = str(spec_dir / entry['output_dir']) if entry.get('output_dir') else f'{output_root}/{entry["name"]}'
+        if entry.get('orgfile'):
+            entry['orgfile'] = str(spec_dir / entry['orgfile'])
+            if not pathlib.Path(entry['orgfile']).is_file():
+                raise JobSpecError(f'job "{entry["name"]}" orgfile {entry["orgfile"]} does not exist')
+        jobs.append(Job(**entry))
+
+    return jobs
+
+
+class JobRouter:
+    '''
+    writes each record to the result files of every job that selected its org
+
+    Usage:
+        router = JobRouter(jobs, selections)
+        with router.open(current_time):
+            async_get_snmp(router.organizations, get_networks=router.network_org_ids, write_org=router.write_org, ...)
+    '''
+
+    def __init__(self, jobs, selections):
+        self.jobs = jobs
+        # every org selected by any job, once, and org ID -> jobs that selected it
+        self.organizations = []
+        self._org_jobs = {}
+        for job in jobs:
+            for organization in selections[job.name]:
+                org_id = str(organization['id'])
+                if org_id not in self._org_jobs:
+                    self._org_jobs[org_id] = []
+                    self.organizations.append(organization)
+                self._org_jobs[org_id].append(job)
+
+        # orgs whose networks at least one job wants
+        self.network_org_ids = {org_id for org_id, org_jobs in self._org_jobs.items() if any(job.networks for job in org_jobs)}
+
+        self._org_writers = {}
+        self._network_writers = {}
+        self._writers = []
+
+    def open(self, current_time, compress=False, partition=False):
+        ''' opens every job's result files, returns the router for use in a with statement '''
+        job_writers = {}
+        for job in self.jobs:
+            org_writer = writers.open_writer(
+                f'{job.output_dir}/orgsnmp_results', current_time, job.output_format, compress=compress, partition=partition)
+            network_writer = None
+            if job.networks:
+                network_writer = writers.open_writer(
+                    f'{job.output_dir}/networksnmp_results', current_time, job.output_format, compress=compress, partition=partition)
+            job_writers[job.name] = (org_writer, network_writer)
+            self._writers.extend(writer for writer in (org_writer, network_writer) if writer)
+
+        for org_id, org_jobs in self._org_jobs.items():
+            self._org_writers[org_id] = [job_writers[job.name][0] for job in org_jobs]
+            self._network_writers[org_id] = [job_writers[job.name][1] for job in org_jobs if job.networks]
+        return self
+
+    def write_org(self, record):
+        for writer in self._org_writers.get(str(record['organizationId']), []):
+            writer.write(record)
+
+    def write_network(self, record):
+        for writer in self._network_writers.get(str(record['organizationId']), []):
+            writer.write(record)
+
+    def close(self):
+        for writer in self._writers:
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import pathlib
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+checkpoint journal for resuming interrupted runs
+
+every completed org snmp call, org network listing and network snmp call is appended to an NDJSON journal
+(flushed per entry, fsync'd at most once per second).  a run started with resume=True loads the journal and the
+pipeline only calls the API for orgs and networks that have no entry yet, journaled results are replayed into the
+new result files.  a run started without resume starts a new journal
+
+the first line of a journal is a header with the run's org selection and the options that change what was called
+(see run_header).  a journal is only resumed by a run with the same header, otherwise it is discarded and the run
+starts over, so a resume never replays results of a different selection into the new result files
+'''
+
+FSYNC_INTERVAL = 1.0
+
+# journal entry kinds, matching the pipeline's event kinds
+ORG_SNMP = 'org'
+ORG_NETWORKS = 'orgnetworks'
+NETWORK_SNMP = 'network'
+
+# the journal's first line
+HEADER = 'header'
+
+
+def run_header(organizations, get_networks=False, **options):
+    '''
+    the selection and options a journal belongs to, get_networks is True/False or a set of org IDs (as in
+    async_pipeline) and options are the run options that change which calls are made or what they return
+    '''
+    if isinstance(get_networks, (set, frozenset)):
+        get_networks = sorted(str(org_id) for org_id in get_networks)
+    return {
+        'organizations': sorted(str(organization['id']) for organization in organizations),
+        'networks': get_networks if isinstance(get_networks, list) else bool(get_networks),
+        'options': options,
+    }
+
+
+class RunJournal:
+    '''
+    Usage:
+        run_journal = RunJournal(path, resume, header=run_header(organizations, get_networks, ...))
+        if run_journal.discarded:
+            # the journal on disk was for a different run and was not resumed
+    '''
+
+    def __init__(self, path, resume=False, header=None):
+        self.path = path
+        # compared as read back from the file, so tuples and lists (or int and str keys) do not differ
+        self.header = json.loads(json.dumps(header or {}))
+        self.entries = {ORG_SNMP: {}, ORG_NETWORKS: {}, NETWORK_SNMP: {}}
+        self.discarded = False
+        self._synced = time.monotonic()
+
+        if resume and pathlib.Path(path).exists() and self._load():
+            self._file = open(path, 'a')
+            return
+
+        self.discarded = resume and pathlib.Path(path).exists()
+        self.entries = {ORG_SNMP: {}, ORG_NETWORKS: {}, NETWORK_SNMP: {}}
+        # start a new journal
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, 'w')
+        self._file.write(json.dumps({'kind': HEADER, 'data': self.header}) + '\n')
+        self._file.flush()
+
+    def _load(self):
+        ''' load the journal's entries, False (and nothing loaded) if its header does not match this run's '''
+        with open(self.path, 'r') as infile:
+            for line_number, line in enumerate(infile):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    if line_number == 0:
+                        # without a readable header what the journal belongs to is unknown
+                        return False
+                    # the last line may be cut short if the previous run was killed mid write
+                    continue
+                if entry['kind'] == HEADER:
+                    if entry['data'] != self.header:
+                        return False
+                    continue
+                if line_number == 0:
+                    # a journal written before headers existed, what it belongs to is unknown
+                    return False
+                self.entries[entry['kind']][entry['id']] = entry['data']
+        return True
+
+    def completed(self):
+        ''' number of journaled calls '''
+        return sum(len(entries) for entries in self.entries.values())
+
+    def get(self, kind, key):
+        ''' journaled result for a completed call, otherwise None '''
+        return self.entries[kind].get(key)
+
+    def record(self, kind, key, data):
+        ''' append a completed call, calls that failed (or returned nothing) stay pending '''
+        if not data:
+            return
+
+        self._file.write(json.dumps({'kind': kind, 'id': key, 'data': data}, default=dict) + '\n')
+        self._file.flush()
+
+        now = time.monotonic()
+        if now - self._synced >= FSYNC_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._synced = now
+
+    def close(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
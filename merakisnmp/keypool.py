@@ -0,0 +1,66 @@
+import os
+import re
+import pathlib
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+pool of dashboard API keys (--apikeys-file and/or the MERAKI_API_KEYS environment variable)
+
+KeyPool records which orgs each key can access (from each key's getOrganizations).  during a run
+async_keypool.SessionPool stands in for the single AsyncDashboardAPI session: every call is sent with one of the
+keys that can access the org, the least busy key that is not paused after a 429 is picked.  a key that gets a 401
+is dropped for the rest of the run and a 403 moves the call on to the org's next key
+
+NOTE: the dashboard's 10 requests per second limit is per org whichever key is used, so the scheduler's per org
+budget is unchanged.  the pool spreads each key's share of the load (and its own limits) and keeps a run going
+when a key is throttled or revoked
+'''
+
+ENV_VAR = 'MERAKI_API_KEYS'
+
+
+def load_keys(keys_file=None, env_var=ENV_VAR):
+    '''
+    API keys from a file (one key per line, blank lines and lines starting with # are ignored) and from the
+    environment variable (keys separated by commas or whitespace), duplicates removed
+    '''
+    keys = []
+    if keys_file:
+        for line in pathlib.Path(keys_file).read_text(encoding='utf-8').splitlines():
+            line = line.strip()
+            if line and not line.startswith('#'):
+                keys.append(line)
+
+    keys.extend(key for key in re.split(r'[\s,]+', os.environ.get(env_var, '')) if key)
+    return list(dict.fromkeys(keys))
+
+
+def key_label(api_key):
+    ''' identifies a key in messages without printing it '''
+    return f'...{api_key[-4:]}'
+
+
+class KeyPool:
+    ''' API keys and the orgs each one can access, picklable so it can be handed to worker processes '''
+
+    def __init__(self):
+        self.keys = []
+        # org ID -> keys that can access it, in the order they were added
+        self.org_keys = {}
+        # every org any key can access, first seen first
+        self.orgs = []
+
+    def add(self, api_key, organizations):
+        self.keys.append(api_key)
+        for organization in organizations:
+            org_keys = self.org_keys.setdefault(str(organization['id']), [])
+            if not org_keys:
+                self.orgs.append(organization)
+            org_keys.append(api_key)
+
+    def keys_for(self, org_id):
+        return self.org_keys.get(str(org_id), self.keys)
@@ -0,0 +1,30 @@
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+dashboard rate limits, scheduler concurrency, the network page size and the network selection shared by the async code and --plan
+
+kept apart from async_scheduler (which imports the meraki SDK) so plan.py can use the same numbers without
+importing the SDK
+'''
+
+# dashboard API defaults, see https://developer.cisco.com/meraki/api-v1/rate-limit/
+ORG_RATE = 10
+ORG_BURST = 10
+
+# overall concurrency, the SDK semaphore is sized to MAX_CONCURRENCY and the scheduler adapts below it
+MIN_CONCURRENCY = 2
+START_CONCURRENCY = 10
+MAX_CONCURRENCY = 30
+
+# getOrganizationNetworks page size, each page is one scheduled request
+NETWORKS_PER_PAGE = 1000
+
+
+def wants_networks(get_networks, organization):
+    ''' get_networks is True/False or a set of org IDs (run-jobs), True if the org's networks are queried '''
+    if isinstance(get_networks, (set, frozenset)):
+        return str(organization['id']) in get_networks
+    return bool(get_networks)
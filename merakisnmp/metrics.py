@@ -0,0 +1,147 @@
+import json
+import bisect
+import pathlib
+
+import click
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+per call metrics for a run: request count, latency histogram, 429s, retries, errors and bytes received
+per endpoint and per org, written as JSON and as a Prometheus textfile (node_exporter textfile collector format)
+
+the scheduler records every attempt it makes, so a call that was throttled twice counts as three requests,
+two 429s and two retries.  bytes received is the size of the decoded response re-serialised as JSON because
+the SDK does not expose the raw response size
+'''
+
+# latency histogram upper bounds in seconds (prometheus style, cumulative)
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+COUNTERS = ['requests', 'throttled', 'retries', 'errors', 'bytes']
+
+PROMETHEUS_HELP = {
+    'requests': ('merakisnmp_requests_total', 'Dashboard API requests sent'),
+    'throttled': ('merakisnmp_throttled_total', 'Requests answered with 429 Too Many Requests'),
+    'retries': ('merakisnmp_retries_total', 'Requests retried after a 429'),
+    'errors': ('merakisnmp_errors_total', 'Requests that failed with an error other than 429'),
+    'bytes': ('merakisnmp_response_bytes_total', 'Approximate response bytes received'),
+}
+
+
+def load_latencies(output_dir):
+    ''' endpoint -> average latency (seconds) from the newest run_stats_*.json in output_dir, {} if there is none '''
+    stats_files = sorted(pathlib.Path(output_dir).glob('run_stats_*.json'), key=lambda path: path.name)
+    if not stats_files:
+        return {}
+
+    try:
+        with open(stats_files[-1], 'r') as infile:
+            endpoints = json.load(infile).get('endpoints', {})
+    except (OSError, ValueError):
+        return {}
+    return {
+        endpoint: totals['latency_sum'] / totals['requests']
+        for endpoint, totals in endpoints.items() if totals.get('requests')
+    }
+
+
+class MetricsCollector:
+    def __init__(self):
+        # (endpoint, org_id) -> counters and histogram
+        self._series = {}
+
+    def _get(self, endpoint, org_id):
+        series = self._series.get((endpoint, org_id))
+        if series is None:
+            series = self._series[(endpoint, org_id)] = {
+                **dict.fromkeys(COUNTERS, 0),
+                'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+                'latency_sum': 0.0,
+            }
+        return series
+
+    def merge(self, other):
+        ''' add another collector's series (e.g. from a worker process) into this one '''
+        for key, other_series in other._series.items():
+            series = self._series.get(key)
+            if series is None:
+                self._series[key] = other_series
+                continue
+            for counter in [*COUNTERS, 'latency_sum']:
+                series[counter] += other_series[counter]
+            series['latency_buckets'] = [a + b for a, b in zip(series['latency_buckets'], other_series['latency_buckets'])]
+
+    def observe(self, endpoint, org_id, latency, throttled=False, retried=False, error=False, response=None):
+        ''' record one request attempt '''
+        series = self._get(endpoint, org_id)
+        series['requests'] += 1
+        series['latency_buckets'][bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+        series['latency_sum'] += latency
+        series['throttled'] += int(throttled)
+        series['retries'] += int(retried)
+        series['errors'] += int(error)
+        if response is not None:
+            series['bytes'] += len(json.dumps(response))
+
+    def totals(self):
+        ''' counters summed per endpoint '''
+        totals = {}
+        for (endpoint, _), series in self._series.items():
+            endpoint_totals = totals.setdefault(endpoint, {**dict.fromkeys(COUNTERS, 0), 'latency_sum': 0.0})
+            for key in [*COUNTERS, 'latency_sum']:
+                endpoint_totals[key] += series[key]
+        return totals
+
+    def to_dict(self):
+        return {
+            'latency_buckets': LATENCY_BUCKETS,
+            'endpoints': self.totals(),
+            'series': [
+                {'endpoint': endpoint, 'organizationId': org_id, **series}
+                for (endpoint, org_id), series in sorted(self._series.items())
+            ],
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for key, (name, help_text) in PROMETHEUS_HELP.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (endpoint, org_id), series in sorted(self._series.items()):
+                lines.append(f'{name}{{endpoint="{endpoint}",organization_id="{org_id}"}} {series[key]}')
+
+        name = 'merakisnmp_request_duration_seconds'
+        lines.append(f'# HELP {name} Dashboard API request latency')
+        lines.append(f'# TYPE {name} histogram')
+        for (endpoint, org_id), series in sorted(self._series.items()):
+            labels = f'endpoint="{endpoint}",organization_id="{org_id}"'
+            cumulative = 0
+            for bound, count in zip([*LATENCY_BUCKETS, '+Inf'], series['latency_buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {series["latency_sum"]}')
+            lines.append(f'{name}_count{{{labels}}} {series["requests"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, current_time, output_dir):
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+        json_path = pathlib.Path(output_dir) / f'run_stats_{current_time}.json'
+        prom_path = pathlib.Path(output_dir) / f'run_stats_{current_time}.prom'
+
+        with open(json_path, 'w') as outfile:
+            outfile.write(json.dumps(self.to_dict(), indent=4))
+        with open(prom_path, 'w') as outfile:
+            outfile.write(self.to_prometheus())
+
+        for endpoint, totals in sorted(self.totals().items()):
+            average = totals['latency_sum'] / totals['requests'] if totals['requests'] else 0
+            click.secho(
+                f'{endpoint}: {totals["requests"]} requests, avg {average:.3f}s, {totals["throttled"]} throttled, '
+                f'{totals["retries"]} retries, {totals["errors"]} errors, {totals["bytes"]} bytes', fg='green'
+                )
+        click.secho(f'run stats written to files: { json_path } and { prom_path }', fg='green')
@@ -0,0 +1,114 @@
+import re
+import bisect
+import fnmatch
+import collections
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+organization selection shared by every subcommand
+
+OrgIndex is built once over the getOrganizations result (ID hash, lowercased name map and a sorted name list for
+prefix lookups).  OrgFilter compiles the user's filters once, selections by ID, name or prefix come straight from
+the index and the remaining filters (contains, regex, glob, exclusions) are evaluated in a single pass over the
+candidates.  every match is case insensitive and results keep the getOrganizations order
+'''
+
+
+class OrgIndex:
+    def __init__(self, all_orgs):
+        self.orgs = list(all_orgs)
+        self.lower_names = [org['name'].lower() for org in self.orgs]
+
+        self.by_id = {str(org['id']): position for position, org in enumerate(self.orgs)}
+        self.by_name = collections.defaultdict(list)
+        for position, name in enumerate(self.lower_names):
+            self.by_name[name].append(position)
+
+        # (lowercased name, position) sorted for prefix range lookups
+        self._sorted_names = sorted((name, position) for position, name in enumerate(self.lower_names))
+        self._sorted_keys = [name for name, _ in self._sorted_names]
+
+    def with_ids(self, org_ids):
+        return {self.by_id[org_id] for org_id in org_ids if org_id in self.by_id}
+
+    def with_names(self, org_names):
+        return {position for name in org_names for position in self.by_name.get(name, [])}
+
+    def with_prefix(self, prefix):
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        end = bisect.bisect_right(self._sorted_keys, prefix + '\U0010ffff')
+        return {position for _, position in self._sorted_names[start:end]}
+
+    def select(self, org_filter):
+        ''' orgs matching a compiled OrgFilter, in getOrganizations order '''
+        return [self.orgs[position] for position in org_filter.positions(self)]
+
+
+class OrgFilter:
+    '''
+    compiled organization filter, every given criteria must match (exclusions remove matches)
+
+        org_ids  - organization IDs
+        org_names - exact organization names
+        contains - name contains the string
+        begins   - name begins with the string
+        regex    - name matches the regular expression (re.search)
+        glob     - name matches the shell style pattern (e.g. "acme*store?")
+        exclude  - names matching any of these shell style patterns (or IDs) are dropped
+    '''
+
+    def __init__(self, org_ids=None, org_names=None, contains=None, begins=None, regex=None, glob=None, exclude=None):
+        self.org_ids = {str(org_id).strip() for org_id in org_ids} if org_ids else None
+        self.org_names = {name.strip().lower() for name in org_names} if org_names else None
+        self.contains = contains.lower() if contains else None
+        self.begins = begins.lower() if begins else None
+        self.regex = re.compile(regex, re.IGNORECASE) if regex else None
+        self.glob = re.compile(fnmatch.translate(glob.lower())) if glob else None
+
+        self.exclude_ids = set()
+        exclude_patterns = []
+        for pattern in exclude or []:
+            pattern = pattern.strip()
+            if pattern.isdigit():
+                self.exclude_ids.add(pattern)
+            else:
+                exclude_patterns.append(fnmatch.translate(pattern.lower()))
+        self.exclude = re.compile('|'.join(exclude_patterns)) if exclude_patterns else None
+
+    def positions(self, index):
+        # narrow the candidates with the index first
+        candidates = None
+        for selected in (
+                index.with_ids(self.org_ids) if self.org_ids is not None else None,
+                index.with_names(self.org_names) if self.org_names is not None else None,
+                index.with_prefix(self.begins) if self.begins else None):
+            if selected is not None:
+                candidates = selected if candidates is None else candidates & selected
+
+        positions = range(len(index.orgs)) if candidates is None else sorted(candidates)
+
+        # then one pass over the candidates for everything else
+        matched = []
+        for position in positions:
+            name = index.lower_names[position]
+            if self.contains and self.contains not in name:
+                continue
+            if self.regex and not self.regex.search(name):
+                continue
+            if self.glob and not self.glob.match(name):
+                continue
+            if self.exclude and self.exclude.match(name):
+                continue
+            if self.exclude_ids and str(index.orgs[position]['id']) in self.exclude_ids:
+                continue
+            matched.append(position)
+        return matched
+
+
+def filter_orgs(all_orgs, **criteria):
+    ''' convenience wrapper: filter_orgs(all_orgs, contains='acme', exclude=['*lab*']) '''
+    return OrgIndex(all_orgs).select(OrgFilter(**criteria))
@@ -0,0 +1,214 @@
+import json
+import pathlib
+
+import click
+
+from merakisnmp import limits
+from merakisnmp import templates
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+pre-flight estimate of a run (--plan)
+
+for the selected orgs the plan counts the requests each endpoint would make and how long the run would take,
+without making any snmp calls.  network lists come from the response cache or are listed now (one request per
+1000 networks, and the listings are cached for the run that follows), orgs whose listing fails fall back to their
+network count from earlier runs.  networks with a fresh cached response, a fresh --delta record or that are known
+not to support snmp are not counted as requests, the networks expected to answer "does not support SNMP" are
+estimated from the share of unsupported networks seen so far.  with --collapse-templates the samples of each
+config template group are counted as requests and the rest of the group as collapsed, which assumes every group's
+samples match: the collapsed count is an upper bound and a group that does not match adds its rest as requests
+
+run time is bound by the largest org (each org is limited to limits.ORG_RATE requests per second) or by the
+concurrency limit (requests x latency / concurrency), whichever is longer.  latencies are the averages of the newest
+--stats report, REQUEST_SECONDS where there is none.  429s and retries are not modelled so treat the estimate as a
+floor
+'''
+
+ENDPOINTS = ['getOrganizationSnmp', 'getOrganizationNetworks', 'getNetworkSnmp']
+
+# seconds per request for endpoints without a latency from a --stats report
+REQUEST_SECONDS = 0.5
+
+# orgs listed by name in the printed summary
+TOP_ORGS = 5
+
+
+class RunPlan:
+    '''
+    estimated requests, skips and run time per org
+
+    Usage:
+        run_plan = RunPlan(response_cache, delta_run, latencies, template_samples)
+        for organization in organizations:
+            run_plan.add(organization, get_networks, networks=org_networks.get(...), network_count=counts.get(...))
+        run_plan.write(current_time, output_dir, workers=1, time_budget=None)
+    '''
+
+    def __init__(self, response_cache=None, delta=None, latencies=None, template_samples=None):
+        self.response_cache = response_cache
+        self.delta = delta
+        self.latencies = latencies or {}
+        self.template_samples = template_samples
+        self.orgs = []
+
+        # share of networks answering "does not support SNMP" among the networks probed so far
+        unsupported, probed = response_cache.support_counts() if response_cache else (0, 0)
+        self.unsupported_share = unsupported / probed if probed else 0
+
+    def _cached(self, endpoint, key):
+        return self.response_cache is not None and self.response_cache.get(endpoint, key) is not None
+
+    def add(self, organization, get_networks=False, networks=None, network_count=None):
+        '''
+        plan one org, networks is its network list (networkId and productTypes are used) or None with only an
+        estimated network_count (e.g. from an earlier run)
+        '''
+        org_id = organization['id']
+        calls = dict.fromkeys(ENDPOINTS, 0)
+        cached = dict.fromkeys(ENDPOINTS, 0)
+        skipped_unsupported = 0
+        reused = 0
+        collapsed = 0
+        expected_unsupported = 0.0
+
+        if self._cached('getOrganizationSnmp', org_id):
+            cached['getOrganizationSnmp'] += 1
+        else:
+            calls['getOrganizationSnmp'] += 1
+
+        networks_wanted = limits.wants_networks(get_networks, organization)
+        if not networks_wanted:
+            source = None
+        elif networks is not None:
+            source = 'listed'
+        elif network_count is not None:
+            source = 'estimated'
+        else:
+            source = 'unknown'
+
+        network_total = len(networks) if networks is not None else (network_count or 0)
+        if networks_wanted:
+            # the listing stops at the first page that is not full, a full last page costs one more (empty) request
+            pages = network_total // limits.NETWORKS_PER_PAGE + 1
+            # listings made for the plan are in the response cache when the run starts (unless it refreshes the cache)
+            if self.response_cache is not None and not self.response_cache.refresh and networks is not None:
+                cached['getOrganizationNetworks'] += pages
+            else:
+                calls['getOrganizationNetworks'] += pages
+
+            if networks is not None:
+                if self.template_samples:
+                    # template samples are always queried, the rest of their group is not
+                    networks, groups = templates.group_networks(networks, self.template_samples)
+                    for group in groups:
+                        if self.delta and all(self.delta.fresh(network) for network in group):
+                            # --delta reuses the whole group without sampling it
+                            networks = networks + group
+                            continue
+                        samples, rest = templates.pick_samples(group, self.template_samples)
+                        calls['getNetworkSnmp'] += len(samples)
+                        collapsed += len(rest)
+                for network in networks:
+                    if self.delta and self.delta.fresh(network):
+                        reused += 1
+                    elif self._cached('getNetworkSnmp', network['networkId']):
+                        cached['getNetworkSnmp'] += 1
+                    elif self.response_cache is not None and self.response_cache.known_unsupported(network):
+                        skipped_unsupported += 1
+                    else:
+                        calls['getNetworkSnmp'] += 1
+            else:
+                calls['getNetworkSnmp'] += network_total
+            expected_unsupported = calls['getNetworkSnmp'] * self.unsupported_share
+
+        requests = sum(calls.values())
+        self.orgs.append({
+            'organizationId': org_id,
+            'organizationName': organization.get('name'),
+            'networks': network_total if networks_wanted else None,
+            'networkSource': source,
+            'requests': calls,
+            'cached': cached,
+            'reusedFromDelta': reused,
+            'collapsedByTemplate': collapsed,
+            'skippedUnsupported': skipped_unsupported,
+            'expectedUnsupported': round(expected_unsupported),
+            # seconds the org's rate limit alone holds the run for (the burst is spent straight away)
+            'rateLimitedSeconds': max(0, requests - limits.ORG_BURST) / limits.ORG_RATE,
+        })
+
+    def latency(self, endpoint):
+        return self.latencies.get(endpoint, REQUEST_SECONDS)
+
+    def summary(self, workers=1, concurrency=limits.MAX_CONCURRENCY):
+        ''' totals and the estimated run time, every worker process (--workers) has its own concurrency limit '''
+        requests = {endpoint: sum(org['requests'][endpoint] for org in self.orgs) for endpoint in ENDPOINTS}
+        cached = {endpoint: sum(org['cached'][endpoint] for org in self.orgs) for endpoint in ENDPOINTS}
+
+        request_seconds = sum(requests[endpoint] * self.latency(endpoint) for endpoint in ENDPOINTS)
+        concurrency_seconds = request_seconds / (concurrency * workers)
+        largest = max(self.orgs, key=lambda org: org['rateLimitedSeconds'], default=None)
+        org_seconds = largest['rateLimitedSeconds'] if largest else 0
+
+        return {
+            'organizations': len(self.orgs),
+            'networks': sum(org['networks'] or 0 for org in self.orgs),
+            'networksEstimated': sum(org['networks'] or 0 for org in self.orgs if org['networkSource'] in ('estimated', 'unknown')),
+            'requests': requests,
+            'cached': cached,
+            'reusedFromDelta': sum(org['reusedFromDelta'] for org in self.orgs),
+            'collapsedByTemplate': sum(org['collapsedByTemplate'] for org in self.orgs),
+            'skippedUnsupported': sum(org['skippedUnsupported'] for org in self.orgs),
+            'expectedUnsupported': sum(org['expectedUnsupported'] for org in self.orgs),
+            'latencySeconds': {endpoint: self.latency(endpoint) for endpoint in ENDPOINTS},
+            'workers': workers,
+            'concurrency': concurrency * workers,
+            'concurrencyBoundSeconds': concurrency_seconds,
+            'largestOrgSeconds': org_seconds,
+            'largestOrg': largest['organizationName'] if largest else None,
+            'estimatedSeconds': max(concurrency_seconds, org_seconds),
+            'boundBy': 'largest org rate limit' if org_seconds > concurrency_seconds else 'concurrency',
+        }
+
+    def write(self, current_time, output_dir, workers=1, time_budget=None):
+        ''' write plan_[current_time].json and print the summary, time_budget is in seconds '''
+        summary = self.summary(workers)
+        self.orgs.sort(key=lambda org: -org['rateLimitedSeconds'])
+
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+        plan_path = pathlib.Path(output_dir) / f'plan_{current_time}.json'
+        with open(plan_path, 'w') as outfile:
+            outfile.write(json.dumps({'summary': summary, 'organizations': self.orgs}, indent=4))
+
+        for endpoint in ENDPOINTS:
+            click.secho(
+                f'{endpoint}: {summary["requests"][endpoint]} requests ({summary["cached"][endpoint]} cached), '
+                f'avg {summary["latencySeconds"][endpoint]:.3f}s', fg='green'
+                )
+        click.secho(
+            f'{summary["networks"]} networks in {summary["organizations"]} organizations '
+            f'({summary["networksEstimated"]} estimated from earlier runs), {summary["reusedFromDelta"]} reused by --delta, '
+            f'up to {summary["collapsedByTemplate"]} collapsed by config template (if every group\'s samples match), '
+            f'{summary["skippedUnsupported"]} skipped as unsupported, about {summary["expectedUnsupported"]} more expected '
+            f'to not support SNMP', fg='green'
+            )
+        for org in self.orgs[:TOP_ORGS]:
+            click.secho(
+                f'  {org["organizationName"]}: {sum(org["requests"].values())} requests, '
+                f'at least {org["rateLimitedSeconds"] / 60:.1f} minutes', fg='green'
+                )
+        click.secho(
+            f'estimated run time: {summary["estimatedSeconds"] / 60:.1f} minutes with {summary["workers"]} worker(s) '
+            f'(bound by {summary["boundBy"]})', fg='green'
+            )
+        if time_budget and summary['estimatedSeconds'] > time_budget:
+            click.secho(
+                f'the estimate is longer than the time budget of {time_budget / 60:g} minutes, expect an unfinished '
+                f'work report', fg='yellow'
+                )
+        click.secho(f'run plan written to file: { plan_path }', fg='green')
@@ -0,0 +1,194 @@
+import json
+import time
+import cProfile
+import pathlib
+import datetime
+import contextlib
+import tracemalloc
+
+import click
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+stage profiling for a run (--profile)
+
+every stage (org listing, org snmp, network listing, network snmp, output writing) is timed per call.  the stages
+overlap in one event loop, so CPU time is attributed afterwards: one cProfile run covers the org listing and the
+snmp run and each function's own time is grouped by where it lives (the SDK, the HTTP client, asyncio, json, tqdm,
+the module of each stage).  tracemalloc records the peak and the largest allocation sites at the end of each stage
+
+the report is written to a profile_[timestamp].json summary and a profile_[timestamp].prof file for pstats or
+snakeviz.  cProfile and tracemalloc slow the run down noticeably, compare stages with each other rather than with
+unprofiled runs
+'''
+
+# (category, path fragment) pairs, the first match wins
+CATEGORIES = [
+    ('org_snmp', 'async_orgsnmp.py'),
+    ('network_listing', 'async_getorgnetworks.py'),
+    ('network_snmp', 'async_networksnmp.py'),
+    ('output', 'merakisnmp/writers.py'),
+    ('output', '/csv.py'),
+    ('scheduler', 'async_scheduler.py'),
+    ('pipeline', 'merakisnmp/'),
+    ('sdk', '/meraki/'),
+    ('http', '/httpx/'),
+    ('http', '/httpcore/'),
+    ('http', '/h11/'),
+    ('http', '/anyio/'),
+    ('http', '/aiohttp/'),
+    ('http', '/ssl.py'),
+    ('json', '/json/'),
+    ('progress', '/tqdm/'),
+    ('asyncio', '/asyncio/'),
+    ('asyncio', '/selectors.py'),
+    ('imports', 'importlib'),
+]
+
+# functions and allocation sites listed in the report
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 20
+
+
+def _category(filename):
+    filename = filename.replace('\\', '/')
+    for category, fragment in CATEGORIES:
+        if fragment in filename:
+            return category
+    if filename.startswith('<') or filename == '~':
+        return 'builtins'
+    return 'other'
+
+
+class StageProfiler:
+    '''
+    Usage:
+        profiler = StageProfiler()
+        with profiler.collecting(), profiler.stage('org_listing'):
+            ...
+        profiler.write(output_dir)
+    '''
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.current_time = str(datetime.datetime.now())
+        self.stages = {}
+        self.memory = {}
+        # CPU time rather than wall time, so waiting on the API (the event loop's select) does not show up as a hot spot
+        self._profile = cProfile.Profile(time.process_time)
+
+    @contextlib.contextmanager
+    def collecting(self):
+        ''' cProfile and tracemalloc are on inside this block '''
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._profile.enable()
+        try:
+            yield self
+        finally:
+            self._profile.disable()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        ''' time one call (or block) of a stage, calls of the same stage may overlap '''
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = {'calls': 0, 'seconds': 0.0, 'first_start': start, 'last_end': end}
+            stage['calls'] += 1
+            stage['seconds'] += end - start
+            stage['last_end'] = max(stage['last_end'], end)
+
+    def wrap(self, name, func):
+        ''' func with every call timed as stage `name` (e.g. a write_org callback) '''
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def snapshot(self, name):
+        ''' traced memory (and the largest allocation sites) at the end of a stage '''
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        statistics = tracemalloc.take_snapshot().statistics('lineno')
+        self.memory[name] = {
+            'current_bytes': current,
+            'peak_bytes': peak,
+            'top_allocations': [
+                {'site': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'bytes': stat.size, 'blocks': stat.count}
+                for stat in statistics[:TOP_ALLOCATIONS]
+            ],
+        }
+
+    def _stats(self):
+        self._profile.create_stats()
+        categories = {}
+        functions = []
+        for (filename, lineno, function), (_, calls, own_time, cumulative_time, _) in self._profile.stats.items():
+            category = _category(filename)
+            categories[category] = categories.get(category, 0.0) + own_time
+            functions.append({
+                'function': f'{filename}:{lineno}({function})', 'category': category, 'calls': calls,
+                'own_seconds': own_time, 'cumulative_seconds': cumulative_time,
+            })
+        functions.sort(key=lambda function: -function['own_seconds'])
+        return dict(sorted(categories.items(), key=lambda item: -item[1])), functions[:TOP_FUNCTIONS]
+
+    def report(self):
+        categories, functions = self._stats()
+        return {
+            'stages': {
+                name: {
+                    'calls': stage['calls'],
+                    'seconds': stage['seconds'],
+                    'start': stage['first_start'] - self.started,
+                    'end': stage['last_end'] - self.started,
+                } for name, stage in sorted(self.stages.items(), key=lambda item: item[1]['first_start'])
+            },
+            'cpu_seconds_by_category': categories,
+            'top_functions': functions,
+            'memory': self.memory,
+        }
+
+    def write(self, output_dir):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+        report_path = pathlib.Path(output_dir) / f'profile_{self.current_time}.json'
+        prof_path = pathlib.Path(output_dir) / f'profile_{self.current_time}.prof'
+
+        report = self.report()
+        with open(report_path, 'w') as outfile:
+            outfile.write(json.dumps(report, indent=4))
+        self._profile.dump_stats(str(prof_path))
+
+        for name, stage in report['stages'].items():
+            click.secho(
+                f'{name}: {stage["calls"]} calls, {stage["seconds"]:.2f}s total, '
+                f'{stage["start"]:.2f}s - {stage["end"]:.2f}s into the run', fg='green'
+                )
+        click.secho('cpu time: ' + ', '.join(
+            f'{category} {seconds:.2f}s' for category, seconds in report['cpu_seconds_by_category'].items()), fg='green')
+        if report['memory']:
+            click.secho(f'peak traced memory: {max(memory["peak_bytes"] for memory in report["memory"].values()) / 1e6:.1f} MB', fg='green')
+        click.secho(f'profile written to files: { report_path } and { prof_path }', fg='green')
+
+
+def collecting(profiler):
+    ''' profiler.collecting() or a no-op without a profiler '''
+    return profiler.collecting() if profiler else contextlib.nullcontext()
+
+
+def stage(profiler, name):
+    ''' profiler.stage(name) or a no-op without a profiler '''
+    return profiler.stage(name) if profiler else contextlib.nullcontext()
@@ -0,0 +1,99 @@
+import collections.abc
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+compact record types for org snmp, network and network snmp records
+
+each record is a slotted object (no per record dict) built in one projection straight from the API payload.
+records read like the dicts they replace (record['networkId'], record.get('tags'), dict(record), iteration over
+the field names in output order) so the writers, journal, cache and delta code handle records and dicts read back
+from earlier runs alike.  pass default=dict to json.dumps to serialise them
+'''
+
+
+class Record(collections.abc.Mapping):
+    '''
+    base for slotted records, subclasses list their fields (in output order) as __slots__, a subclass of a record
+    adds its __slots__ after its parent's fields.  slots starting with an underscore are not fields
+    '''
+    __slots__ = ()
+    _fields = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = cls._fields + tuple(
+            field for field in cls.__dict__.get('__slots__', ()) if not field.startswith('_'))
+
+    def __init__(self, *values):
+        for field, value in zip(self._fields, values):
+            setattr(self, field, value)
+
+    def __getitem__(self, field):
+        if field not in self._fields:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({dict(self)!r})'
+
+
+class OrgSnmpRecord(Record):
+    '''
+    getOrganizationSnmp fields the record does not name (ones the API adds later) are kept in `extra` and follow
+    the named fields, so the output keeps every field the API returned
+    '''
+    __slots__ = (
+        'organizationName', 'organizationId', 'organizationURL',
+        'v2cEnabled', 'v2CommunityString', 'v3Enabled', 'v3AuthMode', 'v3PrivMode', 'peerIps', 'hostname', 'port',
+        '_extra',
+    )
+
+    def __init__(self, *values, extra=None):
+        super().__init__(*values)
+        self._extra = {field: value for field, value in (extra or {}).items() if field not in self._fields}
+
+    @property
+    def extra(self):
+        return self._extra
+
+    def __getitem__(self, field):
+        if field in self._extra:
+            return self._extra[field]
+        return super().__getitem__(field)
+
+    def __iter__(self):
+        yield from self._fields
+        yield from self._extra
+
+    def __len__(self):
+        return len(self._fields) + len(self._extra)
+
+
+class NetworkRecord(Record):
+    ''' a network from getOrganizationNetworks with its org's name and url (the fields the pipeline uses) '''
+    __slots__ = (
+        'organizationName', 'organizationUrl', 'networkId', 'organizationId', 'networkName', 'networkUrl',
+        'productTypes', 'timeZone', 'tags', 'isBoundToConfigTemplate', 'configTemplateId',
+    )
+
+
+class NetworkSnmpRecord(Record):
+    __slots__ = (
+        'networkName', 'networkId', 'networkUrl', 'organizationName', 'organizationId', 'organizationUrl',
+        'snmpVersion', 'snmpAccess', 'snmpCommunitystring', 'snmpUsers',
+    )
+
+
+class InferredNetworkSnmpRecord(NetworkSnmpRecord):
+    ''' a network given its config template's sampled settings without being queried (--collapse-templates) '''
+    __slots__ = ('inferredFromTemplate',)
@@ -0,0 +1,178 @@
+import time
+import queue
+import multiprocessing
+
+import tqdm
+
+from merakisnmp import budget
+from merakisnmp import cache
+from merakisnmp import metrics
+from merakisnmp import templates
+from merakisnmp.async_code import async_breaker
+from merakisnmp.async_code import async_pipeline
+from merakisnmp.async_code import async_transport
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+multi-process execution (--workers N)
+
+the filtered orgs are dealt round robin into N shards and each shard runs the async pipeline in its own process
+(its own event loop, SDK session and scheduler) so JSON decoding, redaction and rekeying use every core.
+workers send their records back in batches and the parent writes them to the usual output files, so the results
+are the same as a single process run (only the record order differs)
+
+every shard has its own per org rate limiting, an org is only ever in one shard so the per org budget is unchanged.
+orgs are dealt in the order given so orgs sorted largest first (budget.largest_first) are spread evenly
+'''
+
+# records per message sent back to the parent
+BATCH_SIZE = 100
+
+
+class WorkerError(RuntimeError):
+    ''' one or more worker processes failed or exited without reporting, the message lists them '''
+
+
+class _BatchSender:
+    def __init__(self, results, kind):
+        self.results = results
+        self.kind = kind
+        self.batch = []
+
+    def write(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.results.put((self.kind, self.batch))
+            self.batch = []
+
+
+def _run_shard(shard, api_key, organizations, options, results):
+    ''' worker process entry point, runs one shard and reports back on the results queue '''
+    response_cache = None
+    if options['cache_path']:
+        response_cache = cache.ResponseCache(options['cache_path'], refresh=options['refresh'], commit_every=1)
+    collector = metrics.MetricsCollector() if options['stats'] else None
+    # the run's deadline is shared by every worker
+    run_budget = budget.RunBudget(options['deadline'] - time.time()) if options['deadline'] else None
+    breaker = async_breaker.CircuitBreaker(options['failure_threshold']) if options['failure_threshold'] is not None else None
+    collapse = templates.TemplateCollapse(options['template_samples']) if options['template_samples'] else None
+
+    org_sender = _BatchSender(results, 'org')
+    network_sender = _BatchSender(results, 'network')
+    try:
+        async_pipeline.async_get_snmp(
+            api_key, organizations, get_networks=options['get_networks'], debug_app=options['debug_app'],
+            cache=response_cache, metrics=collector, base_url=options['base_url'], progress_bar=False,
+            key_pool=options['key_pool'], request_timeout=options['request_timeout'], budget=run_budget, breaker=breaker,
+            templates=collapse, write_org=org_sender.write, write_network=network_sender.write)
+        org_sender.flush()
+        network_sender.flush()
+        results.put((
+            'done', shard, collector, run_budget.unfinished() if run_budget else None, breaker.orgs if breaker else None,
+            collapse.counts if collapse else None))
+
+    except Exception as e:
+        results.put(('error', shard, repr(e)))
+
+    finally:
+        async_transport.close_default_transport()
+        if response_cache:
+            response_cache.close()
+
+
+def sharded_get_snmp(api_key, organizations, workers, get_networks=False, debug_app=False,
+                     base_url='https://api.meraki.com/api/v1', cache_path=None, refresh=False, metrics=None,
+                     write_org=None, write_network=None, key_pool=None,
+                     request_timeout=async_pipeline.async_scheduler.REQUEST_TIMEOUT, budget=None, breaker=None,
+                     templates=None):
+    '''
+    same as async_pipeline.async_get_snmp with the orgs split over `workers` processes, returns (org snmp records,
+    network snmp records)
+
+    records are passed to write_org / write_network as they arrive (and are then not kept in the returned lists),
+    metrics from every worker are merged into `metrics` if given, unfinished work into `budget` and per org failures
+    into `breaker` (each worker runs its own breaker with the same threshold) and config template counters into
+    `templates`.  raises WorkerError once every worker has stopped if any of them failed, the records the others
+    sent have been written by then
+    '''
+    all_orgsnmp = []
+    all_networksnmp = []
+    write_org = write_org or all_orgsnmp.append
+    write_network = write_network or all_networksnmp.append
+
+    shards = [organizations[index::workers] for index in range(workers)]
+    shards = [shard for shard in shards if shard]
+    options = {
+        'get_networks': get_networks, 'debug_app': debug_app, 'base_url': base_url,
+        'cache_path': cache_path, 'refresh': refresh, 'stats': metrics is not None, 'key_pool': key_pool,
+        'request_timeout': request_timeout, 'deadline': time.time() + budget.remaining() if budget else None,
+        'failure_threshold': breaker.threshold if breaker else None,
+        'template_samples': templates.samples if templates else None,
+    }
+
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=_run_shard, args=(index, api_key, shard, options, results), daemon=True)
+        for index, shard in enumerate(shards)
+    ]
+    for process in processes:
+        process.start()
+
+    errors = []
+    running = len(processes)
+    try:
+        with tqdm.tqdm(total=len(organizations), colour='green', unit='org') as progress:
+            while running:
+                try:
+                    message = results.get(timeout=1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        # a worker died without reporting (killed, out of memory)
+                        errors.append('worker exited without reporting its results')
+                        break
+                    continue
+
+                kind = message[0]
+                if kind == 'org':
+                    for record in message[1]:
+                        write_org(record)
+                elif kind == 'network':
+                    for record in message[1]:
+                        write_network(record)
+                else:
+                    running -= 1
+                    shard = message[1]
+                    if kind == 'error':
+                        errors.append(f'worker {shard}: {message[2]}')
+                    else:
+                        if metrics is not None and message[2] is not None:
+                            metrics.merge(message[2])
+                        if budget is not None:
+                            budget.extend(message[3])
+                        if breaker is not None:
+                            breaker.merge(message[4])
+                        if templates is not None:
+                            templates.merge(message[5])
+                    progress.update(len(shards[shard]))
+
+        for process in processes:
+            process.join()
+
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    if errors:
+        raise WorkerError('; '.join(errors))
+
+    return all_orgsnmp, all_networksnmp
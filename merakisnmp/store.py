@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import pathlib
+import datetime
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+optional SQLite results store (--store) queried by the query subcommand
+
+every run gets a run ID and its org and network snmp records are inserted into indexed tables next to the usual
+result files, so questions across runs and orgs (every v1/v2c network, the history of one network) are index
+lookups instead of re-reading every JSON file.  the full record is kept as JSON alongside the indexed columns
+'''
+
+# commit in batches rather than once per record
+COMMIT_EVERY = 1000
+
+ORG_COLUMNS = ['organizationId', 'organizationName', 'v2cEnabled', 'v3Enabled']
+NETWORK_COLUMNS = ['networkId', 'networkName', 'organizationId', 'organizationName', 'snmpVersion', 'snmpAccess']
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY AUTOINCREMENT, started TEXT NOT NULL, finished TEXT)',
+    'CREATE TABLE IF NOT EXISTS org_snmp (run_id INTEGER NOT NULL, organizationId TEXT NOT NULL, organizationName TEXT, '
+    'v2cEnabled INTEGER, v3Enabled INTEGER, record TEXT NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS network_snmp (run_id INTEGER NOT NULL, networkId TEXT NOT NULL, networkName TEXT, '
+    'organizationId TEXT, organizationName TEXT, snmpVersion TEXT, snmpAccess TEXT, record TEXT NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS org_snmp_run ON org_snmp (run_id, organizationId)',
+    'CREATE INDEX IF NOT EXISTS org_snmp_org ON org_snmp (organizationId, run_id)',
+    'CREATE INDEX IF NOT EXISTS network_snmp_network ON network_snmp (networkId, run_id)',
+    'CREATE INDEX IF NOT EXISTS network_snmp_version ON network_snmp (run_id, snmpVersion)',
+    'CREATE INDEX IF NOT EXISTS network_snmp_org ON network_snmp (run_id, organizationId)',
+]
+
+
+class ResultStore:
+    '''
+    Usage:
+        with ResultStore(path) as store:
+            run_id = store.start_run()
+            store.write_org(record)
+            store.write_network(record)
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.run_id = None
+        self._pending = 0
+
+        pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def start_run(self, started=None):
+        cursor = self._db.execute('INSERT INTO runs (started) VALUES (?)', (str(started or datetime.datetime.now()),))
+        self._db.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    def _insert(self, table, columns, record):
+        self._db.execute(
+            f'INSERT INTO {table} (run_id, {", ".join(columns)}, record) VALUES (?, {", ".join("?" * len(columns))}, ?)',
+            (self.run_id, *[record.get(column) for column in columns], json.dumps(record, default=dict))
+        )
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def write_org(self, record):
+        self._insert('org_snmp', ORG_COLUMNS, record)
+
+    def write_network(self, record):
+        self._insert('network_snmp', NETWORK_COLUMNS, record)
+
+    def close(self):
+        if self.run_id is not None:
+            self._db.execute(
+                'UPDATE runs SET finished = ? WHERE run_id = ?', (str(datetime.datetime.now()), self.run_id))
+        self._db.commit()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def runs(self):
+        return self._db.execute('SELECT run_id, started, finished FROM runs ORDER BY run_id').fetchall()
+
+    def query(self, kind='network', run_id=None, network_id=None, org_id=None, org_name=None, snmp_version=None):
+        '''
+        records matching every given criteria, run_id None means the latest run with records of that kind
+        ('all' for every run).  snmp_version 'none' matches networks with snmp disabled
+        '''
+        table = 'org_snmp' if kind == 'org' else 'network_snmp'
+        where = []
+        params = []
+
+        if run_id is None:
+            where.append(f'run_id = (SELECT MAX(run_id) FROM {table})')
+        elif run_id != 'all':
+            where.append('run_id = ?')
+            params.append(int(run_id))
+
+        if network_id and table == 'network_snmp':
+            where.append('networkId = ?')
+            params.append(network_id)
+        if org_id:
+            where.append('organizationId = ?')
+            params.append(str(org_id))
+        if org_name:
+            where.append('organizationName = ? COLLATE NOCASE')
+            params.append(org_name)
+        if snmp_version and table == 'network_snmp':
+            if snmp_version == 'none':
+                where.append('snmpVersion IS NULL')
+            else:
+                where.append('snmpVersion = ?')
+                params.append(snmp_version)
+
+        sql = f'SELECT run_id, record FROM {table}'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY run_id, rowid'
+        for row_run_id, record in self._db.execute(sql, params):
+            yield {'runId': row_run_id, **json.loads(record)}
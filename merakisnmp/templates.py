@@ -0,0 +1,114 @@
+import click
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+config template aware network snmp (--collapse-templates)
+
+networks bound to the same config template usually share their snmp settings, so querying every one of them
+mostly repeats the same answer.  bound networks are grouped by template (and productTypes, so a group's networks
+support the same settings) and only `samples` networks spread across each group are queried.  if every sample
+answered with the same raw settings (community string and v3 passphrases included, before they are redacted) the
+rest of the group is given those settings without being queried, otherwise the rest of the group is queried as
+usual.  groups no larger than `samples` and networks not bound to a template are always queried
+
+with --delta a group whose networks are all fresh reuses their records without sampling, otherwise the samples are
+queried even if they are fresh (a reused record has no raw settings to compare).  samples replayed from the journal
+(--resume) have no raw settings either, so their group is looked up as usual.  collapsed networks are written with
+inferredFromTemplate (their configTemplateId), are journalled, and get no --delta fetched time so a delta run
+never reuses settings that were not queried
+
+a bound network whose settings were changed on the network itself can only be missed if none of its group's
+samples has the change, raise --template-samples (or leave collapsing off) where that matters
+'''
+
+# networks queried per template group
+SAMPLES = 3
+
+
+def group_networks(networks, samples=SAMPLES):
+    '''
+    returns (networks to query as usual, [template group, ...]), only groups with more than `samples` networks are
+    returned as groups and the order of the networks is kept
+    '''
+    groups = {}
+    for network in networks:
+        if network.get('isBoundToConfigTemplate') and network.get('configTemplateId'):
+            key = (network['configTemplateId'], tuple(sorted(network.get('productTypes') or [])))
+            groups.setdefault(key, []).append(network)
+
+    collapsible = [group for group in groups.values() if len(group) > samples]
+    grouped = {network['networkId'] for group in collapsible for network in group}
+    return [network for network in networks if network['networkId'] not in grouped], collapsible
+
+
+def pick_samples(group, samples=SAMPLES):
+    ''' (sampled networks, the rest of the group), samples are spread evenly from the first network to the last '''
+    if len(group) <= samples:
+        return list(group), []
+    if samples == 1:
+        indexes = {0}
+    else:
+        indexes = {round(sample * (len(group) - 1) / (samples - 1)) for sample in range(samples)}
+    return (
+        [network for index, network in enumerate(group) if index in indexes],
+        [network for index, network in enumerate(group) if index not in indexes],
+    )
+
+
+def same_settings(configs):
+    ''' True if every sample was queried and answered (with settings) and they all match '''
+    return bool(configs) and all(configs) and all(config == configs[0] for config in configs[1:])
+
+
+class TemplateCollapse:
+    '''
+    settings and counters for a run with --collapse-templates
+
+    Usage:
+        collapse = TemplateCollapse(samples)
+        async_get_snmp(..., templates=collapse)
+        collapse.report()
+    '''
+
+    def __init__(self, samples=SAMPLES):
+        self.samples = samples
+        self.counts = {'groups': 0, 'collapsed_groups': 0, 'sampled': 0, 'collapsed': 0, 'queried': 0}
+
+    def split(self, networks):
+        ''' group_networks() with this run's sample count '''
+        return group_networks(networks, self.samples)
+
+    def sample(self, group):
+        ''' (networks to query, the rest of the group) '''
+        samples, rest = pick_samples(group, self.samples)
+        self.counts['groups'] += 1
+        self.counts['sampled'] += len(samples)
+        return samples, rest
+
+    def collapse(self, configs, rest):
+        ''' True if the rest of the group can be given the sampled settings (configs), False to query it as usual '''
+        if same_settings(configs):
+            self.counts['collapsed_groups'] += 1
+            self.counts['collapsed'] += len(rest)
+            return True
+        self.counts['queried'] += len(rest)
+        return False
+
+    def merge(self, counts):
+        ''' add another process's (--workers) counters '''
+        for key, value in (counts or {}).items():
+            self.counts[key] += value
+
+    def report(self):
+        if not self.counts['groups']:
+            return
+        click.secho(
+            f'config templates: {self.counts["collapsed_groups"]} of {self.counts["groups"]} template groups collapsed, '
+            f'{self.counts["collapsed"]} networks given their template\'s settings from {self.counts["sampled"]} sampled '
+            f'networks, {self.counts["queried"]} networks in groups that did not match (or had samples replayed from '
+            f'the journal) were looked up as usual', fg='green'
+            )
@@ -0,0 +1,191 @@
+import json
+import time
+import asyncio
+import itertools
+import pathlib
+import datetime
+import contextlib
+
+import click
+
+from merakisnmp import delta
+from merakisnmp.async_code import async_orgsnmp
+from merakisnmp.async_code import async_getorgnetworks
+from merakisnmp.async_code import async_networksnmp
+from merakisnmp.async_code import async_breaker
+from merakisnmp.async_code import async_scheduler
+from merakisnmp.async_code import async_pipeline
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+long running watch mode
+
+one dashboard session (and scheduler) stays open for the life of the process and the selected orgs are polled
+every interval.  each cycle lists the orgs' networks first and then paces the network snmp calls evenly over
+SPREAD of the interval instead of bursting them, so the org rate budget is used steadily.  every cycle's records are
+compared with the previous cycle and only added, modified and removed records are appended to the changes file
+(the first cycle reports every record as added, giving a baseline)
+
+watch always queries the API, the response cache is not used.  an org that keeps failing is skipped for the rest of
+its cycle (see async_breaker) and polled again the next cycle
+'''
+
+# share of the interval the network snmp calls are spread over, the rest is headroom for retries and slow orgs
+SPREAD = 0.8
+
+# fields compared between cycles
+ORG_SNMP_FIELDS = ['v2cEnabled', 'v3Enabled', 'v3AuthMode', 'v3PrivMode', 'peerIps', 'hostname', 'port']
+
+
+def _changes(fields, before, after):
+    return {
+        field: {'before': before.get(field), 'after': after.get(field)}
+        for field in fields if before.get(field) != after.get(field)
+    }
+
+
+class SnmpWatcher:
+    '''
+    polls org (and optionally network) snmp for a fixed set of orgs on one warm session
+
+    Usage:
+        SnmpWatcher(api_key, organizations, get_networks=True, interval=3600).run(changes_path)
+    '''
+
+    def __init__(self, api_key, organizations, get_networks=False, interval=3600,
+                 debug_app=False, base_url='https://api.meraki.com/api/v1', key_pool=None,
+                 snmp_workers=async_scheduler.MAX_CONCURRENCY, request_timeout=async_scheduler.REQUEST_TIMEOUT,
+                 max_org_failures=async_breaker.FAILURE_THRESHOLD):
+        self.api_key = api_key
+        self.organizations = organizations
+        self.get_networks = get_networks
+        self.interval = interval
+        self.debug_app = debug_app
+        self.base_url = base_url
+        self.key_pool = key_pool
+        self.snmp_workers = snmp_workers
+        self.request_timeout = request_timeout
+        # consecutive failures before an org is skipped for the rest of a cycle, 0 keeps calling it
+        self.max_org_failures = max_org_failures
+
+        # ('org', organizationId) or ('network', networkId) -> record from the last cycle
+        self.records = {}
+
+    async def _cycle(self, aiomeraki, scheduler):
+        ''' one poll of every org, returns (records, org IDs whose networks were listed, network IDs listed) '''
+        records = {}
+        listed_orgs = set()
+        listed_networks = set()
+
+        async def org_snmp(organization):
+            for record in await async_orgsnmp._get_snmp(aiomeraki, organization, scheduler) or []:
+                records[('org', record['organizationId'])] = record
+
+        async def org_networks(organization):
+            networks = await async_getorgnetworks._get_orgnetworks(aiomeraki, organization, scheduler)
+            if networks is not None:
+                listed_orgs.add(organization['id'])
+                listed_networks.update(network['networkId'] for network in networks)
+            return networks or []
+
+        async def network_snmp(network_queue):
+            while True:
+                network = await network_queue.get()
+                if network is None:
+                    return
+                for record in await async_networksnmp._get_snmp(aiomeraki, network, scheduler) or []:
+                    records[('network', record['networkId'])] = record
+
+        org_tasks = [org_snmp(organization) for organization in self.organizations]
+        if not self.get_networks:
+            await asyncio.gather(*org_tasks)
+            return records, listed_orgs, listed_networks
+
+        listings = await asyncio.gather(*[org_networks(organization) for organization in self.organizations])
+        # interleave the orgs so each org's calls are spread over the interval too
+        networks = [
+            network for networks in itertools.zip_longest(*listings) for network in networks if network is not None
+        ]
+        spacing = self.interval * SPREAD / len(networks) if networks else 0
+
+        network_queue = asyncio.Queue(maxsize=self.snmp_workers)
+        workers = [asyncio.ensure_future(network_snmp(network_queue)) for _ in range(self.snmp_workers)]
+        try:
+            org_done = asyncio.ensure_future(asyncio.gather(*org_tasks))
+            for network in networks:
+                await network_queue.put(network)
+                await asyncio.sleep(spacing)
+            for _ in workers:
+                await network_queue.put(None)
+            await asyncio.gather(org_done, *workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+        return records, listed_orgs, listed_networks
+
+    def _diff(self, records, listed_orgs, listed_networks):
+        ''' change events against the previous cycle, records that could not be fetched this cycle are carried over '''
+        events = []
+        for key, record in records.items():
+            before = self.records.get(key)
+            if before is None:
+                events.append({'change': 'added', 'kind': key[0], 'record': record})
+                continue
+            changes = _changes(ORG_SNMP_FIELDS if key[0] == 'org' else delta.SNMP_FIELDS, before, record)
+            if changes:
+                events.append({'change': 'modified', 'kind': key[0], 'record': record, 'changes': changes})
+
+        for key, before in self.records.items():
+            if key in records:
+                continue
+            if key[0] == 'network' and before['organizationId'] in listed_orgs and key[1] not in listed_networks:
+                events.append({'change': 'removed', 'kind': key[0], 'record': before})
+            else:
+                # the call failed this cycle, keep the last known record
+                records[key] = before
+
+        self.records = records
+        return events
+
+    async def _run(self, changes_file, cycles):
+        async with contextlib.AsyncExitStack() as sessions:
+            aiomeraki = await async_pipeline.open_session(
+                sessions, self.api_key, async_pipeline.debug_options(self.debug_app), self.base_url, self.key_pool,
+                request_timeout=self.request_timeout)
+            scheduler = async_scheduler.OrgScheduler()
+
+            cycle = 0
+            while not cycles or cycle < cycles:
+                cycle += 1
+                started = time.monotonic()
+                cycle_time = str(datetime.datetime.now())
+                # circuits are per cycle, an org that failed last cycle is tried again
+                scheduler.breaker = async_breaker.CircuitBreaker(self.max_org_failures)
+
+                events = self._diff(*await self._cycle(aiomeraki, scheduler))
+                for event in events:
+                    changes_file.write(json.dumps({'cycle': cycle_time, **event}, default=dict) + '\n')
+                changes_file.flush()
+
+                counts = {change: sum(event['change'] == change for event in events) for change in ['added', 'modified', 'removed']}
+                click.secho(
+                    f'{cycle_time} cycle {cycle}: {len(self.records)} records, {counts["added"]} added, '
+                    f'{counts["modified"]} modified, {counts["removed"]} removed '
+                    f'({time.monotonic() - started:.1f}s)', fg='green'
+                    )
+
+                if cycles and cycle >= cycles:
+                    break
+                await asyncio.sleep(max(0, self.interval - (time.monotonic() - started)))
+
+    def run(self, changes_path, cycles=0):
+        ''' poll until interrupted (or for `cycles` cycles), appending change events to changes_path as NDJSON '''
+        pathlib.Path(changes_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(changes_path, 'a') as changes_file:
+            loop = asyncio.get_event_loop()
+            loop.run_until_complete(self._run(changes_file, cycles))
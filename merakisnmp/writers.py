@@ -0,0 +1,338 @@
+import os
+import csv
+import gzip
+import json
+import queue
+import shutil
+import pathlib
+import tempfile
+import textwrap
+import threading
+import collections
+
+import click
+
+__author__ = 'Zach Brewer'
+__email__ = 'zbrewer@cisco.com'
+__version__ = '0.1.0'
+__license__ = 'MIT'
+
+'''
+streaming result writers
+
+records are appended to the output files as each API call completes instead of buffering the whole run, so memory
+stays flat no matter how many networks a run covers
+    JsonWriter   - same layout as json.dumps(records, indent=4), written one record at a time
+    NdjsonWriter - one JSON record per line
+    CsvWriter    - header is the union of every record's keys (in first seen order) so records with differing
+                   schemas do not break the header, rows are spooled to a temp file until the header is known
+
+every file is written to a temp file next to it and renamed into place when it is closed, so a results file is
+never seen half written.  the writers are closed however the with block exits: a run that is interrupted or
+fails (KeyboardInterrupt, WorkerError) renames the records written so far into place as valid partial results,
+only a process that is killed leaves the temp file instead.  with compress=True files are gzip compressed as they
+are written (name.json.gz).
+PartitionedWriter writes one set of files per org, BackgroundWriter moves the writing onto a writer thread
+
+records can be dicts or records.Record objects
+'''
+
+OUTPUT_FORMATS = ['json', 'ndjson']
+
+# gzip level, 6 is zlib's default balance of speed and size
+COMPRESS_LEVEL = 6
+
+# records waiting for the background writer thread before write() blocks
+QUEUE_SIZE = 10000
+
+# org partition files kept open at once by a PartitionedWriter, others are reopened (appended to) when needed
+MAX_OPEN_PARTITIONS = 128
+
+
+def _open(path, compress=False, mode='w', newline=None):
+    if compress:
+        return gzip.open(path, mode + 't', compresslevel=COMPRESS_LEVEL, newline=newline)
+    return open(path, mode, newline=newline)
+
+
+def _suffix(extension, compress):
+    return extension + ('.gz' if compress else '')
+
+
+class AtomicFile:
+    ''' text file written as a temp file in the same dir and renamed over path when closed '''
+
+    def __init__(self, path, compress=False, newline=None):
+        self.path = path
+        temp_fd, self._temp_path = tempfile.mkstemp(
+            prefix=f'.{pathlib.Path(path).name}.', suffix='.tmp', dir=pathlib.Path(path).parent)
+        os.close(temp_fd)
+        self._file = _open(self._temp_path, compress, newline=newline)
+
+    def write(self, text):
+        self._file.write(text)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+
+
+class JsonWriter:
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.count = 0
+        self._file = AtomicFile(path, compress)
+
+    def write(self, record):
+        self._file.write(',\n' if self.count else '[\n')
+        self._file.write(textwrap.indent(json.dumps(record, indent=4, default=dict), '    '))
+        self.count += 1
+
+    def close(self):
+        self._file.write('\n]' if self.count else '[]')
+        self._file.close()
+
+
+class NdjsonWriter:
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.count = 0
+        self._file = AtomicFile(path, compress)
+
+    def write(self, record):
+        self._file.write(json.dumps(record, default=dict) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+
+
+def _write_csv(path, fieldnames, ndjson_lines, compress=False):
+    output_file = AtomicFile(path, compress, newline='')
+    try:
+        if fieldnames:
+            dict_writer = csv.DictWriter(output_file, list(fieldnames))
+            dict_writer.writeheader()
+            for line in ndjson_lines:
+                dict_writer.writerow(json.loads(line))
+    finally:
+        output_file.close()
+
+
+class CsvWriter:
+    def __init__(self, path, compress=False):
+        self.path = path
+        self.compress = compress
+        self.count = 0
+        # dict used as an ordered set of field names
+        self.fieldnames = {}
+
+        spool_fd, self._spool_path = tempfile.mkstemp(suffix='.ndjson', dir=pathlib.Path(path).parent)
+        self._spool = os.fdopen(spool_fd, 'w')
+
+    def write(self, record):
+        self.fieldnames.update(dict.fromkeys(record))
+        self._spool.write(json.dumps(record, default=dict) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._spool.close()
+        try:
+            with open(self._spool_path, 'r') as spool:
+                _write_csv(self.path, self.fieldnames, spool, self.compress)
+        finally:
+            os.remove(self._spool_path)
+
+
+def tee(*writes):
+    ''' one write callback that passes each record to every given callback '''
+    def write(record):
+        for write_record in writes:
+            write_record(record)
+    return write
+
+
+class ResultWriter:
+    '''
+    writes each record to a json (or ndjson) file and a csv file named snmp_settings_[current_time] in output_dir
+
+    Usage:
+        with ResultWriter(output_dir, current_time) as writer:
+            writer.write(record)
+    '''
+
+    def __init__(self, output_dir, current_time, output_format='json', compress=False):
+        pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+        f_name = 'snmp_settings_' + str(current_time)
+
+        self.output_format = output_format
+        if output_format == 'ndjson':
+            self.json_writer = NdjsonWriter(pathlib.Path(output_dir) / (f_name + _suffix('.ndjson', compress)), compress)
+        else:
+            self.json_writer = JsonWriter(pathlib.Path(output_dir) / (f_name + _suffix('.json', compress)), compress)
+        self.csv_writer = CsvWriter(pathlib.Path(output_dir) / (f_name + _suffix('.csv', compress)), compress)
+
+    @property
+    def count(self):
+        return self.json_writer.count
+
+    def write(self, record):
+        self.json_writer.write(record)
+        self.csv_writer.write(record)
+
+    def close(self):
+        self.json_writer.close()
+        self.csv_writer.close()
+
+        click.secho(
+            f'snmp settings { self.output_format.upper() } results written to file: { self.json_writer.path }', fg='green'
+            )
+        click.secho(
+            f'snmp settings CSV results written to file: { self.csv_writer.path }', fg='green'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PartitionedWriter:
+    '''
+    writes each org's records to their own files, [org ID].json (or .ndjson) and [org ID].csv, in a
+    snmp_settings_[current_time] dir in output_dir
+
+    records are appended to one NDJSON file per org as they arrive (at most MAX_OPEN_PARTITIONS open at once, gzip
+    files reopened for appending get another gzip member which every gzip reader handles), the json and csv files
+    are made from it on close.  the files are built in a .tmp dir that is renamed into place once every org is done
+    '''
+
+    def __init__(self, output_dir, current_time, output_format='json', compress=False):
+        self.output_format = output_format
+        self.compress = compress
+        self.count = 0
+        self.path = pathlib.Path(output_dir) / f'snmp_settings_{current_time}'
+        self._temp_dir = self.path.with_name(self.path.name + '.tmp')
+        self._temp_dir.mkdir(parents=True, exist_ok=True)
+
+        # org ID -> ordered set of field names
+        self.fieldnames = {}
+        self._open_files = collections.OrderedDict()
+
+    def _spool_path(self, org_id):
+        return self._temp_dir / f'{org_id}.spool{_suffix(".ndjson", self.compress)}'
+
+    def _file(self, org_id):
+        partition = self._open_files.get(org_id)
+        if partition is not None:
+            self._open_files.move_to_end(org_id)
+            return partition
+
+        if len(self._open_files) >= MAX_OPEN_PARTITIONS:
+            self._open_files.popitem(last=False)[1].close()
+        partition = self._open_files[org_id] = _open(self._spool_path(org_id), self.compress, mode='a')
+        return partition
+
+    def write(self, record):
+        org_id = str(record['organizationId'])
+        self.fieldnames.setdefault(org_id, {}).update(dict.fromkeys(record))
+        self._file(org_id).write(json.dumps(record, default=dict) + '\n')
+        self.count += 1
+
+    def _finish(self, org_id):
+        spool_path = self._spool_path(org_id)
+        with _open(spool_path, self.compress, mode='r') as spool:
+            _write_csv(self._temp_dir / f'{org_id}{_suffix(".csv", self.compress)}', self.fieldnames[org_id], spool, self.compress)
+
+        if self.output_format == 'ndjson':
+            spool_path.rename(self._temp_dir / f'{org_id}{_suffix(".ndjson", self.compress)}')
+            return
+
+        json_writer = JsonWriter(self._temp_dir / f'{org_id}{_suffix(".json", self.compress)}', self.compress)
+        with _open(spool_path, self.compress, mode='r') as spool:
+            for line in spool:
+                json_writer.write(json.loads(line))
+        json_writer.close()
+        spool_path.unlink()
+
+    def close(self):
+        for partition in self._open_files.values():
+            partition.close()
+        self._open_files.clear()
+
+        for org_id in self.fieldnames:
+            self._finish(org_id)
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self._temp_dir.rename(self.path)
+
+        click.secho(
+            f'snmp settings { self.output_format.upper() } and CSV results for { len(self.fieldnames) } organizations '
+            f'written to: { self.path }', fg='green'
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_writer(output_dir, current_time, output_format='json', compress=False, partition=False):
+    ''' a ResultWriter, or a PartitionedWriter (one set of files per org) with partition=True '''
+    if partition:
+        return PartitionedWriter(output_dir, current_time, output_format, compress)
+    return ResultWriter(output_dir, current_time, output_format, compress)
+
+
+class BackgroundWriter:
+    '''
+    runs write callbacks on a writer thread fed by a bounded queue, so serialising, compressing and writing records
+    overlaps with the API calls.  write() blocks once QUEUE_SIZE records are waiting, an error on the writer thread
+    is raised by the next write() or by close()
+
+    Usage:
+        with ResultWriter(...) as writer, BackgroundWriter() as background:
+            write = background.wrap(writer.write)
+    '''
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='merakisnmp-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # after an error the queue is still drained so write() never blocks for good
+            if self._error is None:
+                write, record = item
+                try:
+                    write(record)
+                except Exception as e:
+                    self._error = e
+
+    def wrap(self, write):
+        ''' write callback that queues records for `write` on the writer thread '''
+        def queued(record):
+            if self._error is not None:
+                raise self._error
+            self._queue.put((write, record))
+        return queued
+
+    def close(self):
+        ''' wait for every queued record to be written '''
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,113 @@
+import types
+import asyncio
+import logging
+
+import meraki
+
+from merakisnmp import api
+from merakisnmp import records
+
+
+def _run(coroutine):
+    ''' run on a loop of its own, asyncio.run() would leave the pipeline's get_event_loop() without a loop '''
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _api_error(operation, status=404):
+    body = {'errors': ['Not found']}
+    response = types.SimpleNamespace(status_code=status, reason_phrase='Not Found', headers={}, json=lambda: body)
+    return meraki.exceptions.APIError({'tags': ['organizations'], 'operation': operation}, response)
+
+
+ORGS = [{'id': '1', 'name': 'acme', 'url': 'https://acme'}, {'id': '2', 'name': 'globex', 'url': 'https://globex'}]
+
+NETWORKS = {
+    '1': [
+        {'id': 'N_1', 'organizationId': '1', 'name': 'store 1', 'productTypes': ['switch']},
+        {'id': 'N_2', 'organizationId': '1', 'name': 'store 2', 'productTypes': ['wireless']},
+    ],
+    '2': [{'id': 'N_3', 'organizationId': '2', 'name': 'hq', 'productTypes': ['appliance']}],
+}
+
+
+def _session(failing=()):
+    ''' a stub session, the orgs and networks in failing answer every call with a 404 '''
+    async def getOrganizationSnmp(organizationId):
+        if organizationId in failing:
+            raise _api_error('getOrganizationSnmp')
+        return {'v2cEnabled': True, 'v3Enabled': False, 'v2CommunityString': 'secret'}
+
+    async def getOrganizationNetworks(organizationId, perPage=1000, startingAfter=None, **kwargs):
+        if organizationId in failing:
+            raise _api_error('getOrganizationNetworks')
+        networks = NETWORKS[organizationId]
+        start = next((index + 1 for index, network in enumerate(networks) if network['id'] == startingAfter), 0)
+        return networks[start:start + perPage]
+
+    async def getNetworkSnmp(networkId):
+        if networkId in failing:
+            raise _api_error('getNetworkSnmp')
+        return {'access': 'community', 'communityString': 'secret', 'users': []}
+
+    return types.SimpleNamespace(
+        organizations=types.SimpleNamespace(
+            getOrganizationSnmp=getOrganizationSnmp, getOrganizationNetworks=getOrganizationNetworks),
+        networks=types.SimpleNamespace(getNetworkSnmp=getNetworkSnmp),
+    )
+
+
+def _collect(records_iter):
+    async def collect():
+        return [record async for record in records_iter]
+    return _run(collect())
+
+
+def test_iter_snmp_yields_org_network_and_network_snmp_records():
+    collected = _collect(api.iter_snmp(_session(), ORGS))
+
+    assert sorted(record['organizationId'] for record in collected if isinstance(record, records.OrgSnmpRecord)) == ['1', '2']
+    assert sorted(record['networkId'] for record in collected if isinstance(record, records.NetworkRecord)) == ['N_1', 'N_2', 'N_3']
+    network_snmp = [record for record in collected if isinstance(record, records.NetworkSnmpRecord)]
+    assert sorted(record['networkId'] for record in network_snmp) == ['N_1', 'N_2', 'N_3']
+    # community strings never leave the pipeline
+    assert {record['snmpCommunitystring'] for record in network_snmp} == {'****'}
+
+
+def test_iter_snmp_without_networks_only_yields_org_records():
+    collected = _collect(api.iter_snmp(_session(), ORGS, networks=False))
+    assert [type(record) for record in collected] == [records.OrgSnmpRecord, records.OrgSnmpRecord]
+
+
+def test_failed_calls_are_logged_not_printed(caplog, capsys):
+    session = _session(failing={'2', 'N_1'})
+    with caplog.at_level(logging.WARNING, logger='merakisnmp'):
+        collected = _collect(api.iter_snmp(session, ORGS))
+
+    # org 2 and network N_1 are skipped, everything else is yielded
+    assert sorted(record['organizationId'] for record in collected if isinstance(record, records.OrgSnmpRecord)) == ['1']
+    assert sorted(record['networkId'] for record in collected if isinstance(record, records.NetworkSnmpRecord)) == ['N_2']
+
+    messages = [record.getMessage() for record in caplog.records if record.name == 'merakisnmp']
+    assert len(messages) == 3
+    assert all(record.levelno == logging.WARNING for record in caplog.records if record.name == 'merakisnmp')
+    assert any('globex' in message and 'getOrganizationSnmp' in message for message in messages)
+    assert any('getNetworkSnmp' in message for message in messages)
+    assert capsys.readouterr().out == ''
+
+
+def test_single_endpoint_iterators(caplog, capsys):
+    session = _session(failing={'2'})
+    with caplog.at_level(logging.WARNING, logger='merakisnmp'):
+        org_snmp = _collect(api.iter_org_snmp(session, ORGS))
+        networks = _collect(api.iter_networks(session, ORGS))
+        network_snmp = _collect(api.iter_network_snmp(session, networks, concurrency=1))
+
+    assert [record['organizationId'] for record in org_snmp] == ['1']
+    assert sorted(record['networkId'] for record in networks) == ['N_1', 'N_2']
+    assert sorted(record['networkId'] for record in network_snmp) == ['N_1', 'N_2']
+    assert len([record for record in caplog.records if record.name == 'merakisnmp']) == 2
+    assert capsys.readouterr().out == ''
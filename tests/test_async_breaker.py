@@ -0,0 +1,51 @@
+import types
+
+import pytest
+
+from merakisnmp.async_code import async_breaker
+
+
+def _error(status):
+    return types.SimpleNamespace(status=status)
+
+
+def test_the_circuit_opens_after_consecutive_failures():
+    opened = []
+    breaker = async_breaker.CircuitBreaker(threshold=3, on_open=opened.append)
+    for _ in range(2):
+        breaker.failure('1', 'getNetworkSnmp', _error(500))
+    breaker.check('1')
+
+    breaker.failure('1', 'getNetworkSnmp', _error(500))
+    assert len(opened) == 1
+    with pytest.raises(async_breaker.CircuitOpenError):
+        breaker.check('1')
+    # other orgs carry on
+    breaker.check('2')
+
+    report = breaker.report([{'id': '1', 'name': 'Org 1'}])
+    assert report[0]['organizationName'] == 'Org 1'
+    assert report[0]['circuit'] == 'open'
+    assert report[0]['skippedCalls'] == 1
+
+
+def test_a_success_resets_the_count():
+    breaker = async_breaker.CircuitBreaker(threshold=2, on_open=print)
+    breaker.failure('1', 'getNetworkSnmp', _error(403))
+    breaker.success('1')
+    breaker.failure('1', 'getNetworkSnmp', _error(403))
+    breaker.check('1')
+    assert breaker.orgs['1']['failures'] == 2
+
+
+def test_request_level_errors_are_not_counted():
+    breaker = async_breaker.CircuitBreaker(threshold=1, on_open=print)
+    breaker.failure('1', 'getNetworkSnmp', _error(400))
+    breaker.failure('1', 'getNetworkSnmp', _error(404))
+    breaker.check('1')
+    assert breaker.orgs == {}
+
+    # timeouts and other exceptions have no status and are org level
+    breaker.failure('1', 'getNetworkSnmp', TimeoutError())
+    with pytest.raises(async_breaker.CircuitOpenError):
+        breaker.check('1')
@@ -0,0 +1,86 @@
+import types
+import asyncio
+import threading
+
+import meraki
+
+from benchmarks import mock_dashboard
+from merakisnmp import limits
+from merakisnmp.async_code import async_getorgnetworks
+from merakisnmp.async_code import async_scheduler
+
+
+def _run(coroutine):
+    ''' run on a loop of its own, asyncio.run() would leave the pipeline's get_event_loop() without a loop '''
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _api_error(status, retry_after=None):
+    ''' an APIError with the status and Retry-After header the scheduler reads (its constructor differs by SDK release) '''
+    error = meraki.exceptions.APIError.__new__(meraki.exceptions.APIError)
+    error.tag, error.operation, error.status, error.reason, error.message = 'organizations', 'getOrganizationNetworks', status, None, None
+    error.response = types.SimpleNamespace(headers={'Retry-After': str(retry_after)} if retry_after is not None else {})
+    return error
+
+
+class CountingScheduler(async_scheduler.OrgScheduler):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def call(self, org_id, func, *args, **kwargs):
+        self.calls += 1
+        return await super().call(org_id, func, *args, **kwargs)
+
+
+def test_each_page_of_networks_is_a_scheduler_call(monkeypatch):
+    monkeypatch.setattr(limits, 'NETWORKS_PER_PAGE', 3)
+    estate = mock_dashboard.Estate(orgs=2, networks=13, largest_share=7 / 13)
+    server = mock_dashboard.MockDashboardServer(('127.0.0.1', 0), estate, latency=0, jitter=0, org_rate=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    async def run():
+        async with async_scheduler.sdk_session(
+                '0' * 40, base_url=server.base_url, output_log=False, print_console=False, suppress_logging=True) as aiomeraki:
+            listings = []
+            for organization in estate.orgs:
+                scheduler = CountingScheduler()
+                networks = await async_getorgnetworks._get_orgnetworks(aiomeraki, organization, scheduler)
+                listings.append(([network['networkId'] for network in networks], scheduler.calls))
+            return listings
+
+    try:
+        listings = _run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    for organization, (network_ids, calls) in zip(estate.orgs, listings):
+        assert network_ids == [network['id'] for network in estate.networks[organization['id']]]
+    # 7 networks are pages of 3, 3 and 1, 6 networks need an empty page to see that the second was the last
+    assert [calls for _, calls in listings] == [3, 3]
+
+
+def test_a_429_only_retries_the_page_it_hit(monkeypatch):
+    monkeypatch.setattr(limits, 'NETWORKS_PER_PAGE', 2)
+    networks = [{'id': f'N_{index}', 'name': f'network {index}'} for index in range(5)]
+    requests = []
+
+    async def getOrganizationNetworks(organizationId, perPage, startingAfter=None, **kwargs):
+        requests.append(startingAfter)
+        if startingAfter == 'N_1' and requests.count('N_1') == 1:
+            raise _api_error(429, retry_after=0.01)
+        start = next((index + 1 for index, network in enumerate(networks) if network['id'] == startingAfter), 0)
+        return networks[start:start + perPage]
+
+    session = types.SimpleNamespace(
+        organizations=types.SimpleNamespace(getOrganizationNetworks=getOrganizationNetworks))
+    organization = {'id': '1', 'name': 'acme', 'url': None}
+    listed = _run(async_getorgnetworks._get_orgnetworks(session, organization, async_scheduler.OrgScheduler()))
+
+    assert [network['networkId'] for network in listed] == ['N_0', 'N_1', 'N_2', 'N_3', 'N_4']
+    assert requests == [None, 'N_1', 'N_1', 'N_3']
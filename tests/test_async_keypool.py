@@ -0,0 +1,117 @@
+import types
+import asyncio
+
+import meraki
+import pytest
+
+from merakisnmp import keypool
+from merakisnmp.async_code import async_keypool
+
+
+def _run(coroutine):
+    ''' run on a loop of its own, asyncio.run() would leave the pipeline's get_event_loop() without a loop '''
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _api_error(status, retry_after=None):
+    ''' an APIError with the status and Retry-After header the pool reads (its constructor differs by SDK release) '''
+    error = meraki.exceptions.APIError.__new__(meraki.exceptions.APIError)
+    error.tag, error.operation, error.status, error.reason, error.message = 'networks', 'getNetworkSnmp', status, None, None
+    error.response = types.SimpleNamespace(headers={'Retry-After': str(retry_after)} if retry_after is not None else {})
+    return error
+
+
+def _pool(responses, org_keys=('key_a', 'key_b', 'key_c')):
+    '''
+    a session pool over stub sessions, responses maps each key to what its getNetworkSnmp does (an APIError to raise,
+    anything else is returned), calls lists the keys in the order they were called
+    '''
+    calls = []
+
+    def session(api_key):
+        async def getNetworkSnmp(network_id):
+            calls.append(api_key)
+            response = responses.get(api_key, {'networkId': network_id, 'key': api_key})
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return types.SimpleNamespace(networks=types.SimpleNamespace(getNetworkSnmp=getNetworkSnmp))
+
+    key_pool = keypool.KeyPool()
+    for api_key in org_keys:
+        key_pool.add(api_key, [{'id': '1', 'name': 'acme'}])
+    return async_keypool.SessionPool(key_pool, {api_key: session(api_key) for api_key in org_keys}), calls
+
+
+def test_load_keys_reads_the_file_and_the_environment(tmp_path, monkeypatch):
+    keys_file = tmp_path / 'apikeys.txt'
+    keys_file.write_text('# ops keys\nkey_a\n\nkey_b\n')
+    monkeypatch.setenv(keypool.ENV_VAR, 'key_b, key_c key_d')
+
+    assert keypool.load_keys(keys_file) == ['key_a', 'key_b', 'key_c', 'key_d']
+
+
+def test_the_pooled_endpoint_calls_one_of_the_orgs_keys():
+    pool, calls = _pool({})
+    call = pool.networks.getNetworkSnmp.for_org('1')
+
+    assert _run(call('N_1')) == {'networkId': 'N_1', 'key': 'key_a'}
+    assert calls == ['key_a']
+
+
+def test_a_401_revokes_the_key_for_the_rest_of_the_run():
+    pool, calls = _pool({'key_a': _api_error(401)})
+    call = pool.networks.getNetworkSnmp.for_org('1')
+
+    assert _run(call('N_1'))['key'] == 'key_b'
+    assert _run(call('N_2'))['key'] == 'key_b'
+    assert calls == ['key_a', 'key_b', 'key_b']
+
+
+def test_a_403_moves_the_call_to_the_orgs_next_key():
+    pool, calls = _pool({'key_a': _api_error(403)})
+    call = pool.networks.getNetworkSnmp.for_org('1')
+
+    assert _run(call('N_1'))['key'] == 'key_b'
+    # a 403 is for this call only, the key is tried again on the next one
+    _run(call('N_2'))
+    assert calls == ['key_a', 'key_b', 'key_a', 'key_b']
+
+
+def test_a_429_pauses_the_key_and_is_left_to_the_scheduler():
+    pool, calls = _pool({'key_a': _api_error(429, retry_after=30)})
+    call = pool.networks.getNetworkSnmp.for_org('1')
+
+    with pytest.raises(meraki.exceptions.APIError):
+        _run(call('N_1'))
+    # the scheduler's retry goes to a key that is not paused
+    assert _run(call('N_1'))['key'] == 'key_b'
+    assert calls == ['key_a', 'key_b']
+
+
+def test_other_errors_are_raised_without_trying_another_key():
+    pool, calls = _pool({'key_a': _api_error(404)})
+
+    with pytest.raises(meraki.exceptions.APIError) as raised:
+        _run(pool.networks.getNetworkSnmp.for_org('1')('N_1'))
+    assert raised.value.status == 404
+    assert calls == ['key_a']
+
+
+def test_when_every_key_is_revoked_the_last_error_is_raised():
+    pool, calls = _pool({api_key: _api_error(401) for api_key in ('key_a', 'key_b', 'key_c')})
+    call = pool.networks.getNetworkSnmp.for_org('1')
+
+    with pytest.raises(meraki.exceptions.APIError) as raised:
+        _run(call('N_1'))
+    assert raised.value.status == 401
+    assert calls == ['key_a', 'key_b', 'key_c']
+
+    # nothing is left to call with
+    with pytest.raises(RuntimeError, match='no usable API key'):
+        _run(call('N_2'))
+    assert len(calls) == 3
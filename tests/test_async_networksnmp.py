@@ -0,0 +1,99 @@
+import types
+import asyncio
+
+import meraki
+
+from merakisnmp import cache
+from merakisnmp import records
+from merakisnmp.async_code import async_networksnmp
+
+
+def _run(coroutine):
+    ''' run on a loop of its own, asyncio.run() would leave the pipeline's get_event_loop() without a loop '''
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _unsupported_error():
+    ''' the 400 getNetworkSnmp returns for camera and sensor only networks, the pipeline matches its message '''
+    body = {'errors': ['This network does not support SNMP configuration']}
+    response = types.SimpleNamespace(status_code=400, reason_phrase='Bad Request', headers={}, json=lambda: body)
+    return meraki.exceptions.APIError({'tags': ['networks'], 'operation': 'getNetworkSnmp'}, response)
+
+
+class Scheduler:
+    ''' calls straight through, as OrgScheduler does when nothing is throttled '''
+
+    async def call(self, org_id, func, *args, **kwargs):
+        return await func(*args, **kwargs)
+
+
+def _session(configs, calls):
+    ''' a stub session, configs maps network IDs to a getNetworkSnmp response (networks not listed are unsupported) '''
+    async def getNetworkSnmp(networkId):
+        calls.append(networkId)
+        if networkId not in configs:
+            raise _unsupported_error()
+        return configs[networkId]
+    return types.SimpleNamespace(networks=types.SimpleNamespace(getNetworkSnmp=getNetworkSnmp))
+
+
+def _network(network_id, product_types=('camera',), template=None):
+    return {
+        'networkName': network_id.lower(), 'networkId': network_id, 'networkUrl': None, 'organizationName': 'acme',
+        'organizationId': '1', 'organizationUrl': None, 'productTypes': list(product_types), 'configTemplateId': template,
+    }
+
+
+CONFIG = {'access': 'community', 'communityString': 'secret', 'users': []}
+
+
+def test_unsupported_networks_are_skipped_on_the_next_run(tmp_path):
+    path = tmp_path / 'cache.sqlite'
+    calls, errors = [], []
+    session = _session({'N_switch': CONFIG}, calls)
+    networks = [_network('N_camera'), _network('N_switch', ('switch',))]
+
+    response_cache = cache.ResponseCache(path)
+    for network in networks:
+        _run(async_networksnmp._get_snmp(session, network, Scheduler(), response_cache, on_error=errors.append))
+    response_cache.close()
+    assert calls == ['N_camera', 'N_switch']
+    assert len(errors) == 1
+
+    # the supported network comes from the response cache and the unsupported one is not called again
+    response_cache = cache.ResponseCache(path)
+    results = [_run(async_networksnmp._get_snmp(session, network, Scheduler(), response_cache)) for network in networks]
+    response_cache.close()
+    assert calls == ['N_camera', 'N_switch']
+    assert results[0] == {}
+    assert results[1][0]['snmpCommunitystring'] == '****'
+
+
+def test_failures_other_than_unsupported_are_not_remembered(tmp_path):
+    response_cache = cache.ResponseCache(tmp_path / 'cache.sqlite')
+
+    async def getNetworkSnmp(networkId):
+        raise RuntimeError('connection reset')
+    session = types.SimpleNamespace(networks=types.SimpleNamespace(getNetworkSnmp=getNetworkSnmp))
+
+    _run(async_networksnmp._get_snmp(session, _network('N_1'), Scheduler(), response_cache, on_error=lambda message: None))
+    assert response_cache.support_counts() == (0, 0)
+    assert not response_cache.known_unsupported(_network('N_1'))
+    response_cache.close()
+
+
+def test_inferred_records_carry_the_template_they_were_inferred_from():
+    network = _network('N_bound', ('switch',), template='L_1')
+    inferred = async_networksnmp._inferred_records(network, CONFIG)
+
+    assert len(inferred) == 1
+    assert isinstance(inferred[0], records.InferredNetworkSnmpRecord)
+    assert inferred[0]['networkId'] == 'N_bound'
+    assert inferred[0]['snmpCommunitystring'] == '****'
+    assert inferred[0]['inferredFromTemplate'] == 'L_1'
+    # nothing to infer from a sample that failed
+    assert async_networksnmp._inferred_records(network, {}) == []
@@ -0,0 +1,134 @@
+import time
+import types
+import asyncio
+
+import meraki
+import meraki.aio
+import pytest
+
+from merakisnmp.async_code import async_scheduler
+
+
+def test_sdk_session_turns_smart_flow_off():
+    assert async_scheduler.sdk_session_options()['smart_flow_enabled'] is False
+
+
+def test_sdk_session_without_smart_flow_support(monkeypatch):
+    made = []
+
+    class OlderSDK:
+        # a wrapped constructor, its signature does not show which options it takes
+        def __init__(self, api_key, **options):
+            if 'smart_flow_enabled' in options:
+                raise TypeError("__init__() got an unexpected keyword argument 'smart_flow_enabled'")
+            made.append(options)
+
+    monkeypatch.setattr(meraki.aio, 'AsyncDashboardAPI', OlderSDK)
+    async_scheduler.sdk_session('0' * 40, request_timeout=5, output_log=False)
+
+    assert made == [{**{key: value for key, value in async_scheduler.sdk_session_options(5).items()
+                        if key != 'smart_flow_enabled'}, 'output_log': False}]
+
+
+def _run(coroutine):
+    ''' run on a loop of its own, asyncio.run() would leave the pipeline's get_event_loop() without a loop '''
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _api_error(status, retry_after=None):
+    ''' an APIError with the status and Retry-After header the scheduler reads (its constructor differs by SDK release) '''
+    error = meraki.exceptions.APIError.__new__(meraki.exceptions.APIError)
+    error.tag, error.operation, error.status, error.reason, error.message = 'networks', 'getNetworkSnmp', status, None, None
+    error.response = types.SimpleNamespace(headers={'Retry-After': str(retry_after)} if retry_after is not None else {})
+    return error
+
+
+def test_token_bucket_spends_its_burst_then_refills_at_its_rate():
+    bucket = async_scheduler.TokenBucket(rate=10, capacity=2)
+    now = bucket.updated
+
+    for _ in range(2):
+        assert bucket.delay(now) == 0
+        bucket.take(now)
+    assert bucket.delay(now) == pytest.approx(0.1)
+    assert bucket.delay(now + 0.1) == 0
+    # never refills past its capacity
+    bucket._refill(now + 60)
+    assert bucket.tokens == 2
+
+
+def test_token_bucket_throttle_pauses_and_halves_the_rate():
+    bucket = async_scheduler.TokenBucket(rate=10, capacity=10)
+    now = bucket.updated
+
+    bucket.throttle(now, retry_after=2)
+    assert bucket.tokens == 0
+    assert bucket.rate == 5
+    assert bucket.delay(now) == pytest.approx(2)
+    assert bucket.delay(now + 2) == pytest.approx(1 / 5)
+
+    for _ in range(20):
+        bucket.recover()
+    assert bucket.rate == 10
+
+
+def test_scheduler_retries_a_429_after_retry_after():
+    scheduler = async_scheduler.OrgScheduler()
+    attempts = []
+
+    async def getNetworkSnmp():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise _api_error(429, retry_after=0.2)
+        return {'access': 'none'}
+
+    assert _run(scheduler.call('org', getNetworkSnmp)) == {'access': 'none'}
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.2
+    # halved by the 429, then nudged back up by the successful retry
+    assert scheduler._buckets['org'].rate == async_scheduler.ORG_RATE / 2 + 0.5
+    assert scheduler.concurrency == async_scheduler.START_CONCURRENCY - 1
+
+
+def test_scheduler_gives_up_after_max_retries_and_raises_other_errors():
+    scheduler = async_scheduler.OrgScheduler(max_retries=2)
+    attempts = []
+
+    async def throttled():
+        attempts.append(1)
+        raise _api_error(429, retry_after=0.01)
+
+    async def bad_request():
+        raise _api_error(400)
+
+    with pytest.raises(meraki.exceptions.APIError):
+        _run(scheduler.call('org', throttled))
+    assert len(attempts) == 3
+
+    with pytest.raises(meraki.exceptions.APIError):
+        _run(scheduler.call('other org', bad_request))
+    assert scheduler._buckets['other org'].rate == async_scheduler.ORG_RATE
+
+
+def test_scheduler_holds_each_org_to_its_rate():
+    scheduler = async_scheduler.OrgScheduler(rate=20, burst=2)
+    calls = []
+
+    async def call(org_id):
+        calls.append((org_id, time.monotonic()))
+
+    async def run():
+        await asyncio.gather(*[scheduler.call(org_id, call, org_id) for org_id in ['a', 'b'] for _ in range(6)])
+
+    start = time.monotonic()
+    _run(run())
+    for org_id in ['a', 'b']:
+        times = [called for called_org, called in calls if called_org == org_id]
+        # 2 straight away, the other 4 at 20 per second
+        assert times[-1] - start >= 4 / 20 * 0.9
+    # both orgs are served side by side, not one after the other
+    assert max(called for _, called in calls) - start < 8 / 20
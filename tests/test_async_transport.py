@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+import pytest
+
+from benchmarks import mock_dashboard
+from merakisnmp.async_code import async_scheduler
+from merakisnmp.async_code import async_transport
+
+# SDK releases before the httpx based async client keep their own pool
+pytestmark = pytest.mark.skipif(async_transport.httpx is None, reason='meraki SDK without the httpx client')
+
+
+@pytest.fixture
+def dashboard():
+    estate = mock_dashboard.Estate(orgs=2, networks=4)
+    server = mock_dashboard.MockDashboardServer(('127.0.0.1', 0), estate, latency=0, jitter=0, org_rate=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield estate, server.base_url
+    server.shutdown()
+    server.server_close()
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _session(base_url, **options):
+    return async_scheduler.sdk_session(
+        '0' * 40, base_url=base_url, output_log=False, print_console=False, suppress_logging=True, **options)
+
+
+def test_attach_keeps_the_sdk_client_settings_and_closes_its_pool(dashboard):
+    estate, base_url = dashboard
+
+    async def run():
+        transport = async_transport.SharedTransport()
+        async with _session(base_url, single_request_timeout=7) as aiomeraki:
+            sdk_client = aiomeraki._session._client
+            assert await transport.attach(aiomeraki)
+            client = aiomeraki._session._client
+
+            assert sdk_client.is_closed
+            for setting in ['base_url', 'headers', 'timeout', 'follow_redirects', 'max_redirects', 'event_hooks', 'trust_env']:
+                assert getattr(client, setting) == getattr(sdk_client, setting)
+            assert client.timeout.read == 7
+            assert await aiomeraki.organizations.getOrganizations() == estate.orgs
+
+        # closing a session leaves the shared pool open for the next one
+        async with _session(base_url) as aiomeraki:
+            assert await transport.attach(aiomeraki)
+            assert await aiomeraki.organizations.getOrganizations() == estate.orgs
+        await transport.aclose()
+
+    _run(run())
+
+
+def test_sessions_with_a_proxy_keep_their_own_pool(dashboard):
+    _, base_url = dashboard
+
+    async def run():
+        transport = async_transport.SharedTransport()
+        async with _session(base_url, requests_proxy='http://127.0.0.1:3128') as aiomeraki:
+            sdk_client = aiomeraki._session._client
+            assert not await transport.attach(aiomeraki)
+            assert aiomeraki._session._client is sdk_client
+        await transport.aclose()
+
+    _run(run())
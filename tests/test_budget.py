@@ -0,0 +1,64 @@
+import json
+
+from merakisnmp import budget
+from merakisnmp import cache
+
+
+def _ids(organizations):
+    return [organization['id'] for organization in organizations]
+
+
+ORGS = [{'id': org_id} for org_id in ['1', '2', '3', '4', '5']]
+
+
+def test_network_counts_prefer_the_response_cache(tmp_path):
+    previous = {
+        'N_1': {'organizationId': '1'}, 'N_2': {'organizationId': '1'}, 'N_3': {'organizationId': 2},
+    }
+    response_cache = cache.ResponseCache(tmp_path / 'cache.sqlite')
+    response_cache.set_org_size('2', 40)
+
+    assert budget.network_counts(previous=previous) == {'1': 2, '2': 1}
+    assert budget.network_counts(response_cache, previous) == {'1': 2, '2': 40}
+    response_cache.close()
+
+
+def test_largest_first_places_unknown_orgs_at_the_median():
+    counts = {'1': 10, '2': 50, '3': 5}
+    # 4 and 5 are ordered as if they had 10 networks, orgs with the same count keep their order
+    assert _ids(budget.largest_first(ORGS, counts)) == ['2', '1', '4', '5', '3']
+    assert _ids(budget.largest_first(ORGS, {'3': 7})) == ['1', '2', '3', '4', '5']
+    assert _ids(budget.largest_first(ORGS, {})) == ['1', '2', '3', '4', '5']
+
+
+def test_an_expired_budget_reports_the_unfinished_work(tmp_path, capsys):
+    run_budget = budget.RunBudget(60)
+    assert 59 < run_budget.remaining() <= 60
+
+    run_budget.pending('org', '1', organizationName='acme')
+    run_budget.pending('orgnetworks', '1')
+    run_budget.pending('network', 'N_1', organizationId='1')
+    run_budget.pending('network', 'N_2', organizationId='1')
+    run_budget.done('orgnetworks', '1')
+    run_budget.done('network', 'N_2')
+    assert not run_budget.expired
+
+    run_budget.expire()
+    # unfinished work from a worker process
+    run_budget.extend([{'kind': 'network', 'id': 'N_9', 'organizationId': '9'}])
+    assert run_budget.expired
+    assert [(entry['kind'], entry['id']) for entry in run_budget.unfinished()] == [
+        ('org', '1'), ('network', 'N_1'), ('network', 'N_9')]
+
+    run_budget.write(current_time='now', output_dir=tmp_path / 'unfinished')
+    report = json.loads((tmp_path / 'unfinished' / 'unfinished_now.json').read_text())
+    assert report[0] == {'kind': 'org', 'id': '1', 'organizationName': 'acme'}
+    assert len(report) == 3
+    assert '1 org snmp calls, 0 network listings and 2 network snmp calls not made' in capsys.readouterr().out
+
+
+def test_a_budget_is_not_expired_by_workers_that_finished():
+    run_budget = budget.RunBudget(60)
+    run_budget.extend([])
+    assert not run_budget.expired
+    assert run_budget.unfinished() == []
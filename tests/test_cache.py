@@ -0,0 +1,164 @@
+import sqlite3
+
+import pytest
+
+from merakisnmp import cache
+
+
+class Clock:
+    ''' stands in for time.time() in the cache module '''
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    return clock
+
+
+def _keys(path):
+    with sqlite3.connect(path) as db:
+        return sorted(key for key, in db.execute('SELECT key FROM responses'))
+
+
+def test_entries_expire_after_their_endpoints_ttl(tmp_path, clock):
+    response_cache = cache.ResponseCache(tmp_path / 'cache.sqlite', ttls={'getNetworkSnmp': 60})
+    response_cache.set('getNetworkSnmp', 'N_1', {'access': 'none'})
+    response_cache.set('getOrganizationSnmp', '1', {'v2cEnabled': False})
+
+    clock.now += 60
+    assert response_cache.get('getNetworkSnmp', 'N_1') == {'access': 'none'}
+    assert response_cache.get('getOrganizationSnmp', '1') == {'v2cEnabled': False}
+
+    clock.now += 1
+    assert response_cache.get('getNetworkSnmp', 'N_1') is None
+    # the other endpoints keep the default TTL
+    assert response_cache.get('getOrganizationSnmp', '1') == {'v2cEnabled': False}
+    assert response_cache.get('getNetworkSnmp', 'N_2') is None
+    response_cache.close()
+
+
+def test_entries_are_kept_across_runs(tmp_path, clock):
+    path = tmp_path / 'cache.sqlite'
+    response_cache = cache.ResponseCache(path)
+    response_cache.set('getOrganizationNetworks', 1, [{'id': 'N_1'}])
+    response_cache.close()
+
+    reopened = cache.ResponseCache(path)
+    assert reopened.get('getOrganizationNetworks', '1') == [{'id': 'N_1'}]
+    reopened.close()
+
+
+def test_refresh_misses_every_lookup_but_still_stores(tmp_path, clock):
+    path = tmp_path / 'cache.sqlite'
+    response_cache = cache.ResponseCache(path)
+    response_cache.set('getNetworkSnmp', 'N_1', {'access': 'none'})
+    response_cache.close()
+
+    refreshing = cache.ResponseCache(path, refresh=True)
+    assert refreshing.get('getNetworkSnmp', 'N_1') is None
+    refreshing.set('getNetworkSnmp', 'N_1', {'access': 'community'})
+    refreshing.close()
+
+    reopened = cache.ResponseCache(path)
+    assert reopened.get('getNetworkSnmp', 'N_1') == {'access': 'community'}
+    reopened.close()
+
+
+def test_close_evicts_expired_then_least_recently_used_entries(tmp_path, clock):
+    path = tmp_path / 'cache.sqlite'
+    response_cache = cache.ResponseCache(path, ttls={'getNetworkSnmp': 60}, max_entries=2)
+    for network_id in ['N_1', 'N_2', 'N_3']:
+        response_cache.set('getOrganizationSnmp', network_id, {})
+        clock.now += 1
+    response_cache.set('getNetworkSnmp', 'N_stale', {})
+    clock.now += 1
+    # reading N_1 makes N_2 the least recently used
+    response_cache.get('getOrganizationSnmp', 'N_1')
+    clock.now += 60
+    response_cache.close()
+
+    assert _keys(path) == ['N_1', 'N_3']
+
+
+def test_released_closes_the_connection_for_other_processes(tmp_path, clock):
+    path = tmp_path / 'cache.sqlite'
+    response_cache = cache.ResponseCache(path)
+    response_cache.set('getNetworkSnmp', 'N_1', {'access': 'none'})
+
+    with response_cache.released():
+        # the pending write was committed, another process can see it and write while this one is released
+        other = cache.ResponseCache(path, commit_every=1)
+        assert other.get('getNetworkSnmp', 'N_1') == {'access': 'none'}
+        other.set('getNetworkSnmp', 'N_2', {'access': 'users'})
+        other.close()
+
+    # reopened afterwards, with the other process's writes
+    assert response_cache.get('getNetworkSnmp', 'N_2') == {'access': 'users'}
+    response_cache.close()
+
+
+def _network(network_id, product_types=('camera',)):
+    return {'networkId': network_id, 'productTypes': list(product_types)}
+
+
+def test_unsupported_networks_are_remembered_until_support_ttl(tmp_path, clock):
+    response_cache = cache.ResponseCache(tmp_path / 'cache.sqlite')
+    response_cache.set_support(_network('N_1'), False)
+    response_cache.set_support(_network('N_2', ('switch',)), True)
+
+    assert response_cache.known_unsupported(_network('N_1'))
+    assert not response_cache.known_unsupported(_network('N_2', ('switch',)))
+    assert response_cache.support_counts() == (1, 2)
+
+    clock.now += cache.SUPPORT_TTL + 1
+    # expired entries are probed again
+    assert not response_cache.known_unsupported(_network('N_1'))
+    assert response_cache.support_counts() == (0, 0)
+    response_cache.close()
+
+
+def test_unsupported_networks_are_probed_again_when_their_product_types_change(tmp_path, clock):
+    response_cache = cache.ResponseCache(tmp_path / 'cache.sqlite')
+    response_cache.set_support(_network('N_1', ('camera',)), False)
+
+    # a switch was added to the camera only network
+    assert not response_cache.known_unsupported(_network('N_1', ('switch', 'camera')))
+    # productTypes are compared whatever their order
+    response_cache.set_support(_network('N_2', ('sensor', 'camera')), False)
+    assert response_cache.known_unsupported(_network('N_2', ('camera', 'sensor')))
+    # refresh runs probe every network
+    assert not cache.ResponseCache(tmp_path / 'cache.sqlite', refresh=True).known_unsupported(_network('N_1'))
+    response_cache.close()
+
+
+def test_product_types_seen_only_on_unsupported_networks_become_a_rule(tmp_path, clock):
+    path = tmp_path / 'cache.sqlite'
+    response_cache = cache.ResponseCache(path)
+    for index in range(cache.RULE_MIN_NETWORKS - 1):
+        response_cache.set_support(_network(f'N_{index}'), False)
+        response_cache.set_support(_network(f'S_{index}', ('sensor',)), False)
+    assert not response_cache.known_unsupported(_network('N_new'))
+    response_cache.close()
+
+    # rules are computed once per run, the next run sees the RULE_MIN_NETWORKS-th network
+    response_cache = cache.ResponseCache(path)
+    response_cache.set_support(_network('N_last'), False)
+    response_cache.set_support(_network('S_last', ('sensor',)), False)
+    # one supported network of the combination is enough to never skip it
+    response_cache.set_support(_network('S_supported', ('sensor',)), True)
+    response_cache.close()
+
+    response_cache = cache.ResponseCache(path)
+    assert response_cache.known_unsupported(_network('N_new'))
+    assert not response_cache.known_unsupported(_network('S_new', ('sensor',)))
+    # a network seen before is judged by its own entry, not the rule
+    response_cache.set_support(_network('N_probed'), True)
+    assert not response_cache.known_unsupported(_network('N_probed'))
+    response_cache.close()
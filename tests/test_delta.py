@@ -0,0 +1,77 @@
+import gzip
+import json
+import time
+
+from merakisnmp import delta
+
+
+def _record(network_id, community='****', org_id='1'):
+    return {
+        'networkName': network_id, 'networkId': network_id, 'organizationName': 'org', 'organizationId': org_id,
+        'snmpVersion': 'v1/v2c', 'snmpAccess': 'community', 'snmpCommunitystring': community, 'snmpUsers': [],
+    }
+
+
+def test_fresh_networks_are_reused_and_stale_ones_are_not():
+    now = time.time()
+    previous = {'N_1': _record('N_1'), 'N_2': _record('N_2')}
+    delta_run = delta.DeltaRun(previous, {'N_1': now, 'N_2': now - 25 * 3600}, stale_hours=24)
+
+    assert delta_run.reuse({'networkId': 'N_1'}) == [previous['N_1']]
+    assert delta_run.reuse({'networkId': 'N_2'}) is None
+    assert delta_run.reuse({'networkId': 'N_3'}) is None
+    assert delta_run.reused == 1
+    # a reused network keeps its original fetched time
+    assert delta_run.fetched_at == {'N_1': now}
+
+
+def test_changes_are_reported(tmp_path):
+    previous = {'N_1': _record('N_1'), 'N_2': _record('N_2'), 'N_3': _record('N_3')}
+    delta_run = delta.DeltaRun(previous, {})
+    delta_run.listed({'id': '1'}, [{'networkId': 'N_1'}, {'networkId': 'N_2'}, {'networkId': 'N_4'}])
+    delta_run.fetched({'networkId': 'N_1'}, [_record('N_1')])
+    delta_run.fetched({'networkId': 'N_2'}, [{**_record('N_2'), 'snmpAccess': None}])
+    delta_run.fetched({'networkId': 'N_4'}, [_record('N_4')])
+
+    assert [record['networkId'] for record in delta_run.added] == ['N_4']
+    assert delta_run.modified[0]['changes'] == {'snmpAccess': {'before': 'community', 'after': None}}
+    assert [record['networkId'] for record in delta_run.removed()] == ['N_3']
+
+    delta_run.write('now', tmp_path)
+    assert set(json.loads((tmp_path / 'delta_state_now.json').read_text())) == {'N_1', 'N_2', 'N_4'}
+
+
+def test_inferred_records_get_no_fetched_time_and_are_never_fresh():
+    delta_run = delta.DeltaRun({}, {})
+    delta_run.fetched({'networkId': 'N_1'}, [{**_record('N_1'), 'inferredFromTemplate': 'L_1'}])
+    assert delta_run.fetched_at == {}
+    assert len(delta_run.added) == 1
+
+    previous = {'N_1': {**_record('N_1'), 'inferredFromTemplate': 'L_1'}}
+    assert not delta.DeltaRun(previous, {'N_1': time.time()}).fresh({'networkId': 'N_1'})
+
+
+def test_load_previous_reads_the_newest_completed_run(tmp_path):
+    (tmp_path / 'snmp_settings_2024-01-01 00:00:00.000001.json').write_text(json.dumps([_record('N_old')]))
+    (tmp_path / 'delta_state_2024-01-01 00:00:00.000001.json').write_text(json.dumps({'N_old': 1.0}))
+    # the newest results have no delta state (an interrupted run) so they are passed over
+    (tmp_path / 'snmp_settings_2024-01-03 00:00:00.000001.json').write_text(json.dumps([_record('N_cut')]))
+    with gzip.open(tmp_path / 'snmp_settings_2024-01-02 00:00:00.000001.ndjson.gz', 'wt') as outfile:
+        outfile.write(json.dumps(_record('N_gz')) + '\n')
+    (tmp_path / 'delta_state_2024-01-02 00:00:00.000001.json').write_text(json.dumps({'N_gz': 2.0}))
+
+    records, fetched = delta.load_previous(tmp_path)
+    assert list(records) == ['N_gz']
+    assert fetched == {'N_gz': 2.0}
+
+
+def test_load_previous_reads_a_partitioned_run(tmp_path):
+    run_dir = tmp_path / 'snmp_settings_2024-01-01 00:00:00.000001'
+    run_dir.mkdir()
+    (run_dir / '1.json').write_text(json.dumps([_record('N_1')]))
+    (run_dir / '2.json').write_text(json.dumps([_record('N_2', org_id='2')]))
+    (tmp_path / 'snmp_settings_2024-01-02 00:00:00.000001.tmp').mkdir()
+
+    records, fetched = delta.load_previous(tmp_path)
+    assert set(records) == {'N_1', 'N_2'}
+    assert set(fetched) == {'N_1', 'N_2'}
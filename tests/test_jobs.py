@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from merakisnmp import jobs
+from merakisnmp import orgfilter
+
+
+def _spec(tmp_path, spec):
+    path = tmp_path / 'jobs.json'
+    path.write_text(json.dumps(spec))
+    return path
+
+
+def test_jobs_get_their_output_dirs_and_orgfiles_under_the_spec_dir(tmp_path):
+    (tmp_path / 'retail.csv').write_text('orgid\n1\n')
+    path = _spec(tmp_path, {'output_format': 'ndjson', 'jobs': [
+        {'name': 'retail', 'orgfile': 'retail.csv', 'output_dir': 'reports/retail'},
+        {'name': 'everything', 'output_format': 'json'},
+    ]})
+    retail, everything = jobs.load_jobs(path, 'job_results')
+
+    assert retail.orgfile == str(tmp_path / 'retail.csv')
+    assert retail.output_dir == str(tmp_path / 'reports' / 'retail')
+    assert retail.output_format == 'ndjson'
+    assert everything.output_dir == 'job_results/everything'
+    assert everything.output_format == 'json'
+
+
+@pytest.mark.parametrize('spec, message', [
+    ([{'name': 'acme', 'begin': 'acme'}], 'unknown keys: begin'),
+    ([{'begins': 'acme'}], 'must be an object with a name'),
+    ([{'name': 'acme'}, {'name': 'acme'}], 'used more than once'),
+    ([{'name': 'acme', 'output_format': 'xml'}], 'output_format must be one of'),
+    ([{'name': 'acme', 'orgfile': 'missing.csv'}], 'missing.csv does not exist'),
+    ([], 'non-empty list of jobs'),
+])
+def test_invalid_job_specs_are_rejected(tmp_path, spec, message):
+    with pytest.raises(jobs.JobSpecError, match=message):
+        jobs.load_jobs(_spec(tmp_path, spec), 'job_results')
+
+
+def test_an_unreadable_spec_is_rejected(tmp_path):
+    (tmp_path / 'jobs.json').write_text('{"jobs": [')
+    with pytest.raises(jobs.JobSpecError, match='could not read job spec'):
+        jobs.load_jobs(tmp_path / 'jobs.json', 'job_results')
+
+
+def test_the_router_fetches_each_org_once_and_networks_where_a_job_wants_them():
+    organizations = [{'id': '1', 'name': 'acme east'}, {'id': '2', 'name': 'acme west'}, {'id': '3', 'name': 'retail'}]
+    index = orgfilter.OrgIndex(organizations)
+    acme = jobs.Job('acme', begins='acme')
+    west = jobs.Job('west', orgids=['2'], networks=True)
+    router = jobs.JobRouter([acme, west], {job.name: job.select(index) for job in [acme, west]})
+
+    assert [organization['id'] for organization in router.organizations] == ['1', '2']
+    assert router.network_org_ids == {'2'}
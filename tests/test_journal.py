@@ -0,0 +1,95 @@
+from merakisnmp import journal
+
+
+ORGS = [{'id': '1'}, {'id': 2}]
+
+
+def test_resume_replays_completed_calls(tmp_path):
+    path = tmp_path / 'run_journal.ndjson'
+    run_journal = journal.RunJournal(path)
+    run_journal.record(journal.ORG_SNMP, '1', [{'organizationId': '1'}])
+    run_journal.record(journal.NETWORK_SNMP, 'N_1', [{'networkId': 'N_1'}])
+    # calls that failed or returned nothing stay pending
+    run_journal.record(journal.NETWORK_SNMP, 'N_2', {})
+    run_journal.close()
+
+    resumed = journal.RunJournal(path, resume=True)
+    assert resumed.completed() == 2
+    assert resumed.get(journal.ORG_SNMP, '1') == [{'organizationId': '1'}]
+    assert resumed.get(journal.NETWORK_SNMP, 'N_1') == [{'networkId': 'N_1'}]
+    assert resumed.get(journal.NETWORK_SNMP, 'N_2') is None
+    resumed.close()
+
+
+def test_a_line_cut_short_is_skipped(tmp_path):
+    path = tmp_path / 'run_journal.ndjson'
+    run_journal = journal.RunJournal(path)
+    run_journal.record(journal.NETWORK_SNMP, 'N_1', [{'networkId': 'N_1'}])
+    run_journal.close()
+    with open(path, 'a') as outfile:
+        outfile.write('{"kind": "network", "id": "N_2", "da')
+
+    resumed = journal.RunJournal(path, resume=True)
+    assert resumed.completed() == 1
+    resumed.close()
+
+
+def test_without_resume_the_journal_starts_over(tmp_path):
+    path = tmp_path / 'run_journal.ndjson'
+    run_journal = journal.RunJournal(path)
+    run_journal.record(journal.NETWORK_SNMP, 'N_1', [{'networkId': 'N_1'}])
+    run_journal.close()
+
+    fresh = journal.RunJournal(path)
+    assert fresh.completed() == 0
+    fresh.close()
+    assert journal.RunJournal(path, resume=True).completed() == 0
+
+
+def test_a_journal_is_only_resumed_by_the_same_run(tmp_path):
+    path = tmp_path / 'run_journal.ndjson'
+    header = journal.run_header(ORGS, {2, '1'}, template_samples=3)
+    run_journal = journal.RunJournal(path, header=header)
+    run_journal.record(journal.NETWORK_SNMP, 'N_1', [{'networkId': 'N_1'}])
+    run_journal.close()
+
+    # the same selection in another order
+    same = journal.RunJournal(path, resume=True, header=journal.run_header(ORGS[::-1], {'1', '2'}, template_samples=3))
+    assert not same.discarded
+    assert same.completed() == 1
+    same.close()
+
+    for other in [
+        journal.run_header(ORGS[:1], {'1', '2'}, template_samples=3),
+        journal.run_header(ORGS, True, template_samples=3),
+        journal.run_header(ORGS, {'1', '2'}, template_samples=None),
+    ]:
+        different = journal.RunJournal(path, resume=True, header=other)
+        assert different.discarded
+        assert different.completed() == 0
+        different.close()
+
+    # the discarded journal was replaced by one for the last run
+    replaced = journal.RunJournal(path, resume=True, header=other)
+    assert not replaced.discarded
+    replaced.close()
+
+
+def test_a_journal_without_a_header_is_not_resumed(tmp_path):
+    path = tmp_path / 'run_journal.ndjson'
+    path.write_text('{"kind": "network", "id": "N_1", "data": [{"networkId": "N_1"}]}\n')
+
+    run_journal = journal.RunJournal(path, resume=True, header=journal.run_header(ORGS))
+    assert run_journal.discarded
+    assert run_journal.completed() == 0
+    run_journal.close()
+
+
+def test_a_journal_with_a_corrupt_header_is_not_resumed(tmp_path):
+    path = tmp_path / 'run_journal.ndjson'
+    path.write_text('{"kind": "header", "da\n{"kind": "network", "id": "N_1", "data": [{"networkId": "N_1"}]}\n')
+
+    run_journal = journal.RunJournal(path, resume=True, header=journal.run_header(ORGS))
+    assert run_journal.discarded
+    assert run_journal.completed() == 0
+    run_journal.close()
@@ -0,0 +1,48 @@
+import pytest
+
+from merakisnmp import orgfilter
+
+
+ORGS = [
+    {'id': '101', 'name': 'Acme Retail'},
+    {'id': 102, 'name': 'acme lab'},
+    {'id': '103', 'name': 'Globex Stores'},
+    {'id': '104', 'name': 'ACME Retail West'},
+    {'id': '105', 'name': '2024'},
+    {'id': '106', 'name': 'Initech'},
+]
+
+
+def _ids(**criteria):
+    return [str(organization['id']) for organization in orgfilter.filter_orgs(ORGS, **criteria)]
+
+
+@pytest.mark.parametrize('criteria, expected', [
+    ({}, ['101', '102', '103', '104', '105', '106']),
+    ({'org_ids': ['104', 102, ' 101 ', '999']}, ['101', '102', '104']),
+    ({'org_names': ['acme retail', 'INITECH ']}, ['101', '106']),
+    ({'contains': 'RETAIL'}, ['101', '104']),
+    ({'begins': 'acme'}, ['101', '102', '104']),
+    ({'regex': r'^acme retail( west)?$'}, ['101', '104']),
+    ({'glob': 'acme*'}, ['101', '102', '104']),
+    ({'glob': '?lobex*'}, ['103']),
+    # every criteria must match
+    ({'begins': 'acme', 'contains': 'west'}, ['104']),
+    ({'org_ids': ['101', '103'], 'begins': 'acme'}, ['101']),
+])
+def test_orgs_are_selected_case_insensitively_in_get_organizations_order(criteria, expected):
+    assert _ids(**criteria) == expected
+
+
+def test_exclusions_win_over_every_other_criteria():
+    assert _ids(begins='acme', exclude=['*lab']) == ['101', '104']
+    assert _ids(org_ids=['101', '102'], exclude=['ACME RETAIL']) == ['102']
+    assert _ids(org_names=['globex stores'], exclude=['103']) == []
+
+
+def test_all_digit_exclusions_are_org_ids():
+    # ' 101' drops the org with that ID, the org named 2024 is only dropped by its ID
+    assert _ids(exclude=[' 101', '2024']) == ['102', '103', '104', '105', '106']
+    assert _ids(exclude=['102', '105']) == ['101', '103', '104', '106']
+    # a pattern with anything but digits is a name pattern
+    assert _ids(exclude=['202?']) == ['101', '102', '103', '104', '106']
@@ -0,0 +1,42 @@
+import sys
+import subprocess
+
+from merakisnmp import limits
+from merakisnmp import plan
+
+
+def _networks(count, template=None):
+    return [
+        {'networkId': f'N_{template}_{index}', 'productTypes': ['switch'], 'isBoundToConfigTemplate': bool(template),
+         'configTemplateId': template}
+        for index in range(count)
+    ]
+
+
+def test_plan_does_not_import_the_sdk():
+    imported = subprocess.run(
+        [sys.executable, '-c', 'import sys, merakisnmp.plan; print("meraki" in sys.modules)'],
+        capture_output=True, text=True, check=True)
+    assert imported.stdout.strip() == 'False'
+
+
+def test_plan_uses_the_scheduler_limits():
+    run_plan = plan.RunPlan()
+    run_plan.add({'id': '1', 'name': 'Org 1'}, get_networks=True, networks=_networks(40))
+
+    org = run_plan.orgs[0]
+    assert org['requests'] == {'getOrganizationSnmp': 1, 'getOrganizationNetworks': 1, 'getNetworkSnmp': 40}
+    assert org['rateLimitedSeconds'] == (42 - limits.ORG_BURST) / limits.ORG_RATE
+    assert run_plan.summary()['concurrency'] == limits.MAX_CONCURRENCY
+
+
+def test_plan_counts_template_samples_and_at_most_the_rest_as_collapsed():
+    run_plan = plan.RunPlan(template_samples=3)
+    run_plan.add({'id': '1'}, get_networks={'1'}, networks=_networks(10, 'L_1') + _networks(2))
+    run_plan.add({'id': '2'}, get_networks={'1'}, networks=_networks(5))
+
+    summary = run_plan.summary()
+    assert summary['requests']['getNetworkSnmp'] == 3 + 2
+    assert summary['collapsedByTemplate'] == 7
+    # org 2's networks are not selected (run-jobs)
+    assert run_plan.orgs[1]['networks'] is None
@@ -0,0 +1,35 @@
+import json
+import pickle
+
+from merakisnmp import records
+
+
+def _org_record(**extra):
+    return records.OrgSnmpRecord(
+        'Org 1', '1', 'url', True, '*****', False, None, None, None, 'snmp.meraki.com', 16100, extra=extra)
+
+
+def test_org_snmp_keeps_fields_it_does_not_name():
+    record = _org_record(v2CommunityString='secret', v2cEnabled=False, newSetting='value')
+
+    assert record['newSetting'] == 'value'
+    assert record.extra == {'newSetting': 'value'}
+    # named fields keep the record's (redacted) values and come first
+    assert record['v2CommunityString'] == '*****'
+    assert record['v2cEnabled'] is True
+    assert list(record)[-1] == 'newSetting'
+    assert len(record) == len(records.OrgSnmpRecord._fields) + 1
+    assert json.loads(json.dumps(record, default=dict)) == dict(record)
+    assert dict(pickle.loads(pickle.dumps(record))) == dict(record)
+
+
+def test_org_snmp_without_extra_fields():
+    record = _org_record()
+    assert '_extra' not in record
+    assert list(record) == list(records.OrgSnmpRecord._fields)
+
+
+def test_a_record_subclass_adds_its_fields_after_its_parents():
+    record = records.InferredNetworkSnmpRecord(*range(10), 'L_1')
+    assert list(record)[:-1] == list(records.NetworkSnmpRecord._fields)
+    assert record['inferredFromTemplate'] == 'L_1'
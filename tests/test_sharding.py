@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+from benchmarks import mock_dashboard
+from merakisnmp import cache
+from merakisnmp import sharding
+
+
+@pytest.fixture
+def dashboard():
+    estate = mock_dashboard.Estate(orgs=4, networks=40, unsupported_every=10)
+    server = mock_dashboard.MockDashboardServer(('127.0.0.1', 0), estate, latency=0.001, jitter=0, org_rate=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield estate, server.base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_two_workers_with_the_cache_open_in_the_parent(dashboard, tmp_path):
+    estate, base_url = dashboard
+    cache_path = str(tmp_path / 'responses.sqlite3')
+
+    # the parent holds an uncommitted write, as the CLI does after listing orgs
+    parent_cache = cache.ResponseCache(cache_path)
+    parent_cache.set('getOrganizations', 'scope', estate.orgs)
+
+    with parent_cache.released():
+        org_records, network_records = sharding.sharded_get_snmp(
+            '0' * 40, estate.orgs, 2, get_networks=True, base_url=base_url, cache_path=cache_path, request_timeout=10)
+
+    assert len(org_records) == len(estate.orgs)
+    assert len(network_records) == estate.total_networks() - len(estate.unsupported)
+    # the workers' responses are in the file and the parent can use it again
+    assert parent_cache.get('getOrganizations', 'scope') == estate.orgs
+    assert all(parent_cache.get('getOrganizationNetworks', org['id']) for org in estate.orgs)
+    parent_cache.close()
@@ -0,0 +1,69 @@
+from merakisnmp import store
+
+
+def _network(network_id, version, org_id='1', org_name='Acme'):
+    return {
+        'networkName': network_id.lower(), 'networkId': network_id, 'organizationId': org_id,
+        'organizationName': org_name, 'snmpVersion': version, 'snmpAccess': 'community' if version else None,
+    }
+
+
+def _store_runs(path):
+    ''' two runs, N_1 is moved from v1/v2c to v3 between them '''
+    with store.ResultStore(path) as result_store:
+        assert result_store.start_run('2026-01-01') == 1
+        result_store.write_org({'organizationId': '1', 'organizationName': 'Acme', 'v2cEnabled': True, 'v3Enabled': False})
+        result_store.write_network(_network('N_1', 'v1/v2c'))
+        result_store.write_network(_network('N_2', None))
+        result_store.write_network(_network('N_3', 'v1/v2c', org_id='2', org_name='Globex'))
+
+    with store.ResultStore(path) as result_store:
+        assert result_store.start_run('2026-01-02') == 2
+        result_store.write_network(_network('N_1', 'v3'))
+        result_store.write_network(_network('N_2', None))
+
+
+def _ids(records):
+    return [(record['runId'], record.get('networkId', record.get('organizationId'))) for record in records]
+
+
+def test_runs_are_numbered_and_finished_on_close(tmp_path):
+    path = tmp_path / 'results.sqlite'
+    _store_runs(path)
+
+    with store.ResultStore(path) as result_store:
+        runs = result_store.runs()
+    assert [(run_id, started) for run_id, started, _ in runs] == [(1, '2026-01-01'), (2, '2026-01-02')]
+    assert all(finished for _, _, finished in runs)
+
+
+def test_query_defaults_to_the_latest_run_of_each_kind(tmp_path):
+    path = tmp_path / 'results.sqlite'
+    _store_runs(path)
+
+    with store.ResultStore(path) as result_store:
+        assert _ids(result_store.query()) == [(2, 'N_1'), (2, 'N_2')]
+        # the last run without org records does not hide the one before it
+        assert _ids(result_store.query('org')) == [(1, '1')]
+        assert _ids(result_store.query(run_id='1')) == [(1, 'N_1'), (1, 'N_2'), (1, 'N_3')]
+        assert _ids(result_store.query(run_id=3)) == []
+        records = list(result_store.query(run_id='all'))
+    assert _ids(records) == [(1, 'N_1'), (1, 'N_2'), (1, 'N_3'), (2, 'N_1'), (2, 'N_2')]
+    # the full record is returned with its run
+    assert records[0] == {'runId': 1, **_network('N_1', 'v1/v2c')}
+
+
+def test_query_filters_by_version_network_and_org(tmp_path):
+    path = tmp_path / 'results.sqlite'
+    _store_runs(path)
+
+    with store.ResultStore(path) as result_store:
+        assert _ids(result_store.query(run_id='all', snmp_version='v1/v2c')) == [(1, 'N_1'), (1, 'N_3')]
+        assert _ids(result_store.query(run_id='all', snmp_version='none')) == [(1, 'N_2'), (2, 'N_2')]
+        # the history of one network
+        assert _ids(result_store.query(run_id='all', network_id='N_1')) == [(1, 'N_1'), (2, 'N_1')]
+        assert _ids(result_store.query(run_id='all', org_id=2)) == [(1, 'N_3')]
+        assert _ids(result_store.query(run_id='all', org_name='GLOBEX')) == [(1, 'N_3')]
+        assert _ids(result_store.query(run_id='all', org_id='1', snmp_version='v3')) == [(2, 'N_1')]
+        # network criteria do not apply to org records
+        assert _ids(result_store.query('org', run_id='all', network_id='N_1', snmp_version='v3')) == [(1, '1')]
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+
+from benchmarks import mock_dashboard
+from merakisnmp import delta
+from merakisnmp import journal
+from merakisnmp import templates
+from merakisnmp.async_code import async_pipeline
+
+
+def _network(index, template='L_1', product_types=('switch',)):
+    return {
+        'networkId': f'N_{index}', 'isBoundToConfigTemplate': template is not None, 'configTemplateId': template,
+        'productTypes': list(product_types),
+    }
+
+
+def test_group_networks_groups_by_template_and_product_types():
+    networks = [_network(index) for index in range(5)]
+    networks += [_network(5, product_types=('wireless',)), _network(6, template=None), _network(7, template='L_2')]
+    queued, groups = templates.group_networks(networks, samples=3)
+
+    assert [[network['networkId'] for network in group] for group in groups] == [['N_0', 'N_1', 'N_2', 'N_3', 'N_4']]
+    # groups no larger than the sample count and unbound networks are queried as usual, in their order
+    assert [network['networkId'] for network in queued] == ['N_5', 'N_6', 'N_7']
+
+
+def test_pick_samples_spreads_from_first_to_last():
+    group = [_network(index) for index in range(10)]
+    samples, rest = templates.pick_samples(group, 3)
+    assert [network['networkId'] for network in samples] == ['N_0', 'N_4', 'N_9']
+    assert len(rest) == 7
+    assert [network['networkId'] for network in templates.pick_samples(group, 1)[0]] == ['N_0']
+
+
+def test_template_collapse_only_collapses_matching_queried_samples():
+    collapse = templates.TemplateCollapse(samples=2)
+    config = {'access': 'community', 'communityString': 'secret', 'users': []}
+    samples, rest = collapse.sample([_network(index) for index in range(5)])
+
+    assert collapse.collapse([config, dict(config)], rest)
+    assert not collapse.collapse([config, {**config, 'communityString': 'other'}], rest)
+    # a failed sample ({}) or one replayed from the journal (None) has nothing to compare
+    assert not collapse.collapse([config, {}], rest)
+    assert not collapse.collapse([config, None], rest)
+    assert collapse.counts == {'groups': 1, 'collapsed_groups': 1, 'sampled': 2, 'collapsed': 3, 'queried': 9}
+
+    collapse.merge({'groups': 1, 'collapsed_groups': 0, 'sampled': 2, 'collapsed': 0, 'queried': 3})
+    assert collapse.counts['groups'] == 2
+    assert collapse.counts['queried'] == 12
+
+
+def _serve(estate):
+    server = mock_dashboard.MockDashboardServer(('127.0.0.1', 0), estate, latency=0.001, jitter=0, org_rate=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def dashboard():
+    # 20 unbound networks and two config templates of 10 bound networks each
+    estate = mock_dashboard.Estate(orgs=1, networks=40, unsupported_every=0, bound_every=2, templates=2)
+    server = _serve(estate)
+    yield estate, server
+    server.shutdown()
+    server.server_close()
+
+
+def _run(server, estate, **options):
+    return async_pipeline.async_get_snmp(
+        '0' * 40, estate.orgs, get_networks=True, base_url=server.base_url, progress_bar=False, **options)
+
+
+def _snmp_calls(server):
+    # one org snmp call and one network listing per org
+    return server.stats['requests'] - 2 * len(server.estate.orgs)
+
+
+def test_matching_samples_collapse_their_group(dashboard):
+    estate, server = dashboard
+    collapse = templates.TemplateCollapse(samples=3)
+    _, network_records = _run(server, estate, templates=collapse)
+
+    assert len(network_records) == 40
+    assert _snmp_calls(server) == 20 + 2 * 3
+    inferred = [record for record in network_records if 'inferredFromTemplate' in record]
+    assert len(inferred) == 2 * 7
+    assert all(record['inferredFromTemplate'] == estate.communities[record['networkId']][len('bench '):] for record in inferred)
+    assert collapse.counts == {'groups': 2, 'collapsed_groups': 2, 'sampled': 6, 'collapsed': 14, 'queried': 0}
+
+
+def test_a_network_overriding_its_template_stops_the_collapse():
+    # every bound network has its own settings, so the samples disagree
+    estate = mock_dashboard.Estate(orgs=1, networks=40, unsupported_every=0, bound_every=2, templates=2, overridden_every=1)
+    server = _serve(estate)
+    try:
+        _, network_records = _run(server, estate, templates=templates.TemplateCollapse(samples=3))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert _snmp_calls(server) == 40
+    assert not any('inferredFromTemplate' in record for record in network_records)
+
+
+def test_collapsed_networks_are_journalled_and_not_marked_fetched(dashboard, tmp_path):
+    estate, server = dashboard
+    run_journal = journal.RunJournal(str(tmp_path / 'journal.ndjson'))
+    delta_run = delta.DeltaRun({}, {})
+    _, network_records = _run(server, estate, templates=templates.TemplateCollapse(), journal=run_journal, delta=delta_run)
+    run_journal.close()
+
+    inferred = {record['networkId'] for record in network_records if 'inferredFromTemplate' in record}
+    assert inferred
+    assert inferred.isdisjoint(delta_run.fetched_at)
+    assert len(delta_run.fetched_at) == 40 - len(inferred)
+
+    resumed = journal.RunJournal(str(tmp_path / 'journal.ndjson'), resume=True)
+    assert all(resumed.get('network', network_id)[0]['inferredFromTemplate'] for network_id in inferred)
+    resumed.close()
+
+
+def test_a_fresh_group_is_reused_by_delta_without_sampling(dashboard):
+    estate, server = dashboard
+    _, previous_networks = _run(server, estate)
+    previous = {record['networkId']: record for record in previous_networks}
+    fetched = {network_id: 4102444800 for network_id in previous}
+
+    start = server.stats['requests']
+    delta_run = delta.DeltaRun(previous, fetched)
+    _, network_records = _run(server, estate, templates=templates.TemplateCollapse(), delta=delta_run)
+
+    # every network is fresh so only the org calls are made and nothing is sampled or inferred
+    assert server.stats['requests'] - start == 2
+    assert delta_run.reused == 40
+    assert not any('inferredFromTemplate' in record for record in network_records)
+
+
+def test_a_group_with_inferred_networks_is_sampled_again_by_delta(dashboard):
+    estate, server = dashboard
+    first = delta.DeltaRun({}, {})
+    _, previous_networks = _run(server, estate, templates=templates.TemplateCollapse(), delta=first)
+    previous = {record['networkId']: record for record in previous_networks}
+
+    start = server.stats['requests']
+    collapse = templates.TemplateCollapse()
+    delta_run = delta.DeltaRun(previous, first.fetched_at)
+    _, network_records = _run(server, estate, templates=collapse, delta=delta_run)
+
+    # the unbound networks are reused, the samples are queried again and the rest is inferred again
+    assert server.stats['requests'] - start == 2 + 2 * 3
+    assert delta_run.reused == 20
+    assert collapse.counts['collapsed'] == 14
+    assert len(network_records) == 40
@@ -0,0 +1,66 @@
+import csv
+import gzip
+import json
+
+from merakisnmp import records
+from merakisnmp import writers
+
+
+def _record(org_id, network_id):
+    return records.NetworkSnmpRecord(
+        network_id, network_id, 'url', f'Org {org_id}', org_id, 'url', 'v1/v2c', 'community', '****', [])
+
+
+def test_partitioned_writer_gzips_one_set_of_files_per_org(tmp_path, monkeypatch):
+    # few open partitions so spool files are reopened and get another gzip member
+    monkeypatch.setattr(writers, 'MAX_OPEN_PARTITIONS', 1)
+    with writers.PartitionedWriter(tmp_path, 'now', 'json', compress=True) as writer:
+        for index in range(3):
+            writer.write(_record('1', f'N_1_{index}'))
+            writer.write(_record('2', f'N_2_{index}'))
+        writer.write({**_record('2', 'N_2_3'), 'inferredFromTemplate': 'L_2'})
+
+    run_dir = tmp_path / 'snmp_settings_now'
+    assert sorted(path.name for path in run_dir.iterdir()) == ['1.csv.gz', '1.json.gz', '2.csv.gz', '2.json.gz']
+    assert not (tmp_path / 'snmp_settings_now.tmp').exists()
+
+    with gzip.open(run_dir / '1.json.gz', 'rt') as infile:
+        assert [record['networkId'] for record in json.load(infile)] == ['N_1_0', 'N_1_1', 'N_1_2']
+    with gzip.open(run_dir / '2.csv.gz', 'rt', newline='') as infile:
+        rows = list(csv.DictReader(infile))
+    assert [row['networkId'] for row in rows] == ['N_2_0', 'N_2_1', 'N_2_2', 'N_2_3']
+    # the header is the union of the org's record keys
+    assert rows[0]['inferredFromTemplate'] == '' and rows[3]['inferredFromTemplate'] == 'L_2'
+
+
+def test_partitioned_writer_ndjson(tmp_path):
+    with writers.PartitionedWriter(tmp_path, 'now', 'ndjson', compress=True) as writer:
+        writer.write(_record('1', 'N_1'))
+
+    with gzip.open(tmp_path / 'snmp_settings_now' / '1.ndjson.gz', 'rt') as infile:
+        assert [json.loads(line)['networkId'] for line in infile] == ['N_1']
+
+
+def test_result_writer_files_appear_when_closed(tmp_path):
+    writer = writers.ResultWriter(tmp_path, 'now', 'json', compress=True)
+    writer.write(_record('1', 'N_1'))
+    assert not (tmp_path / 'snmp_settings_now.json.gz').exists()
+    writer.close()
+
+    with gzip.open(tmp_path / 'snmp_settings_now.json.gz', 'rt') as infile:
+        assert json.load(infile)[0]['networkId'] == 'N_1'
+
+
+def test_an_interrupted_run_leaves_valid_partial_results(tmp_path):
+    try:
+        with writers.ResultWriter(tmp_path, 'now', 'json') as writer:
+            writer.write(_record('1', 'N_1'))
+            raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        pass
+
+    assert [record['networkId'] for record in json.loads((tmp_path / 'snmp_settings_now.json').read_text())] == ['N_1']
+    with open(tmp_path / 'snmp_settings_now.csv', newline='') as infile:
+        assert [row['networkId'] for row in csv.DictReader(infile)] == ['N_1']
+    # no temp or spool files are left behind
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['snmp_settings_now.csv', 'snmp_settings_now.json']